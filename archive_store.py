@@ -0,0 +1,166 @@
+"""
+Archive Store: Compressed, deduplicated storage for sent newsletters.
+Every HTML/EPUB file is stored once, compressed, under the hash of its content,
+and a single index file lists every newsletter. The dashboard only has to read
+the index to show the archive, no matter how many newsletters have piled up.
+"""
+
+import os
+import json
+import gzip
+import glob
+import hashlib
+from datetime import datetime
+from run_lock import file_lock
+
+# Where the archive lives
+ARCHIVE_DIR = os.path.join(os.path.dirname(__file__), "newsletters")
+BLOBS_DIR = os.path.join(ARCHIVE_DIR, "blobs")
+INDEX_FILE = os.path.join(ARCHIVE_DIR, "index.json")
+INDEX_LOCK_FILE = os.path.join(ARCHIVE_DIR, ".index.lock")
+
+INDEX_VERSION = 1
+
+
+def _blob_path(digest):
+    # Fan out into subfolders so no single folder gets huge
+    return os.path.join(BLOBS_DIR, digest[:2], f"{digest}.gz")
+
+
+def _write_atomically(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def put_blob(data):
+    """
+    Store some bytes (compressed) and return their content hash.
+    Storing the same bytes twice costs nothing.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+
+    digest = hashlib.sha256(data).hexdigest()
+    path = _blob_path(digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_atomically(path, gzip.compress(data, compresslevel=9, mtime=0))
+    return digest
+
+
+def read_blob(digest):
+    """
+    Read back the bytes stored under a content hash.
+    """
+    with open(_blob_path(digest), "rb") as f:
+        return gzip.decompress(f.read())
+
+
+def _read_index():
+    if os.path.exists(INDEX_FILE):
+        with open(INDEX_FILE, "r") as f:
+            return json.load(f)
+    return {"version": INDEX_VERSION, "newsletters": []}
+
+
+def _legacy_files():
+    return sorted(glob.glob(os.path.join(ARCHIVE_DIR, "newsletter_*.json")))
+
+
+def load_index():
+    """
+    Load the archive index (importing any old-style archive files first).
+    """
+    if not _legacy_files():
+        return _read_index()
+
+    with file_lock(INDEX_LOCK_FILE):
+        return migrate_legacy_archive(_read_index())
+
+
+def save_index(index):
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    _write_atomically(INDEX_FILE, json.dumps(index, indent=2).encode("utf-8"))
+
+
+def add_newsletter(html_content, epub_bytes, articles, sent_at=None):
+    """
+    Archive a sent newsletter. Returns its index entry.
+    """
+    sent_at = sent_at or datetime.now()
+    timestamp = sent_at.strftime("%Y%m%d_%H%M%S")
+    html_blob = put_blob(html_content)
+    entry = {
+        "date": sent_at.strftime("%B %d, %Y"),
+        "timestamp": timestamp,
+        "article_count": len(articles),
+        "channels": [a["channel"] for a in articles],
+        "titles": [a["title"] for a in articles],
+        "html_blob": html_blob,
+        "epub_blob": put_blob(epub_bytes) if epub_bytes else None,
+    }
+    # The parts of a split digest are archived in the same second,
+    # so the timestamp alone doesn't tell them apart
+    entry["id"] = newsletter_id(entry)
+    entry["html_file"] = f"newsletter_{entry['id']}.html"
+    entry["epub_file"] = f"newsletter_{entry['id']}.epub"
+
+    # Read-modify-write of the index, so no other process may update it meanwhile
+    with file_lock(INDEX_LOCK_FILE):
+        index = migrate_legacy_archive(_read_index())
+        index["newsletters"].append(entry)
+        save_index(index)
+    return entry
+
+
+def newsletter_id(entry):
+    """
+    Unique id of an index entry: its timestamp plus the start of its HTML digest.
+    Works for entries archived before ids were stored.
+    """
+    if entry.get("id"):
+        return entry["id"]
+    digest = entry.get("html_blob") or entry.get("epub_blob") or ""
+    return f"{entry['timestamp']}_{digest[:8]}" if digest else entry["timestamp"]
+
+
+def list_newsletters():
+    """
+    All archived newsletters, newest first (reads only the index).
+    """
+    return sorted(load_index()["newsletters"], key=lambda n: n["timestamp"], reverse=True)
+
+
+def migrate_legacy_archive(index):
+    """
+    One-time import of the old newsletter_*.json/.html/.epub files into the store.
+    Old files are removed once their contents are safely stored.
+    Call with the index lock held.
+    """
+    legacy = _legacy_files()
+
+    for json_path in legacy:
+        with open(json_path, "r") as f:
+            entry = json.load(f)
+
+        imported = [json_path]
+        for kind in ("html", "epub"):
+            path = os.path.join(ARCHIVE_DIR, entry.get(f"{kind}_file", ""))
+            entry[f"{kind}_blob"] = None
+            if os.path.isfile(path):
+                with open(path, "rb") as f:
+                    entry[f"{kind}_blob"] = put_blob(f.read())
+                imported.append(path)
+
+        index["newsletters"].append(entry)
+        save_index(index)
+        for path in imported:
+            os.remove(path)
+
+    if legacy:
+        print(f"  ✓ Moved {len(legacy)} newsletters into the compressed archive")
+    return index
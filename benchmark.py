@@ -0,0 +1,531 @@
+"""
+Benchmark: Measure the whole pipeline offline, without spending any quota.
+Every external service is replaced by a local stand-in with configurable
+latency, error rate and payload size:
+
+- YouTube Data API   an in-process fake client (channels.list, playlistItems.list)
+- Shorts check       a local HTTP server answering /shorts/<id>
+- Supadata           the same local HTTP server answering /v1/transcript
+- Gemini             an in-process fake client (models.generate_content)
+- SMTP               a local SMTP server that accepts and discards mail
+
+Each scenario runs main.run in a fresh copy of the code (so no real tracker,
+caches or outbox are touched) in its own process (so peak memory is per run),
+at 10, 100 and 1,000 channels by default:
+
+    python benchmark.py
+    python benchmark.py --scales 10 100 --modes step stream --latency-scale 2
+
+Results (throughput, wall time, peak memory and a per-stage / per-call
+latency breakdown) are printed and saved as JSON to logs/benchmarks/.
+
+Startup time - what every run, and the dashboard's first click, pays before
+doing any work - is measured separately:
+
+    python benchmark.py --startup
+"""
+
+import os
+import sys
+import json
+import time
+import glob
+import random
+import shutil
+import argparse
+import tempfile
+import platform
+import resource
+import threading
+import subprocess
+import socketserver
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "benchmarks")
+
+SCALES = [10, 100, 1000]
+MODES = ["step"]
+
+# Fresh interpreters to time for --startup, and the libraries main.py should
+# only import once a run actually needs them
+STARTUP_RUNS = 5
+HEAVY_MODULES = ["googleapiclient", "google.genai", "ebooklib", "markdown", "requests"]
+
+# Seconds per call, error rates (0-1) and payload sizes of the stand-ins
+DEFAULT_SERVICES = {
+    "youtube_latency": 0.005,
+    "youtube_error_rate": 0.01,
+    "shorts_latency": 0.002,
+    "shorts_rate": 0.2,
+    "supadata_latency": 0.02,
+    "supadata_error_rate": 0.02,
+    "transcript_words": 6000,
+    "crosspost_rate": 0.05,
+    "gemini_latency": 0.05,
+    "gemini_error_rate": 0.02,
+    "article_words": 1200,
+    "smtp_latency": 0.005,
+    "smtp_error_rate": 0.0,
+}
+
+# Word list the fake transcripts and articles are made of
+_VOCABULARY = [f"word{i}" for i in range(5000)]
+
+
+def _words(seed, count):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(_VOCABULARY) for _ in range(count))
+
+
+def _fails(config, service, key):
+    # Deterministic per call, so every run of a scenario sees the same errors
+    return random.Random(f"{service}:{key}").random() < config[f"{service}_error_rate"]
+
+
+# ----------------------------------------
+# Stand-ins
+# ----------------------------------------
+
+class _FakeRequest:
+    def __init__(self, config, key, respond):
+        self.config, self.key, self.respond = config, key, respond
+
+    def execute(self):
+        time.sleep(self.config["youtube_latency"])
+        if _fails(self.config, "youtube", self.key):
+            raise RuntimeError("HTTP 503 (simulated YouTube error)")
+        return self.respond()
+
+
+class FakeYouTube:
+    """
+    Stands in for build("youtube", "v3", ...).
+    """
+
+    def __init__(self, config):
+        self.config = config
+
+    def channels(self):
+        return self
+
+    def playlistItems(self):
+        return self
+
+    def list(self, part, forHandle=None, playlistId=None, maxResults=None):
+        if forHandle is not None:
+            return _FakeRequest(self.config, f"channel:{forHandle}", lambda: {"items": [{
+                "id": f"UC{forHandle}",
+                "snippet": {"title": f"Channel {forHandle}"},
+                "contentDetails": {"relatedPlaylists": {"uploads": f"UU{forHandle}"}},
+            }]})
+
+        def items():
+            rng = random.Random(playlistId)
+            return {"items": [
+                {"snippet": {
+                    # Some videos are Shorts - their IDs start with "s" (see _ServiceHandler)
+                    "resourceId": {"videoId": f"{'s' if rng.random() < self.config['shorts_rate'] else 'v'}"
+                                              f"{playlistId[2:]}-{n}"},
+                    "title": f"Episode {n} of {playlistId[2:]}",
+                    "description": _words(f"{playlistId}-{n}-desc", 80),
+                }}
+                for n in range(maxResults or 5)
+            ]}
+
+        return _FakeRequest(self.config, f"playlist:{playlistId}", items)
+
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGemini:
+    """
+    Stands in for genai.Client(...).
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.models = self
+
+    def generate_content(self, model, contents):
+        title = contents.split("VIDEO TITLE: ", 1)[-1].split("\n", 1)[0]
+        time.sleep(self.config["gemini_latency"])
+        if _fails(self.config, "gemini", title):
+            raise RuntimeError("503 UNAVAILABLE (simulated Gemini error)")
+        return _FakeResponse(f"# {title}\n\n" + _words(title, self.config["article_words"]))
+
+
+class _ServiceHandler(BaseHTTPRequestHandler):
+    """
+    Local HTTP stand-in for youtube.com/shorts/<id> and Supadata's /v1/transcript.
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        config = self.server.config
+        path = urlparse(self.path).path
+        time.sleep(config["shorts_latency"])
+        if path.startswith("/shorts/"):
+            video_id = path.rsplit("/", 1)[-1]
+            if video_id.startswith("s"):
+                return self._reply(200)
+            return self._reply(303, headers={"Location": f"/watch?v={video_id}"})
+        self._reply(200)
+
+    def do_GET(self):
+        config = self.server.config
+        url = urlparse(self.path)
+        if url.path != "/v1/transcript":
+            return self._reply(404)
+
+        video_id = parse_qs(parse_qs(url.query)["url"][0].split("?", 1)[1])["v"][0]
+        time.sleep(config["supadata_latency"])
+        if _fails(config, "supadata", video_id):
+            return self._reply(500, b'{"error": "simulated Supadata error"}')
+
+        # Cross-posted videos share their transcript with another channel's video
+        rng = random.Random(video_id)
+        seed = f"crosspost-{rng.randrange(10)}" if rng.random() < config["crosspost_rate"] else video_id
+        body = json.dumps({"content": _words(seed, config["transcript_words"])}).encode()
+        self._reply(200, body, {"Content-Type": "application/json"})
+
+
+class _SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """
+    Just enough SMTP to accept a message and throw it away.
+    """
+
+    def _send(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        config, stats = self.server.config, self.server.stats
+        self._send("220 benchmark ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command in (b"EHLO", b"HELO"):
+                self._send("250 benchmark")
+            elif command == b"MAIL":
+                with self.server.lock:
+                    stats["attempts"] += 1
+                    attempt = stats["attempts"]
+                if _fails(config, "smtp", attempt):
+                    self._send("421 simulated temporary failure")
+                else:
+                    self._send("250 OK")
+            elif command == b"DATA":
+                self._send("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                for data_line in self.rfile:
+                    if data_line == b".\r\n":
+                        break
+                    size += len(data_line)
+                time.sleep(config["smtp_latency"])
+                with self.server.lock:
+                    stats["messages"] += 1
+                    stats["bytes"] += size
+                self._send("250 OK: queued")
+            elif command == b"QUIT":
+                self._send("221 Bye")
+                return
+            else:
+                self._send("250 OK")
+
+
+class _SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def _start(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ----------------------------------------
+# One scenario (runs inside a fresh copy of the code)
+# ----------------------------------------
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def run_scenario(config):
+    """
+    Run main.run against the stand-ins and return its measurements.
+    """
+    services = config["services"]
+
+    http = _start(ThreadingHTTPServer(("127.0.0.1", 0), _ServiceHandler))
+    http.config = services
+    smtp = _start(_SMTPSink(("127.0.0.1", 0), _SMTPSinkHandler))
+    smtp.config, smtp.lock = services, threading.Lock()
+    smtp.stats = {"attempts": 0, "messages": 0, "bytes": 0}
+    base_url = f"http://127.0.0.1:{http.server_address[1]}"
+
+    os.environ.update({
+        "YOUTUBE_API_KEY": "benchmark",
+        "SUPADATA_API_KEY": "benchmark",
+        "GEMINI_API_KEY": "benchmark",
+        "GMAIL_ADDRESS": "benchmark@example.com",
+        "GMAIL_APP_PASSWORD": "",
+        "SMTP_HOST": "127.0.0.1",
+        "SMTP_PORT": str(smtp.server_address[1]),
+        "SMTP_USE_SSL": "false",
+    })
+
+    import get_videos
+    import get_transcripts
+    import write_articles
+    import stream_pipeline
+    import tracing
+    import main
+
+    get_videos.CHANNELS[:] = [f"@bench{i:05d}" for i in range(config["channels"])]
+    get_videos.YOUTUBE_SHORTS_URL = base_url + "/shorts/{video_id}"
+    get_videos.build = lambda *args, **kwargs: FakeYouTube(services)
+    get_transcripts.SUPADATA_TRANSCRIPT_URL = base_url + "/v1/transcript"
+    get_transcripts.REQUEST_DELAY = stream_pipeline.TRANSCRIPT_DELAY = config["request_delay"]
+    write_articles._client = FakeGemini(services)
+
+    start = time.perf_counter()
+    articles = main.run(stream=config["mode"] == "stream", budget_minutes=None) or []
+    wall = time.perf_counter() - start
+
+    spans = tracing.finished_spans()
+    return {
+        "channels": config["channels"],
+        "mode": config["mode"],
+        "wall_seconds": wall,
+        "articles": len(articles),
+        "channels_per_second": config["channels"] / wall,
+        "articles_per_second": len(articles) / wall,
+        "peak_rss_mb": _peak_rss_mb(),
+        "emails_sent": smtp.stats["messages"],
+        "bytes_sent": smtp.stats["bytes"],
+        "stages": {
+            name: row for name, row in tracing.latency_summary(spans).items()
+            if name.startswith("stage.")
+        },
+        "calls": {
+            name: row for name, row in tracing.latency_summary(spans).items()
+            if not name.startswith("stage.") and name != "run"
+        },
+    }
+
+
+# ----------------------------------------
+# Driver
+# ----------------------------------------
+
+def _git_version():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _run_in_copy(config, keep=False):
+    """
+    Copy the code into a scratch folder and run one scenario there in a new process.
+    """
+    source = os.path.dirname(os.path.abspath(__file__))
+    workdir = tempfile.mkdtemp(prefix="newsletter-bench-")
+    for path in glob.glob(os.path.join(source, "*.py")):
+        shutil.copy(path, workdir)
+
+    config_path = os.path.join(workdir, "bench_config.json")
+    result_path = os.path.join(workdir, "bench_result.json")
+    with open(config_path, "w") as f:
+        json.dump(config, f)
+
+    with open(os.path.join(workdir, "run.log"), "w") as log:
+        process = subprocess.run(
+            [sys.executable, os.path.join(workdir, "benchmark.py"), "--scenario", config_path, result_path],
+            cwd=workdir, stdout=log, stderr=subprocess.STDOUT,
+            env={k: v for k, v in os.environ.items() if k not in ("TRACKER_BACKEND", "RUN_BUDGET_MINUTES")},
+        )
+
+    if process.returncode != 0 or not os.path.exists(result_path):
+        print(f"  ✗ Scenario failed - see {os.path.join(workdir, 'run.log')}")
+        return None
+
+    with open(result_path, "r") as f:
+        result = json.load(f)
+    if keep:
+        print(f"    (kept {workdir})")
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def run_benchmark(scales=SCALES, modes=MODES, services=None, request_delay=0, keep=False):
+    """
+    Run every scale/mode combination and save the results.
+    """
+    services = {**DEFAULT_SERVICES, **(services or {})}
+    results = []
+
+    for mode in modes:
+        for channels in scales:
+            print(f"▶ {channels} channels, {mode} mode...")
+            result = _run_in_copy({
+                "channels": channels,
+                "mode": mode,
+                "services": services,
+                "request_delay": request_delay,
+            }, keep=keep)
+            if result:
+                results.append(result)
+                print(f"  ✓ {result['wall_seconds']:.1f}s, {result['articles']} articles "
+                      f"({result['articles_per_second']:.2f}/s), peak {result['peak_rss_mb']:.0f} MB")
+
+    report = {
+        "version": _git_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "run_at": datetime.now().isoformat(timespec="seconds"),
+        "services": services,
+        "request_delay": request_delay,
+        "results": results,
+    }
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"bench_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'channels':>8} {'mode':<7} {'wall s':>8} {'articles':>8} {'art/s':>7} {'peak MB':>8}")
+    for r in results:
+        print(f"{r['channels']:>8} {r['mode']:<7} {r['wall_seconds']:>8.1f} {r['articles']:>8} "
+              f"{r['articles_per_second']:>7.2f} {r['peak_rss_mb']:>8.0f}")
+    print(f"\n✓ Results saved to {path}")
+    return report
+
+
+def _time_python(code, env):
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True,
+    )
+    return time.perf_counter() - started, result
+
+
+def measure_startup(runs=STARTUP_RUNS):
+    """
+    Time `import main` in fresh interpreters, list the slowest imports and
+    flag any heavy library that gets imported before it's needed.
+    """
+    env = {**os.environ, "TRACING": "0"}
+    baseline = min(_time_python("pass", env)[0] for _ in range(runs))
+
+    timings = []
+    for _ in range(runs):
+        seconds, result = _time_python("import main", env)
+        if result.returncode != 0:
+            print(f"✗ import main failed:\n{result.stderr.strip().splitlines()[-1]}")
+            return None
+        timings.append(seconds)
+
+    # -X importtime lines: "import time: <self us> | <cumulative us> | <module>"
+    imports = {}
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        imports[parts[2].strip()] = int(parts[1]) / 1e6
+    slowest = sorted(imports.items(), key=lambda item: item[1], reverse=True)[:15]
+    eager = [m for m in HEAVY_MODULES if m in imports]
+
+    timings.sort()
+    report = {
+        "version": _git_version(),
+        "python": platform.python_version(),
+        "run_at": datetime.now().isoformat(timespec="seconds"),
+        "runs": runs,
+        "interpreter_seconds": baseline,
+        "median_seconds": timings[len(timings) // 2],
+        "best_seconds": timings[0],
+        "slowest_imports": [{"module": m, "cumulative_seconds": t} for m, t in slowest],
+        "eager_heavy_modules": eager,
+    }
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"startup_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"import main: median {report['median_seconds'] * 1000:.0f} ms, "
+          f"best {report['best_seconds'] * 1000:.0f} ms "
+          f"(bare interpreter {baseline * 1000:.0f} ms, {runs} runs)\n")
+    print(f"  {'module':<40} {'cumulative ms':>13}")
+    for module, seconds in slowest:
+        print(f"  {module:<40} {seconds * 1000:>13.1f}")
+    if eager:
+        print(f"\n⚠ Imported at startup: {', '.join(eager)}")
+    else:
+        print(f"\n✓ No heavy library is imported at startup")
+    print(f"✓ Results saved to {path}")
+    return report
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--scenario":
+        with open(sys.argv[2], "r") as f:
+            scenario = json.load(f)
+        result = run_scenario(scenario)
+        with open(sys.argv[3], "w") as f:
+            json.dump(result, f, indent=2)
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmark")
+    parser.add_argument("--scales", type=int, nargs="+", default=SCALES, help="channel counts to run")
+    parser.add_argument("--modes", nargs="+", choices=["step", "stream"], default=MODES)
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="multiply every simulated latency by this")
+    parser.add_argument("--error-scale", type=float, default=1.0,
+                        help="multiply every simulated error rate by this")
+    parser.add_argument("--transcript-words", type=int, default=DEFAULT_SERVICES["transcript_words"])
+    parser.add_argument("--article-words", type=int, default=DEFAULT_SERVICES["article_words"])
+    parser.add_argument("--request-delay", type=float, default=0,
+                        help="politeness pause between Supadata requests (the real run uses 1s)")
+    parser.add_argument("--keep", action="store_true", help="keep each scenario's scratch folder")
+    parser.add_argument("--startup", action="store_true",
+                        help="only measure how long `import main` takes")
+    args = parser.parse_args()
+
+    if args.startup:
+        sys.exit(0 if measure_startup() else 1)
+
+    services = {
+        key: value * (args.latency_scale if key.endswith("_latency") else
+                      args.error_scale if key.endswith("_error_rate") else 1)
+        for key, value in DEFAULT_SERVICES.items()
+    }
+    services["transcript_words"] = args.transcript_words
+    services["article_words"] = args.article_words
+
+    run_benchmark(args.scales, args.modes, services, args.request_delay, args.keep)
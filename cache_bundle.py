@@ -0,0 +1,459 @@
+"""
+Cache Bundle: Carry every cache and bit of pipeline state between machines as one file.
+A fresh machine (like a GitHub Actions runner) starts with empty caches: every
+channel has to be looked up again, unfinished videos start over and the render
+cache is cold. Exporting writes all of it - channel lookups, latency stats,
+per-video stage records, rendered fragments of unsent articles, the tracker
+and the MinHash index - into one compressed, versioned bundle:
+
+    python cache_bundle.py export                  # → cache-bundle.tar.gz
+    python cache_bundle.py import cache-bundle.tar.gz
+    python cache_bundle.py inspect cache-bundle.tar.gz
+
+The bundle's manifest lists a SHA-256 for every file. An import checks all of
+them (and the bundle version) before touching anything, and rejects the whole
+bundle if one doesn't match. Files holding a single record (stage records,
+rendered fragments) are restored where the bundle's copy is
+newer than the local one. Files holding many records are merged by content
+instead: the channel cache, latency stats and MinHash index are combined key
+by key (the newer file wins keys both have), and the bundle's processed videos
+are added to the local tracker. So importing several bundles (e.g. one per
+shard) merges them.
+
+The outbox is never bundled: every machine that imported a queued email
+would send it.
+
+Set CACHE_BUNDLE=<path> to have main.py import it at startup. Importing from
+the command line takes the pipeline lock, so it never runs during a run.
+"""
+
+import os
+import io
+import json
+import time
+import hashlib
+import sqlite3
+import tarfile
+import tempfile
+import argparse
+from contextlib import closing, nullcontext
+from datetime import datetime
+
+from env import load_env
+
+# Before the imports below, which read their settings from the environment
+load_env()
+
+import video_tracker
+import stage_store
+import render_cache
+import dedupe_videos
+import outbox
+import run_budget
+import get_videos
+from run_lock import file_lock, run_lock, RunLockHeld
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+BUNDLE_FILE = os.path.join(PROJECT_DIR, "cache-bundle.tar.gz")
+BUNDLE_FORMAT = "youtube-newsletter-cache"
+
+# Bump when the bundle layout changes; bundles from a newer version are refused
+BUNDLE_VERSION = 1
+
+# Bundle to import at startup (unset = don't)
+CACHE_BUNDLE = os.getenv("CACHE_BUNDLE")
+
+# Which bundle was imported last, so a long-running process doesn't re-import it
+IMPORTED_MARKER = os.path.join(PROJECT_DIR, ".cache", "bundle_imported.json")
+
+# What goes in a bundle, by name (files or folders)
+PARTS = {
+    "channels": [get_videos.CHANNEL_CACHE_FILE],
+    "latency": [run_budget.LATENCY_STATS_FILE],
+    "stages": [stage_store.STAGES_DIR],
+    "render": [render_cache.RENDER_CACHE_DIR],
+    "tracker": [
+        video_tracker.TRACKER_DB,
+        video_tracker.TRACKER_FILE,
+        video_tracker.JOURNAL_FILE,
+        video_tracker.COMPACTING_FILE,
+    ],
+    "minhash": [dedupe_videos.INDEX_FILE],
+}
+
+# Tracker files, merged as one set of processed videos (see _import_tracker)
+TRACKER_FILES = PARTS["tracker"]
+
+# Never bundled: locks, half-written files and SQLite's side files
+SKIP_SUFFIXES = (".lock", ".tmp", "-wal", "-shm", "-journal")
+
+
+class BundleError(RuntimeError):
+    """
+    Raised when a bundle is unreadable, from an unknown version or fails a checksum.
+    """
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _wanted_fragments():
+    """
+    Keys of the rendered fragments that articles still waiting to be sent will need.
+    Fragments of articles that were already sent aren't worth carrying around.
+    """
+    return {
+        render_cache.fragment_key(record["article"]) for record in stage_store.all_records()
+        if record["stage"] == "written" and not stage_store.abandoned(record)
+    }
+
+
+def _files(parts):
+    """
+    (bundle name, local path) for every file in the given parts that exists.
+    """
+    wanted = _wanted_fragments() if "render" in parts else set()
+    for part in parts:
+        for path in PARTS[part]:
+            if os.path.isdir(path):
+                paths = sorted(
+                    os.path.join(root, name)
+                    for root, _, names in os.walk(path) for name in names
+                )
+            else:
+                paths = [path] if os.path.exists(path) else []
+            if part == "render":
+                paths = [p for p in paths if os.path.basename(p)[:-len(".json")] in wanted]
+            for file_path in paths:
+                if not file_path.endswith(SKIP_SUFFIXES):
+                    yield os.path.relpath(file_path, PROJECT_DIR).replace(os.sep, "/"), file_path
+
+
+def _read(path):
+    if path.endswith(".db"):
+        # Copy through SQLite, so the snapshot is consistent even mid-write
+        with tempfile.TemporaryDirectory() as tmp:
+            copy = os.path.join(tmp, "copy.db")
+            with closing(sqlite3.connect(path)) as source, closing(sqlite3.connect(copy)) as target:
+                source.backup(target)
+            with open(copy, "rb") as f:
+                return f.read()
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def export_bundle(path=BUNDLE_FILE, parts=None):
+    """
+    Write the chosen parts (default: all) into one compressed bundle.
+    Expired stage records and fragments are pruned first, and only fragments
+    of unsent articles are bundled, so the bundle doesn't grow week by week.
+    Returns the manifest.
+    """
+    parts = list(PARTS) if parts is None else parts
+    stage_store.prune_records()
+    render_cache.prune_fragments()
+    files = []
+    for name, file_path in _files(parts):
+        # A database's latest changes may only be in its WAL file so far
+        mtime = max(os.path.getmtime(p) for p in (file_path, f"{file_path}-wal") if os.path.exists(p))
+        files.append((name, _read(file_path), mtime))
+
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        "version": BUNDLE_VERSION,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "parts": parts,
+        "files": {
+            name: {"sha256": _sha256(data), "bytes": len(data), "mtime": mtime}
+            for name, data, mtime in files
+        },
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with tarfile.open(tmp_path, "w:gz", compresslevel=9) as tar:
+        for name, data in [("manifest.json", json.dumps(manifest, indent=2).encode("utf-8"))] + \
+                [(f"files/{name}", data) for name, data, _ in files]:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = time.time()
+            tar.addfile(info, io.BytesIO(data))
+    os.replace(tmp_path, path)
+
+    raw = sum(f["bytes"] for f in manifest["files"].values())
+    print(f"✓ Exported {len(files)} file(s) ({raw / 1024:.0f} KB → "
+          f"{os.path.getsize(path) / 1024:.0f} KB) to {path}")
+    return manifest
+
+
+def read_bundle(path):
+    """
+    Read and verify a bundle. Returns (manifest, {name: bytes}).
+    Raises BundleError unless every file is present and matches its checksum.
+    """
+    try:
+        with tarfile.open(path, "r:gz") as tar:
+            members = {m.name: m for m in tar.getmembers()}
+            if "manifest.json" not in members:
+                raise BundleError("no manifest.json")
+            manifest = json.load(tar.extractfile(members["manifest.json"]))
+
+            if manifest.get("format") != BUNDLE_FORMAT:
+                raise BundleError(f"not a cache bundle (format {manifest.get('format')!r})")
+            if manifest.get("version", 0) > BUNDLE_VERSION:
+                raise BundleError(f"bundle version {manifest['version']} is newer than "
+                                  f"this code supports ({BUNDLE_VERSION})")
+
+            files = {}
+            for name, expected in manifest["files"].items():
+                # Names come from the bundle - never let one point outside the project
+                normalized = os.path.normpath(name)
+                if os.path.isabs(normalized) or normalized.startswith(".."):
+                    raise BundleError(f"unsafe path {name!r}")
+                member = members.get(f"files/{name}")
+                if member is None or not member.isfile():
+                    raise BundleError(f"missing {name}")
+                data = tar.extractfile(member).read()
+                if len(data) != expected["bytes"] or _sha256(data) != expected["sha256"]:
+                    raise BundleError(f"checksum mismatch for {name}")
+                files[name] = data
+
+            extra = {n[len("files/"):] for n in members if n.startswith("files/")} - set(files)
+            if extra:
+                raise BundleError(f"{len(extra)} file(s) not in the manifest")
+    except (OSError, tarfile.TarError, EOFError, ValueError, KeyError, TypeError) as e:
+        raise BundleError(f"unreadable bundle: {e}") from e
+
+    return manifest, files
+
+
+def _merge_channels(older, newer):
+    return {**older, **newer}
+
+
+def _merge_latency(older, newer):
+    return {stage: {**older.get(stage, {}), **newer.get(stage, {})} for stage in {**older, **newer}}
+
+
+def _merge_minhash(older, newer):
+    # Signatures from a different SIGNATURE_VERSION can't be mixed
+    if older.get("version") != newer.get("version"):
+        return newer if newer.get("version") == dedupe_videos.SIGNATURE_VERSION else older
+    return {**newer, "videos": {**older.get("videos", {}), **newer.get("videos", {})}}
+
+
+# Single files holding many records, merged with the local copy by content
+JSON_MERGES = {
+    get_videos.CHANNEL_CACHE_FILE: _merge_channels,
+    run_budget.LATENCY_STATS_FILE: _merge_latency,
+    dedupe_videos.INDEX_FILE: _merge_minhash,
+}
+
+# Files other processes update under a lock of their own
+FILE_LOCKS = {
+    dedupe_videos.INDEX_FILE: dedupe_videos.INDEX_LOCK_FILE,
+}
+
+
+def _write_file(target, data, mtime):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.utime(tmp_path, (mtime, mtime))
+    if target.endswith(".db"):
+        # A restored database replaces any stale WAL/SHM side files
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(target + suffix):
+                os.remove(target + suffix)
+    os.replace(tmp_path, target)
+
+
+def _merge_json(target, data, mtime, merge):
+    """
+    Merge a bundled JSON file into the local copy. Returns True if anything changed.
+    """
+    with open(target, "r") as f:
+        local = json.load(f)
+    bundled = json.loads(data)
+    older, newer = (local, bundled) if mtime > os.path.getmtime(target) else (bundled, local)
+    merged = merge(older, newer)
+    if merged == local:
+        return False
+    _write_file(target, json.dumps(merged, indent=2).encode("utf-8"),
+                max(mtime, os.path.getmtime(target)))
+    return True
+
+
+def _bundled_videos(files):
+    """
+    Processed videos from a bundle's tracker files, in the tracker's JSON shape.
+    """
+    videos = {}
+    for local_path, data in files.items():
+        if local_path == video_tracker.TRACKER_DB:
+            with tempfile.TemporaryDirectory() as tmp:
+                copy = os.path.join(tmp, "tracker.db")
+                with open(copy, "wb") as f:
+                    f.write(data)
+                with closing(sqlite3.connect(copy)) as conn:
+                    rows = conn.execute("SELECT video_id, title, channel, processed_at FROM videos").fetchall()
+            for video_id, title, channel, processed_at in rows:
+                videos[video_id] = {"title": title, "channel": channel, "processed_at": processed_at}
+
+    # Snapshot, then the journal being compacted, then the live journal
+    snapshot = files.get(video_tracker.TRACKER_FILE)
+    if snapshot:
+        videos.update(json.loads(snapshot).get("videos", {}))
+    for journal in (video_tracker.COMPACTING_FILE, video_tracker.JOURNAL_FILE):
+        for line in files.get(journal, b"").decode("utf-8").splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # a torn last line
+            videos[entry.pop("video_id")] = entry
+    return videos
+
+
+def _import_tracker(files):
+    """
+    Add the bundle's processed videos that the local tracker doesn't have yet.
+    Returns how many were added.
+    """
+    videos = _bundled_videos(files)
+    known = video_tracker.get_processed_ids(videos)
+    missing = {video_id: info for video_id, info in videos.items() if video_id not in known}
+    if missing:
+        video_tracker.save_processed_videos({"videos": missing})
+    return len(missing)
+
+
+def import_bundle(path, force=False):
+    """
+    Verify a bundle and restore (or merge) its files. Single-record files that
+    are newer locally are kept, unless force=True, which restores every file
+    exactly as bundled. Returns the number of files restored or merged.
+    """
+    manifest, files = read_bundle(path)
+    merges = {os.path.abspath(p): merge for p, merge in JSON_MERGES.items()}
+    tracker_files = {os.path.abspath(p): p for p in TRACKER_FILES}
+    locks = {os.path.abspath(p): lock for p, lock in FILE_LOCKS.items()}
+    outbox_dir = os.path.join(os.path.abspath(outbox.OUTBOX_DIR), "")
+
+    restored = 0
+    tracker = {}
+    for name, data in files.items():
+        target = os.path.join(PROJECT_DIR, *name.split("/"))
+        mtime = manifest["files"][name]["mtime"]
+        if target.startswith(outbox_dir):
+            continue  # older bundles carried the outbox
+        if not force and target in tracker_files:
+            tracker[tracker_files[target]] = data
+            continue
+        with file_lock(locks[target]) if target in locks else nullcontext():
+            if not force and target in merges and os.path.exists(target):
+                restored += _merge_json(target, data, mtime, merges[target])
+                continue
+            if not force and os.path.exists(target) and os.path.getmtime(target) >= mtime:
+                continue
+            _write_file(target, data, mtime)
+            restored += 1
+
+    added = _import_tracker(tracker) if tracker else 0
+    restored += bool(added)
+    print(f"✓ Imported {restored} of {len(files)} file(s) from {path} "
+          f"(bundle of {manifest['created_at']}, parts: {', '.join(manifest['parts'])})"
+          + (f", {added} processed video(s) added to the tracker" if added else ""))
+    return restored
+
+
+def import_at_startup(path=CACHE_BUNDLE):
+    """
+    Import CACHE_BUNDLE if it's set, exists and hasn't been imported already.
+    A bad bundle is reported and skipped - the run just starts cold.
+    """
+    if not path or not os.path.exists(path):
+        return 0
+
+    with open(path, "rb") as f:
+        digest = _sha256(f.read())
+    if os.path.exists(IMPORTED_MARKER):
+        with open(IMPORTED_MARKER, "r") as f:
+            if json.load(f).get("sha256") == digest:
+                return 0
+
+    print(f"📦 Importing cache bundle {path}...")
+    try:
+        restored = import_bundle(path)
+    except BundleError as e:
+        print(f"  ✗ Skipping cache bundle: {e}")
+        return 0
+
+    os.makedirs(os.path.dirname(IMPORTED_MARKER), exist_ok=True)
+    with open(IMPORTED_MARKER, "w") as f:
+        json.dump({"sha256": digest, "path": path, "imported_at": datetime.now().isoformat()}, f)
+    return restored
+
+
+def inspect_bundle(path):
+    """
+    Verify a bundle and print what's in it, without importing anything.
+    """
+    manifest, files = read_bundle(path)
+    print(f"Bundle {path}: version {manifest['version']}, created {manifest['created_at']}")
+    sizes = {}
+    for name, data in files.items():
+        top = name.split("/")[1] if name.startswith(".cache/") else name.split("/")[0]
+        count, total = sizes.get(top, (0, 0))
+        sizes[top] = (count + 1, total + len(data))
+    for top, (count, total) in sorted(sizes.items()):
+        print(f"  {top:<36} {count:>6} file(s) {total / 1024:>10.1f} KB")
+    print("✓ All checksums match")
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or import the pipeline's caches and state")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="write a bundle")
+    export_parser.add_argument("path", nargs="?", default=BUNDLE_FILE)
+    export_parser.add_argument("--parts", nargs="+", choices=list(PARTS), default=list(PARTS),
+                               help="only bundle these parts")
+
+    import_parser = subparsers.add_parser("import", help="verify and restore one or more bundles")
+    import_parser.add_argument("paths", nargs="+")
+    import_parser.add_argument("--force", action="store_true",
+                               help="overwrite local files even if they're newer")
+
+    inspect_parser = subparsers.add_parser("inspect", help="verify a bundle and list its contents")
+    inspect_parser.add_argument("path")
+
+    args = parser.parse_args()
+
+    failed = 0
+    if args.command == "export":
+        export_bundle(args.path, args.parts)
+    elif args.command == "inspect":
+        try:
+            inspect_bundle(args.path)
+        except BundleError as e:
+            print(f"✗ {args.path}: {e}")
+            failed += 1
+    else:
+        # Never restore files underneath a running pipeline
+        try:
+            with run_lock("cache-import"):
+                # A bad bundle is skipped (nothing from it is restored); the others still import
+                for bundle_path in args.paths:
+                    try:
+                        import_bundle(bundle_path, force=args.force)
+                    except BundleError as e:
+                        print(f"✗ {bundle_path}: {e}")
+                        failed += 1
+        except RunLockHeld as e:
+            print(f"⏳ {e}. Try again once it finishes.")
+            failed += 1
+    raise SystemExit(1 if failed else 0)
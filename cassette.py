@@ -0,0 +1,243 @@
+"""
+Cassette: Record every external call once, then replay it offline.
+With CASSETTE_MODE=record, each HTTP request and Gemini call made by the
+pipeline (YouTube API, Shorts checks, Supadata, Gemini, the podcast page and
+audio) is saved to a cassette file along with how long it took. With
+CASSETTE_MODE=replay, the same calls are answered from the cassette instead -
+no network, no quota, no keys needed - after waiting the recorded time
+multiplied by CASSETTE_LATENCY_SCALE (1 = as recorded, 0 = instant).
+
+That makes it possible to profile and regression-test against real data from
+the production channel list, reproducibly:
+
+    CASSETTE_MODE=record python main.py
+    CASSETTE_MODE=replay CASSETTE_LATENCY_SCALE=0 python main.py --profile
+
+API keys and request headers are never written to the cassette. Large bodies
+(e.g. podcast audio) are stored next to it in <cassette>.blobs/.
+"""
+
+import os
+import json
+import time
+import base64
+import hashlib
+import threading
+from collections import deque
+from types import SimpleNamespace
+
+# "off" (default), "record" or "replay"
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off")
+CASSETTE_FILE = os.getenv(
+    "CASSETTE_FILE", os.path.join(os.path.dirname(__file__), "cassettes", "cassette.jsonl")
+)
+CASSETTE_LATENCY_SCALE = float(os.getenv("CASSETTE_LATENCY_SCALE", "1"))
+
+# Bodies bigger than this go in a separate blob file instead of the cassette
+INLINE_BODY_BYTES = 256 * 1024
+
+# Connections kept open per host (enough for the stream pipeline's workers)
+HTTP_POOL_SIZE = 10
+
+_lock = threading.Lock()
+_recording = None
+_replay = None
+
+
+class CassetteMiss(RuntimeError):
+    """
+    Raised in replay mode for a call that isn't on the cassette.
+    """
+
+
+def replaying():
+    return CASSETTE_MODE == "replay"
+
+
+def _request_key(kind, request):
+    return f"{kind} {json.dumps(request, sort_keys=True, default=str)}"
+
+
+def _record(entry):
+    global _recording
+    with _lock:
+        if _recording is None:
+            # Each recording run starts a fresh cassette
+            os.makedirs(os.path.dirname(CASSETTE_FILE), exist_ok=True)
+            _recording = open(CASSETTE_FILE, "w")
+        _recording.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        _recording.flush()
+
+
+def _load_replay():
+    global _replay
+    with _lock:
+        if _replay is None:
+            _replay = {}
+            with open(CASSETTE_FILE, "r") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    _replay.setdefault(entry["key"], deque()).append(entry)
+    return _replay
+
+
+def _next_recorded(key):
+    entries = _load_replay().get(key)
+    if not entries:
+        raise CassetteMiss(f"Not on the cassette: {key[:200]}")
+    with _lock:
+        # Calls made more often than recorded (e.g. polling) get the last answer again
+        return entries.popleft() if len(entries) > 1 else entries[0]
+
+
+def exchange(kind, request, call, encode=lambda r: r, decode=lambda r: r):
+    """
+    Make an external call through the cassette.
+
+    kind/request identify the call (request must be JSON-able and free of
+    secrets); call() makes the real call; encode/decode turn its result into
+    JSON and back.
+    """
+    if CASSETTE_MODE == "replay":
+        entry = _next_recorded(_request_key(kind, request))
+        time.sleep(entry["seconds"] * CASSETTE_LATENCY_SCALE)
+        if "error" in entry:
+            raise RuntimeError(entry["error"])
+        return decode(entry["response"])
+
+    if CASSETTE_MODE != "record":
+        return call()
+
+    entry = {"key": _request_key(kind, request), "kind": kind}
+    started = time.perf_counter()
+    try:
+        result = call()
+    except Exception as e:
+        entry.update(seconds=time.perf_counter() - started, error=f"{type(e).__name__}: {e}")
+        _record(entry)
+        raise
+
+    entry["seconds"] = time.perf_counter() - started
+    entry["response"] = encode(result)
+    _record(entry)
+    return result
+
+
+# ----------------------------------------
+# HTTP (requests)
+# ----------------------------------------
+
+class RecordedResponse:
+    """
+    The parts of a requests.Response the pipeline uses, rebuilt from a cassette.
+    """
+
+    def __init__(self, data):
+        self.status_code = data["status_code"]
+        self.url = data["url"]
+        self.headers = data["headers"]
+        self._data = data
+
+    @property
+    def content(self):
+        if "blob" in self._data:
+            with open(os.path.join(f"{CASSETTE_FILE}.blobs", self._data["blob"]), "rb") as f:
+                return f.read()
+        return base64.b64decode(self._data["body"])
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size=8192):
+        content = self.content
+        for i in range(0, len(content), chunk_size):
+            yield content[i:i + chunk_size]
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"{self.status_code} error for url: {self.url}")
+
+
+def _encode_http(response):
+    body = response.content
+    data = {
+        "status_code": response.status_code,
+        "url": response.url,
+        "headers": {k: v for k, v in response.headers.items() if k.lower() in ("content-type", "content-length")},
+    }
+    if len(body) > INLINE_BODY_BYTES:
+        digest = hashlib.sha256(body).hexdigest()
+        blob_dir = f"{CASSETTE_FILE}.blobs"
+        os.makedirs(blob_dir, exist_ok=True)
+        with open(os.path.join(blob_dir, digest), "wb") as f:
+            f.write(body)
+        data["blob"] = digest
+    else:
+        data["body"] = base64.b64encode(body).decode("ascii")
+    return data
+
+
+_session = None
+
+
+def http_session():
+    """
+    One shared requests session, so repeated calls to the same host reuse
+    their keep-alive (TLS) connections instead of opening new ones.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=HTTP_POOL_SIZE)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def http_request(method, url, params=None, **kwargs):
+    """
+    requests.request() through the cassette. Headers (which may hold API
+    keys) are sent but never recorded.
+    """
+    def call():
+        return http_session().request(method, url, params=params, **kwargs)
+
+    request = {"method": method, "url": url, "params": params}
+    return exchange("http", request, call, encode=_encode_http, decode=RecordedResponse)
+
+
+# ----------------------------------------
+# Gemini
+# ----------------------------------------
+
+def encode_text_response(response):
+    return {"text": response.text}
+
+
+def decode_text_response(data):
+    return SimpleNamespace(text=data["text"])
+
+
+def encode_gemini_file(file):
+    return {"name": file.name, "uri": file.uri, "mime_type": file.mime_type, "state": file.state.name}
+
+
+def decode_gemini_file(data):
+    return SimpleNamespace(
+        name=data["name"], uri=data["uri"], mime_type=data["mime_type"],
+        state=SimpleNamespace(name=data["state"]),
+    )
+
+
+def prompt_digest(text):
+    """
+    Short stable ID for a prompt, so cassettes don't repeat whole transcripts in their keys.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
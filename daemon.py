@@ -0,0 +1,345 @@
+"""
+Daemon: Keep the pipeline running in one long-lived process.
+Instead of launchd or cron starting a fresh Python for every run (re-importing
+everything, rebuilding the YouTube client, re-creating the Gemini client and
+opening new TLS connections), the daemon sets all of that up once and runs the
+pipeline on its own schedule:
+
+    python daemon.py                          # every Wednesday at 07:00
+    python daemon.py --schedule "daily 06:30" --port 8765
+
+It also answers on a local HTTP port:
+
+    GET  /healthz   200 while the scheduler is alive, 503 if it died
+    GET  /stats     the last run (outcome, duration, articles, call latencies)
+    GET  /metrics   the same numbers in Prometheus text format
+    POST /run       start a run now
+
+Between runs it retries emails left in the outbox once their backoff has
+passed (every OUTBOX_RETRY_MINUTES).
+
+Runs still take the usual pipeline lock, so a manual `python main.py` and the
+daemon never run at the same time.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from env import load_env
+
+# Before the imports below, which read their settings from the environment
+load_env()
+
+from main import run
+from send_email import deliver_outbox
+from run_budget import RUN_BUDGET_MINUTES
+from video_tracker import get_processed_count
+from outbox import pending_messages
+from tracing import span, finished_spans, forget_trace, latency_summary
+
+DAEMON_HOST = os.getenv("DAEMON_HOST", "127.0.0.1")
+DAEMON_PORT = int(os.getenv("DAEMON_PORT", "8765"))
+
+# "<day> HH:MM" in local time, where day is mon..sun or "daily"
+# (the default matches the launchd schedule)
+DAEMON_SCHEDULE = os.getenv("DAEMON_SCHEDULE", "wed 07:00")
+
+# Between runs, retry queued emails whose backoff has passed this often
+OUTBOX_RETRY_MINUTES = float(os.getenv("OUTBOX_RETRY_MINUTES", "15"))
+
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+_started_at = time.time()
+_wake = threading.Event()
+_state_lock = threading.Lock()
+_state = {
+    "running": False,
+    "next_run": None,
+    "last_run": None,
+    "runs": {},         # outcome -> count
+    "calls": {},        # call name -> count, across runs
+    "call_errors": {},  # call name -> error count, across runs
+}
+
+
+def parse_schedule(schedule):
+    """
+    "wed 07:00" -> (2, 7, 0); "daily 07:00" -> (None, 7, 0).
+    """
+    day, _, clock = schedule.strip().lower().partition(" ")
+    hour, minute = (int(part) for part in clock.split(":"))
+    if day == "daily":
+        return None, hour, minute
+    if day[:3] not in WEEKDAYS:
+        raise ValueError(f"Unknown day in schedule {schedule!r} (use mon..sun or daily)")
+    return WEEKDAYS.index(day[:3]), hour, minute
+
+
+def next_run_after(now, schedule):
+    """
+    The first scheduled time strictly after now.
+    """
+    weekday, hour, minute = schedule
+    candidate = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if weekday is not None:
+        candidate += timedelta(days=(weekday - candidate.weekday()) % 7)
+    step = timedelta(days=1 if weekday is None else 7)
+    while candidate <= now:
+        candidate += step
+    return candidate
+
+
+def warm_up():
+    """
+    Create the API clients and load the heavy libraries once, so scheduled
+    runs don't pay for them. Anything that fails here is retried by the run.
+    """
+    from get_videos import get_youtube_client
+    from write_articles import get_gemini_client
+    from cassette import http_session
+
+    steps = [
+        ("YouTube client", get_youtube_client),
+        ("Gemini client", get_gemini_client),
+        ("HTTP session", http_session),
+        ("EPUB and markdown", lambda: (__import__("ebooklib.epub"), __import__("markdown"))),
+    ]
+    for name, step in steps:
+        try:
+            step()
+            print(f"  ✓ {name}")
+        except Exception as e:
+            print(f"  ⚠ {name}: {e}")
+
+
+def run_once(stream=False, budget_minutes=RUN_BUDGET_MINUTES):
+    """
+    Run the pipeline once and record how it went.
+    """
+    with _state_lock:
+        _state["running"] = True
+
+    started = time.time()
+    outcome, error, articles = "error", None, None
+    with span("daemon.run") as root:
+        try:
+            articles = run(stream=stream, budget_minutes=budget_minutes)
+            ran = any(s["name"] == "run" for s in finished_spans(root["trace_id"]))
+            outcome = "locked" if not ran else "sent" if articles else "nothing_new"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            print(f"✗ Run failed: {error}")
+
+    spans = finished_spans(root["trace_id"])
+    forget_trace(root["trace_id"])
+    calls = latency_summary(s for s in spans if s["name"] != "daemon.run")
+
+    with _state_lock:
+        _state["running"] = False
+        _state["runs"][outcome] = _state["runs"].get(outcome, 0) + 1
+        for name, row in calls.items():
+            _state["calls"][name] = _state["calls"].get(name, 0) + row["count"]
+            _state["call_errors"][name] = _state["call_errors"].get(name, 0) + row["errors"]
+        _state["last_run"] = {
+            "trace_id": root["trace_id"],
+            "started_at": datetime.fromtimestamp(started).isoformat(timespec="seconds"),
+            "finished_at": datetime.now().isoformat(timespec="seconds"),
+            "seconds": time.time() - started,
+            "outcome": outcome,
+            "error": error,
+            "articles": len(articles or []),
+            "calls": calls,
+        }
+
+
+def _scheduler(schedule, stream, budget_minutes):
+    while True:
+        next_run = next_run_after(datetime.now(), schedule)
+        with _state_lock:
+            _state["next_run"] = next_run
+        print(f"⏸ Next run at {next_run:%a %Y-%m-%d %H:%M}")
+
+        # Sleep until the scheduled time, or until POST /run wakes us,
+        # retrying undelivered emails along the way
+        while not _wake.wait(timeout=min(max(0, (next_run - datetime.now()).total_seconds()),
+                                         OUTBOX_RETRY_MINUTES * 60)):
+            if datetime.now() >= next_run:
+                break
+            retry_outbox()
+        _wake.clear()
+        run_once(stream, budget_minutes)
+
+
+def retry_outbox():
+    """
+    Deliver queued emails whose backoff has passed.
+    """
+    due = pending_messages(due_only=True)
+    if not due:
+        return
+    print(f"📬 Retrying {len(due)} queued email(s)...")
+    try:
+        deliver_outbox(due_only=True)
+    except Exception as e:
+        print(f"✗ Outbox retry failed: {e}")
+
+
+def stats():
+    """
+    What /stats returns.
+    """
+    with _state_lock:
+        current = {
+            "uptime_seconds": time.time() - _started_at,
+            "running": _state["running"],
+            "next_run": _state["next_run"].isoformat() if _state["next_run"] else None,
+            "runs": dict(_state["runs"]),
+            "last_run": _state["last_run"],
+        }
+    current["processed_videos"] = get_processed_count()
+    current["outbox_pending"] = len(pending_messages())
+    return current
+
+
+def _metric(lines, name, kind, help_text, samples):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+
+def metrics():
+    """
+    What /metrics returns, in the Prometheus text format.
+    """
+    current = stats()
+    with _state_lock:
+        calls, call_errors = dict(_state["calls"]), dict(_state["call_errors"])
+        next_run = _state["next_run"]
+    last = current["last_run"] or {}
+
+    lines = []
+    _metric(lines, "newsletter_daemon_uptime_seconds", "gauge", "Seconds since the daemon started.",
+            [({}, f"{current['uptime_seconds']:.0f}")])
+    _metric(lines, "newsletter_run_in_progress", "gauge", "1 while a pipeline run is going.",
+            [({}, int(current["running"]))])
+    _metric(lines, "newsletter_runs_total", "counter", "Pipeline runs started by the daemon, by outcome.",
+            [({"outcome": k}, v) for k, v in sorted(current["runs"].items())])
+    _metric(lines, "newsletter_next_run_timestamp_seconds", "gauge", "When the next scheduled run starts.",
+            [({}, f"{next_run.timestamp():.0f}")] if next_run else [])
+    if last:
+        finished = datetime.fromisoformat(last["finished_at"]).timestamp()
+        _metric(lines, "newsletter_last_run_timestamp_seconds", "gauge", "When the last run finished.",
+                [({}, f"{finished:.0f}")])
+        _metric(lines, "newsletter_last_run_duration_seconds", "gauge", "How long the last run took.",
+                [({}, f"{last['seconds']:.3f}")])
+        _metric(lines, "newsletter_last_run_success", "gauge", "1 if the last run didn't fail.",
+                [({}, int(last["outcome"] != "error"))])
+        _metric(lines, "newsletter_last_run_articles", "gauge", "Articles sent by the last run.",
+                [({}, last["articles"])])
+        _metric(lines, "newsletter_last_run_call_seconds", "summary",
+                "Latency of each call type in the last run.",
+                [({"call": name, "quantile": q}, f"{row[key]:.4f}")
+                 for name, row in last["calls"].items()
+                 for q, key in (("0.5", "p50"), ("0.95", "p95"), ("1", "max"))])
+    _metric(lines, "newsletter_calls_total", "counter", "External calls and stages, across runs.",
+            [({"call": k}, v) for k, v in sorted(calls.items())])
+    _metric(lines, "newsletter_call_errors_total", "counter", "Failed calls and stages, across runs.",
+            [({"call": k}, v) for k, v in sorted(call_errors.items())])
+    _metric(lines, "newsletter_processed_videos", "gauge", "Videos sent in any newsletter so far.",
+            [({}, current["processed_videos"])])
+    _metric(lines, "newsletter_outbox_pending", "gauge", "Emails waiting in the outbox.",
+            [({}, current["outbox_pending"])])
+    return "\n".join(lines) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    scheduler = None
+
+    def _reply(self, status, body, content_type="application/json"):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/healthz":
+            alive = self.scheduler is not None and self.scheduler.is_alive()
+            self._reply(200 if alive else 503, json.dumps({"status": "ok" if alive else "scheduler stopped"}))
+        elif self.path == "/stats":
+            self._reply(200, json.dumps(stats(), indent=2, default=str))
+        elif self.path == "/metrics":
+            self._reply(200, metrics(), "text/plain; version=0.0.4")
+        else:
+            self._reply(404, json.dumps({"error": "not found"}))
+
+    def do_POST(self):
+        if self.path != "/run":
+            self._reply(404, json.dumps({"error": "not found"}))
+            return
+        with _state_lock:
+            running = _state["running"]
+        if not running:
+            _wake.set()
+        self._reply(409 if running else 202, json.dumps({"started": not running}))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(schedule=DAEMON_SCHEDULE, host=DAEMON_HOST, port=DAEMON_PORT,
+          stream=False, budget_minutes=RUN_BUDGET_MINUTES):
+    """
+    Warm up, start the scheduler and serve the HTTP endpoint until interrupted.
+    """
+    parsed = parse_schedule(schedule)
+    server = ThreadingHTTPServer((host, port), _Handler)
+
+    print("=" * 60)
+    print("  NEWSLETTER DAEMON")
+    print("=" * 60)
+    print(f"  Schedule: {schedule}  |  http://{host}:{port}/healthz\n")
+    print("🔥 Warming up...")
+    warm_up()
+
+    _Handler.scheduler = threading.Thread(
+        target=_scheduler, args=(parsed, stream, budget_minutes), name="scheduler", daemon=True,
+    )
+    _Handler.scheduler.start()
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping.")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the newsletter pipeline as a long-lived daemon")
+    parser.add_argument("--schedule", default=DAEMON_SCHEDULE,
+                        help='when to run, e.g. "wed 07:00" or "daily 06:30" (local time)')
+    parser.add_argument("--host", default=DAEMON_HOST)
+    parser.add_argument("--port", type=int, default=DAEMON_PORT)
+    parser.add_argument("--stream", action="store_true",
+                        help="stream videos through the stages (see main.py --stream)")
+    parser.add_argument("--budget", type=float, metavar="MINUTES", default=RUN_BUDGET_MINUTES,
+                        help="time budget per run (see main.py --budget)")
+    args = parser.parse_args()
+
+    try:
+        parse_schedule(args.schedule)
+    except ValueError as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+
+    serve(args.schedule, args.host, args.port, args.stream, args.budget)
@@ -85,13 +85,16 @@ IS_CLOUD = os.environ.get("STREAMLIT_SHARING_MODE") == "true" or not Path.home()
 PROJECT_DIR = Path(__file__).parent
 CHANNELS_FILE = PROJECT_DIR / "get_videos.py"
 PROMPT_FILE = PROJECT_DIR / "write_articles.py"
-TRACKER_FILE = PROJECT_DIR / "processed_videos.json"
 NEWSLETTERS_DIR = PROJECT_DIR / "newsletters"
 PLIST_FILE = Path.home() / "Library/LaunchAgents/com.youtube.newsletter.plist"
 
 # Create newsletters directory if it doesn't exist
 NEWSLETTERS_DIR.mkdir(exist_ok=True)
 
+sys.path.insert(0, str(PROJECT_DIR))
+from archive_store import list_newsletters, newsletter_id, read_blob
+from video_tracker import load_processed_videos, get_processed_count
+
 # ============================================
 # CUSTOM CSS - Editorial Magazine Aesthetic
 # ============================================
@@ -594,15 +597,14 @@ def save_schedule(weekday, hour):
 
 
 def get_newsletters():
-    """Get list of saved newsletters."""
-    newsletters = []
-    if NEWSLETTERS_DIR.exists():
-        for json_file in sorted(NEWSLETTERS_DIR.glob("newsletter_*.json"), reverse=True):
-            with open(json_file) as f:
-                data = json.load(f)
-                data["json_path"] = str(json_file)
-                newsletters.append(data)
-    return newsletters
+    """Get list of saved newsletters (from the archive index)."""
+    return list_newsletters()
+
+
+@st.cache_data(show_spinner=False)
+def get_archived_file(digest):
+    """Read an archived HTML/EPUB file. Blobs never change, so cache forever."""
+    return read_blob(digest)
 
 
 # ============================================
@@ -661,7 +663,9 @@ if page == "Generate":
 
                     output = captured.getvalue()
 
-                    if "Newsletter sent successfully" in output or "DONE" in output:
+                    if "already in progress" in output:
+                        st.info("A newsletter run is already in progress. Try again in a few minutes.")
+                    elif "Newsletter sent successfully" in output or "DONE" in output:
                         st.success("Newsletter sent! Check your inbox.")
                     elif "No new videos" in output:
                         st.info("No new videos to process. All caught up!")
@@ -682,12 +686,7 @@ if page == "Generate":
 
     col1, col2, col3 = st.columns(3)
 
-    if TRACKER_FILE.exists():
-        with open(TRACKER_FILE) as f:
-            data = json.load(f)
-        video_count = len(data.get("videos", {}))
-    else:
-        video_count = 0
+    video_count = get_processed_count()
 
     channels = get_channels()
     weekday, hour = get_schedule()
@@ -737,7 +736,9 @@ elif page == "Podcast":
 
                 output = captured.getvalue()
 
-                if "Newsletter sent successfully" in output:
+                if "已有任务在运行" in output:
+                    st.info("Another run is in progress. Try again in a few minutes.")
+                elif "Newsletter sent successfully" in output:
                     st.success("Article sent! Check your inbox.")
                 else:
                     st.warning("Completed with notes. See log below.")
@@ -872,6 +873,7 @@ elif page == "Archive":
             st.markdown(f"**{len(newsletters)} newsletters sent**")
 
             for nl in newsletters:
+                nl_id = newsletter_id(nl)
                 st.markdown(f"""
                 <div class="newsletter-card">
                     <div class="newsletter-date">{nl.get('date', 'Unknown date')}</div>
@@ -883,28 +885,24 @@ elif page == "Archive":
 
                 col1, col2 = st.columns(2)
                 with col1:
-                    html_file = NEWSLETTERS_DIR / nl.get('html_file', '')
-                    if html_file.exists():
-                        with open(html_file) as f:
-                            html_content = f.read()
+                    if nl.get('html_blob'):
+                        html_content = get_archived_file(nl['html_blob']).decode("utf-8")
                         st.download_button(
                             "Download HTML",
                             html_content,
-                            file_name=nl.get('html_file', 'newsletter.html'),
+                            file_name=f"newsletter_{nl_id}.html",
                             mime="text/html",
-                            key=f"html_{nl.get('timestamp')}"
+                            key=f"html_{nl_id}"
                         )
                 with col2:
-                    epub_file = NEWSLETTERS_DIR / nl.get('epub_file', '')
-                    if epub_file.exists():
-                        with open(epub_file, "rb") as f:
-                            epub_content = f.read()
+                    if nl.get('epub_blob'):
+                        epub_content = get_archived_file(nl['epub_blob'])
                         st.download_button(
                             "Download EPUB",
                             epub_content,
-                            file_name=nl.get('epub_file', 'newsletter.epub'),
+                            file_name=f"newsletter_{nl_id}.epub",
                             mime="application/epub+zip",
-                            key=f"epub_{nl.get('timestamp')}"
+                            key=f"epub_{nl_id}"
                         )
 
                 st.markdown("---")
@@ -912,43 +910,37 @@ elif page == "Archive":
             st.info("No newsletters yet. Generate your first one from the Generate tab!")
 
     with tab2:
-        if TRACKER_FILE.exists():
-            with open(TRACKER_FILE) as f:
-                data = json.load(f)
+        videos = load_processed_videos()["videos"]
 
-            videos = data.get("videos", {})
-
-            if videos:
-                sorted_videos = sorted(
-                    videos.items(),
-                    key=lambda x: x[1].get("processed_at", ""),
-                    reverse=True
-                )
+        if videos:
+            sorted_videos = sorted(
+                videos.items(),
+                key=lambda x: x[1].get("processed_at", ""),
+                reverse=True
+            )
 
-                st.markdown(f"**{len(videos)} videos processed**")
+            st.markdown(f"**{len(videos)} videos processed**")
 
-                for video_id, info in sorted_videos:
-                    with st.expander(f"{info.get('channel', 'Unknown')} — {info.get('title', 'Unknown')[:50]}..."):
-                        st.write(f"**{info.get('title', 'Unknown')}**")
-                        st.caption(f"From {info.get('channel', 'Unknown')}")
+            for video_id, info in sorted_videos:
+                with st.expander(f"{info.get('channel', 'Unknown')} — {info.get('title', 'Unknown')[:50]}..."):
+                    st.write(f"**{info.get('title', 'Unknown')}**")
+                    st.caption(f"From {info.get('channel', 'Unknown')}")
 
-                        processed = info.get('processed_at', 'Unknown')
-                        if processed != 'Unknown':
-                            try:
-                                dt = datetime.fromisoformat(processed)
-                                processed = dt.strftime("%B %d, %Y at %I:%M %p")
-                            except:
-                                pass
-                        st.caption(f"Processed: {processed}")
+                    processed = info.get('processed_at', 'Unknown')
+                    if processed != 'Unknown':
+                        try:
+                            dt = datetime.fromisoformat(processed)
+                            processed = dt.strftime("%B %d, %Y at %I:%M %p")
+                        except:
+                            pass
+                    st.caption(f"Processed: {processed}")
 
-                        st.markdown(f"[Watch on YouTube](https://www.youtube.com/watch?v={video_id})")
+                    st.markdown(f"[Watch on YouTube](https://www.youtube.com/watch?v={video_id})")
 
-                st.divider()
+            st.divider()
 
-                if st.button("Clear All History", type="secondary"):
-                    st.warning("This will allow all videos to be re-processed.")
-            else:
-                st.info("No videos processed yet.")
+            if st.button("Clear All History", type="secondary"):
+                st.warning("This will allow all videos to be re-processed.")
         else:
             st.info("No videos processed yet.")
 
@@ -0,0 +1,267 @@
+"""
+Near-Duplicate Detection: Spot the same interview cross-posted on several channels.
+Uses MinHash signatures over transcript shingles plus an LSH index, so each
+conversation is only written up once (and credited to every channel that posted it).
+Signatures use one-permutation hashing: each shingle is hashed once and lands
+in one of NUM_PERM bins, which keep their minimum.
+The index is saved between runs, so a re-upload next week is caught too.
+"""
+
+import os
+import re
+import json
+import zlib
+import random
+from datetime import datetime
+from run_lock import file_lock
+
+# File to store signatures of videos we've already written up
+INDEX_FILE = os.path.join(os.path.dirname(__file__), "minhash_index.json")
+INDEX_LOCK_FILE = f"{INDEX_FILE}.lock"
+
+# Words per shingle - 5-word windows survive small transcription differences
+SHINGLE_SIZE = 5
+
+# Signature length and LSH banding (16 bands x 4 rows ≈ 0.5 similarity threshold)
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+# Estimated Jaccard similarity above which two transcripts are "the same video"
+DUPLICATE_THRESHOLD = 0.6
+
+# How many past signatures to remember
+MAX_INDEX_ENTRIES = 1000
+
+# Bump when signatures are computed differently; older saved ones are dropped
+SIGNATURE_VERSION = 2
+
+# Fixed-seed hash so signatures stay comparable across runs
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240101)
+_A, _B = _rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """
+    Break a transcript into overlapping word windows, hashed to integers.
+    """
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {zlib.crc32(" ".join(words).encode())} if words else set()
+
+    return {
+        zlib.crc32(" ".join(words[i:i + size]).encode())
+        for i in range(len(words) - size + 1)
+    }
+
+
+def minhash_signature(text):
+    """
+    Compute the MinHash signature of a transcript, in one pass over its shingles.
+    """
+    shingle_set = shingles(text)
+    if not shingle_set:
+        return [_PRIME] * NUM_PERM
+
+    bins = [None] * NUM_PERM
+    for x in shingle_set:
+        h = (_A * x + _B) % _PRIME
+        b, value = h % NUM_PERM, h // NUM_PERM
+        if bins[b] is None or value < bins[b]:
+            bins[b] = value
+
+    # Short transcripts leave some bins empty: borrow from the next filled bin
+    # (offset by the distance, so borrowed values only match other borrowed ones)
+    signature = []
+    for b in range(NUM_PERM):
+        for distance in range(NUM_PERM):
+            value = bins[(b + distance) % NUM_PERM]
+            if value is not None:
+                signature.append(value + distance * _PRIME)
+                break
+    return signature
+
+
+def estimate_similarity(sig_a, sig_b):
+    """
+    Estimate the Jaccard similarity of two transcripts from their signatures.
+    """
+    matches = sum(1 for a, b in zip(sig_a, sig_b) if a == b)
+    return matches / NUM_PERM
+
+
+def _band_keys(signature):
+    """
+    Split a signature into LSH band keys. Two signatures sharing any
+    band key are candidate duplicates.
+    """
+    return [
+        f"{band}:{zlib.crc32(repr(signature[band * ROWS:(band + 1) * ROWS]).encode())}"
+        for band in range(BANDS)
+    ]
+
+
+def new_index():
+    """
+    Create an empty in-memory LSH index.
+    """
+    return {"entries": {}, "buckets": {}}
+
+
+def add_to_index(index, key, signature, info=None):
+    """
+    Add a signature to the LSH index.
+    """
+    entry = dict(info or {})
+    entry["signature"] = signature
+    index["entries"][key] = entry
+    for band_key in _band_keys(signature):
+        index["buckets"].setdefault(band_key, set()).add(key)
+
+
+def find_match(index, signature):
+    """
+    Find the most similar indexed entry above DUPLICATE_THRESHOLD.
+    Returns (key, similarity), or (None, 0.0) if nothing matches.
+    """
+    candidates = set()
+    for band_key in _band_keys(signature):
+        candidates |= index["buckets"].get(band_key, set())
+
+    best_key, best_similarity = None, 0.0
+    for key in candidates:
+        similarity = estimate_similarity(signature, index["entries"][key]["signature"])
+        if similarity >= DUPLICATE_THRESHOLD and similarity > best_similarity:
+            best_key, best_similarity = key, similarity
+
+    return best_key, best_similarity
+
+
+def load_index():
+    """
+    Load signatures of previously written-up videos and rebuild the LSH buckets.
+    """
+    index = new_index()
+    if os.path.exists(INDEX_FILE):
+        with open(INDEX_FILE, "r") as f:
+            data = json.load(f)
+        if data.get("version") != SIGNATURE_VERSION:
+            data = {}
+        for video_id, entry in data.get("videos", {}).items():
+            add_to_index(index, video_id, entry["signature"], entry)
+    return index
+
+
+def save_index(index):
+    """
+    Save the index to file, keeping only the most recent entries.
+    """
+    entries = sorted(
+        index["entries"].items(),
+        key=lambda item: item[1].get("indexed_at", ""),
+    )[-MAX_INDEX_ENTRIES:]
+
+    with open(INDEX_FILE, "w") as f:
+        json.dump({"version": SIGNATURE_VERSION, "videos": dict(entries)}, f)
+
+
+def _signature_for(video):
+    if "minhash" not in video:
+        video["minhash"] = minhash_signature(video["transcript"])
+    return video["minhash"]
+
+
+def new_dedupe_state():
+    """
+    Start deduplicating a run: past write-ups plus an empty index for this run.
+    """
+    return {"past": load_index(), "run": new_index(), "representatives": {}}
+
+
+def check_video(state, video):
+    """
+    Check one transcript against past write-ups and the videos seen so far this run.
+    Returns True if it's new (it becomes the representative of its cluster),
+    False if it was dropped or credited to an earlier representative.
+    """
+    signature = _signature_for(video)
+
+    past_id, similarity = find_match(state["past"], signature)
+    if past_id:
+        past = state["past"]["entries"][past_id]
+        print(f"  ⏭ Already covered ({similarity:.0%} match with "
+              f"{past.get('channel', 'an earlier video')}): {video['title'][:50]}...")
+        return False
+
+    match_id, similarity = find_match(state["run"], signature)
+    if match_id:
+        representative = state["representatives"][match_id]
+        representative["channels"].append(video["channel"])
+        representative["duplicate_ids"].append(video["video_id"])
+        print(f"  ⧉ Duplicate ({similarity:.0%} match): {video['channel']} → "
+              f"{representative['title'][:40]}...")
+        return False
+
+    # Start over: a resumed or shard-merged video still has last time's lists
+    video["channels"] = [video["channel"]]
+    video["duplicate_ids"] = []
+    state["representatives"][video["video_id"]] = video
+    add_to_index(state["run"], video["video_id"], signature)
+    return True
+
+
+def credit_channels(article, video):
+    """
+    Credit an article to every channel that posted its video, in the order seen.
+    Only the article gets the combined credit - the video keeps its own channel.
+    """
+    channels = video.get("channels", [video["channel"]])
+    article["channel"] = ", ".join(dict.fromkeys(channels))
+    article["channels"] = channels
+    return article
+
+
+def dedupe_videos(videos):
+    """
+    Collapse near-duplicate transcripts before writing articles.
+
+    - Videos matching something we've already written up in a past run are dropped.
+    - Within this run, the longest transcript in each cluster is kept as the
+      representative and credited to every channel that posted it.
+
+    Returns the list of representative videos.
+    """
+    print("\nChecking for near-duplicate transcripts...\n")
+
+    state = new_dedupe_state()
+
+    # Longest transcript first, so it becomes the representative of its cluster
+    for video in sorted(videos, key=lambda v: len(v["transcript"]), reverse=True):
+        check_video(state, video)
+
+    # Keep the original order of the channel list
+    kept = [video for video in videos if video["video_id"] in state["representatives"]]
+
+    print(f"  → {len(kept)} unique of {len(videos)} transcripts")
+    return kept
+
+
+def record_videos(videos):
+    """
+    Remember the signatures of videos that were written up and sent,
+    so cross-posts in future runs are recognized.
+    """
+    now = datetime.now().isoformat()
+
+    with file_lock(INDEX_LOCK_FILE):
+        index = load_index()
+        for video in videos:
+            if not video.get("transcript"):
+                continue
+            add_to_index(index, video["video_id"], _signature_for(video), {
+                "title": video["title"],
+                "channel": video["channel"],
+                "indexed_at": now,
+            })
+        save_index(index)
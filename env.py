@@ -0,0 +1,25 @@
+"""
+Env: Load API keys and settings from the .env file, once per process.
+Every module reads its settings from environment variables when it's
+imported, so entry points (main.py, podcast_to_article.py) call load_env()
+before importing the rest; later calls do nothing.
+"""
+
+import os
+
+ENV_FILE = os.path.join(os.path.dirname(__file__), ".env")
+
+_loaded = False
+
+
+def load_env():
+    """
+    Load .env into the environment (variables already set win).
+    """
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+
+    from dotenv import load_dotenv
+    load_dotenv(ENV_FILE)
@@ -5,14 +5,22 @@ Filters out YouTube Shorts by checking the /shorts/ URL.
 """
 
 import os
-import requests
-from googleapiclient.discovery import build
-from dotenv import load_dotenv
+import json
+from env import load_env
+from tracing import span
+import cassette
 
 # Load your secret API key from the .env file
-load_dotenv()
+load_env()
 YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
 
+# Channel handle → channel ID and uploads playlist (these never change,
+# so each channel only costs a channels.list call the first time)
+CHANNEL_CACHE_FILE = os.path.join(os.path.dirname(__file__), ".cache", "channels.json")
+
+# A video is a Short if this URL doesn't redirect away
+YOUTUBE_SHORTS_URL = "https://www.youtube.com/shorts/{video_id}"
+
 # ========================================
 # YOUR FAVORITE CHANNELS GO HERE
 # Use the @ handle from the channel's YouTube page (most reliable)
@@ -30,20 +38,55 @@ CHANNELS = [
 ]
 
 
+def load_channel_cache():
+    """
+    Load the saved channel lookups.
+    """
+    if not os.path.exists(CHANNEL_CACHE_FILE):
+        return {}
+    with open(CHANNEL_CACHE_FILE, "r") as f:
+        return json.load(f)
+
+
+def save_channel_cache(cache):
+    os.makedirs(os.path.dirname(CHANNEL_CACHE_FILE), exist_ok=True)
+    tmp_path = f"{CHANNEL_CACHE_FILE}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, CHANNEL_CACHE_FILE)
+
+
 def get_channel_info(youtube, channel_handle):
     """
     Given a channel handle (@username), find its channel ID and uploads playlist ID.
     The uploads playlist contains ALL videos in exact upload order (most reliable).
+    Lookups are cached, so this only calls the API for channels we haven't seen
+    (except when recording or replaying a cassette, so every lookup is on the tape).
     """
+    cache = load_channel_cache()
+    if channel_handle in cache and cassette.CASSETTE_MODE == "off":
+        return cache[channel_handle]
+
+    channel_info = _lookup_channel(youtube, channel_handle)
+    if channel_info:
+        cache[channel_handle] = channel_info
+        save_channel_cache(cache)
+    return channel_info
+
+
+def _lookup_channel(youtube, channel_handle):
     # Remove @ if present for the API call
     handle = channel_handle.lstrip("@")
 
     # Get channel info including the contentDetails (which has the uploads playlist)
-    request = youtube.channels().list(
-        part="snippet,contentDetails",
-        forHandle=handle
-    )
-    response = request.execute()
+    with span("youtube.channels.list", handle=channel_handle):
+        response = cassette.exchange(
+            "youtube.channels.list", {"forHandle": handle},
+            lambda: youtube.channels().list(
+                part="snippet,contentDetails",
+                forHandle=handle
+            ).execute(),
+        )
 
     if response.get("items"):
         channel = response["items"][0]
@@ -61,11 +104,12 @@ def is_youtube_short(video_id):
     Check if a video is a YouTube Short by testing the /shorts/ URL.
     If youtube.com/shorts/VIDEO_ID works (doesn't redirect away), it's a Short.
     """
-    shorts_url = f"https://www.youtube.com/shorts/{video_id}"
+    shorts_url = YOUTUBE_SHORTS_URL.format(video_id=video_id)
 
     try:
         # Make a request and check if we stay on the /shorts/ URL
-        response = requests.head(shorts_url, allow_redirects=True, timeout=5)
+        with span("youtube.shorts_check", video_id=video_id):
+            response = cassette.http_request("HEAD", shorts_url, allow_redirects=True, timeout=5)
         final_url = response.url
 
         # If the final URL still contains /shorts/, it's a Short
@@ -83,12 +127,15 @@ def get_latest_video(youtube, uploads_playlist_id, channel_name):
     """
     # Get the 15 most recent videos from the uploads playlist
     # The uploads playlist is always in exact upload order (newest first)
-    request = youtube.playlistItems().list(
-        part="snippet",
-        playlistId=uploads_playlist_id,
-        maxResults=15
-    )
-    response = request.execute()
+    with span("youtube.playlistItems.list", playlist_id=uploads_playlist_id):
+        response = cassette.exchange(
+            "youtube.playlistItems.list", {"playlistId": uploads_playlist_id, "maxResults": 15},
+            lambda: youtube.playlistItems().list(
+                part="snippet",
+                playlistId=uploads_playlist_id,
+                maxResults=15
+            ).execute(),
+        )
 
     for item in response.get("items", []):
         video_id = item["snippet"]["resourceId"]["videoId"]
@@ -109,42 +156,84 @@ def get_latest_video(youtube, uploads_playlist_id, channel_name):
     return None
 
 
-def main():
+def build(*args, **kwargs):
+    """
+    googleapiclient.discovery.build, imported on first use (it's slow to import,
+    and runs that find nothing new shouldn't pay for it).
+    """
+    from googleapiclient.discovery import build as build_client
+    return build_client(*args, **kwargs)
+
+
+# Built once per process (the daemon reuses it for every run)
+_youtube = None
+
+
+def get_youtube_client():
+    """
+    Connect to YouTube (not needed when replaying a cassette).
+    """
+    global _youtube
+    if cassette.replaying():
+        return None
+    if _youtube is None:
+        _youtube = build("youtube", "v3", developerKey=YOUTUBE_API_KEY)
+    return _youtube
+
+
+def fetch_channel_video(youtube, channel_handle):
+    """
+    Look up one channel and get its latest long-form video (or None).
+    """
+    print(f"Looking up: {channel_handle}")
+
+    # Step 1: Get channel info (including uploads playlist)
+    channel_info = get_channel_info(youtube, channel_handle)
+
+    if not channel_info:
+        print(f"  ✗ Channel not found\n")
+        return None
+
+    print(f"  Channel: {channel_info['channel_name']}")
+
+    # Step 2: Get latest video from uploads playlist
+    video = get_latest_video(
+        youtube,
+        channel_info["uploads_playlist_id"],
+        channel_info["channel_name"]
+    )
+
+    if video:
+        video["channel_handle"] = channel_handle
+        print(f"  ✓ Found: {video['title']}")
+        print(f"    URL: {video['url']}\n")
+    else:
+        print(f"  ✗ No long-form videos found\n")
+
+    return video
+
+
+def main(channels=None):
     """
     Main function - this runs when you execute the script.
+    Looks up every channel in CHANNELS, or just the given ones.
     """
-    # Create a connection to YouTube
-    youtube = build("youtube", "v3", developerKey=YOUTUBE_API_KEY)
+    youtube = get_youtube_client()
 
     print("Fetching latest LONG-FORM videos (skipping Shorts)...\n")
     print("=" * 60)
 
     videos = []
 
-    for channel_handle in CHANNELS:
-        print(f"Looking up: {channel_handle}")
-
-        # Step 1: Get channel info (including uploads playlist)
-        channel_info = get_channel_info(youtube, channel_handle)
-
-        if channel_info:
-            print(f"  Channel: {channel_info['channel_name']}")
-
-            # Step 2: Get latest video from uploads playlist
-            video = get_latest_video(
-                youtube,
-                channel_info["uploads_playlist_id"],
-                channel_info["channel_name"]
-            )
-
-            if video:
-                videos.append(video)
-                print(f"  ✓ Found: {video['title']}")
-                print(f"    URL: {video['url']}\n")
-            else:
-                print(f"  ✗ No long-form videos found\n")
-        else:
-            print(f"  ✗ Channel not found\n")
+    for channel_handle in CHANNELS if channels is None else channels:
+        try:
+            video = fetch_channel_video(youtube, channel_handle)
+        except Exception as e:
+            # One broken channel shouldn't stop the whole run
+            print(f"  ✗ Couldn't fetch {channel_handle}: {e}\n")
+            continue
+        if video:
+            videos.append(video)
 
     print("=" * 60)
     print(f"Found {len(videos)} videos total!")
@@ -2,31 +2,273 @@
 YouTube Newsletter Generator - Main Script
 Ties together all the pieces: fetch videos → get transcripts → write articles → send email
 Tracks processed videos to avoid sending duplicates.
+
+Each video's progress is checkpointed, so a rerun after a crash resumes every
+video at its last completed stage. To re-run a single stage from the saved
+artifacts (e.g. for profiling), without saving or sending anything:
+    python main.py --stage transcribe|write|render
+
+To stream videos through the stages as they arrive instead:
+    python main.py --stream
+
+To see what the next run will cost without running it:
+    python main.py --explain
+
+To save CPU and memory profiles of each stage (to logs/profiles/):
+    python main.py --profile
+
+To split the channels over parallel runs and send one newsletter at the end:
+    python main.py --shard 0/4   (... --shard 3/4)
+    python main.py --merge
 """
 
-from get_videos import main as fetch_videos
+import time
+import argparse
+
+from env import load_env
+
+# Before the imports below, which read their settings from the environment
+load_env()
+
+from get_videos import main as fetch_videos, CHANNELS, load_channel_cache, save_channel_cache
 from get_transcripts import get_transcripts_for_videos
 from write_articles import write_articles_for_videos
-from send_email import send_newsletter
-from video_tracker import filter_new_videos, mark_videos_processed, get_processed_count
+from send_email import (
+    send_newsletter, send_newsletter_to_recipients, load_recipients, deliver_outbox,
+    build_newsletter_edition,
+)
+from outbox import pending_messages
+from video_tracker import (
+    filter_new_videos, mark_videos_processed, get_processed_count, get_processed_ids,
+    load_processed_videos,
+)
+from dedupe_videos import dedupe_videos, credit_channels, record_videos
+from run_lock import run_lock, RunLockHeld
+from stream_pipeline import stream_articles
+from run_budget import RunBudget, RUN_BUDGET_MINUTES
+from run_planner import explain
+from tracing import span, print_latency_summary
+from profiling import PROFILE, start_profiling, stop_profiling, profile_stage
+from work_queue import collect_results
+from render_cache import prune_fragments
+from cache_bundle import import_at_startup
+from shards import parse_shard, shard_channels, owns_video, save_shard, load_shards, remove_shards
+from stage_store import (
+    load_record, reached, save_stage, save_stages, save_discovered, record_failures, all_records,
+    unfinished_videos, prune_records,
+)
 
 
-def run():
+def run(stream=False, budget_minutes=RUN_BUDGET_MINUTES, profile=PROFILE, shard=None):
     """
     Run the full newsletter pipeline.
+    With stream=True, videos flow through the stages as they arrive (see stream_pipeline.py).
+    With a budget, videos that won't fit in the time are left for the next run (see run_budget.py).
+    With profile=True, each stage's CPU and memory profile is saved (see profiling.py).
+    With a shard (index, count), only that shard's channels are covered and the
+    results are saved for run_merge() instead of sent (see shards.py).
+    Only one run can happen at a time; if another is in progress, this returns right away.
     """
+    budget = RunBudget(float(budget_minutes) * 60 if budget_minutes else None)
+    try:
+        with run_lock("newsletter"), span("run", stream=stream, shard=shard) as root:
+            import_at_startup()
+            if profile:
+                start_profiling("newsletter")
+            try:
+                return _run_pipeline(stream, budget, shard)
+            finally:
+                print_latency_summary(root["trace_id"])
+                stop_profiling()
+    except RunLockHeld as e:
+        print(f"⏳ {e}. Try again once it finishes.")
+        return None
+
+
+def _run_pipeline(stream, budget, shard=None):
     print("=" * 60)
     print("  YOUTUBE NEWSLETTER GENERATOR")
     print("=" * 60)
     print(f"  Previously processed: {get_processed_count()} videos")
+    if shard:
+        print(f"  Shard {shard[0]}/{shard[1]}: {len(shard_channels(shard))} of {len(CHANNELS)} channels "
+              f"(results are saved for --merge, nothing is sent)")
+        already_processed = set(load_processed_videos()["videos"])
+    if budget.seconds:
+        print(f"  Time budget: {budget.seconds / 60:.0f} min "
+              f"({budget.reserve}s kept for sending)")
+
+    # Pick up transcripts and articles finished by queue workers (see work_queue.py)
+    collected = collect_results()
+    if collected:
+        print(f"\n  ↻ Collected {collected} result(s) from the work queue")
+
+    # Deliver anything still sitting in the outbox from an earlier run
+    queued = pending_messages(due_only=True) if not shard else []
+    if queued:
+        print(f"\n📬 Delivering {len(queued)} email(s) queued by an earlier run...\n")
+        with span("stage.deliver_outbox", queued=len(queued)), profile_stage("deliver_outbox"):
+            deliver_outbox()
+
+    if stream:
+        print("\n🌊 STEPS 1-3: Fetching, transcribing and writing as videos arrive...\n")
+        with span("stage.stream"), profile_stage("stream"):
+            articles, videos_with_transcripts = stream_articles(budget, shard)
+    else:
+        articles, videos_with_transcripts = _write_articles_in_steps(budget, shard)
+    budget.save()
+
+    if budget.deferred:
+        print(f"\n  ⏸ {len(budget.deferred)} video(s) deferred to the next run")
+
+    if shard:
+        # Videos this run marked itself (e.g. already covered) - the merge marks them for real
+        tracker_delta = [
+            {"video_id": video_id, "title": info["title"], "channel": info["channel"]}
+            for video_id, info in load_processed_videos()["videos"].items()
+            if video_id not in already_processed
+        ]
+        path = save_shard(shard, articles, videos_with_transcripts if articles else [], tracker_delta)
+        print(f"\n  ✓ Saved {len(articles)} article(s) to {path} for the merge step")
+        return articles
+
+    if not articles:
+        return
+
+    _send_and_mark(articles, videos_with_transcripts)
+
+    print("\n" + "=" * 60)
+    print("  DONE!")
+    print("=" * 60)
+
+    return articles
+
+
+def _send_and_mark(articles, videos_with_transcripts):
+    """
+    Steps 4-5: send the newsletter, then mark its videos as processed.
+    """
+    # Step 4: Send the newsletter via email
+    print("\n📧 STEP 4: Sending newsletter...\n")
+    recipients = load_recipients()
+    with span("stage.send", articles=len(articles), recipients=len(recipients or [])), \
+            profile_stage("send"):
+        if recipients:
+            success = send_newsletter_to_recipients(articles, recipients)["queued"] > 0
+        else:
+            success = send_newsletter(articles)
+
+    # Step 5: Mark videos as processed (once the email is safely in the outbox,
+    # delivery retries never need the articles regenerated)
+    if success:
+        mark_videos_processed(videos_with_transcripts)
+        record_videos(videos_with_transcripts)
+        save_stages(videos_with_transcripts, "sent")
+        prune_records()
+        prune_fragments()
+        print(f"\n  ✓ Marked {len(videos_with_transcripts)} video(s) as processed")
+
+    return success
+
+
+def run_merge():
+    """
+    Combine the shard results in shards/, dedupe across shards, and send one newsletter.
+    """
+    try:
+        with run_lock("newsletter"), span("merge") as root:
+            import_at_startup()
+            try:
+                return _merge_shards()
+            finally:
+                print_latency_summary(root["trace_id"])
+    except RunLockHeld as e:
+        print(f"⏳ {e}. Try again once it finishes.")
+        return None
+
+
+def _merge_shards():
+    print("=" * 60)
+    print("  MERGING SHARDS")
+    print("=" * 60)
+
+    shards = load_shards()
+    if not shards:
+        print("No shard results found in shards/. Run main.py --shard i/n first.")
+        return None
+    print(f"  {len(shards)} shard(s): {sum(len(s['articles']) for s in shards)} article(s)")
+
+    queued = pending_messages(due_only=True)
+    if queued:
+        print(f"\n📬 Delivering {len(queued)} email(s) queued by an earlier run...\n")
+        with span("stage.deliver_outbox", queued=len(queued)):
+            deliver_outbox()
+
+    # Channel lookups and videos the shards marked themselves (covered before)
+    save_channel_cache({**load_channel_cache(), **{
+        handle: info for s in shards for handle, info in s["channel_cache"].items()
+    }})
+    delta = [v for s in shards for v in s["tracker_delta"]]
+    if delta:
+        mark_videos_processed(delta)
+
+    # Skip anything an earlier merge already sent; keep the channel-list order
+    position = {handle: i for i, handle in enumerate(CHANNELS)}
+    videos = sorted(
+        (v for s in shards for v in s["videos"]),
+        key=lambda v: position.get(v.get("channel_handle"), len(position)),
+    )
+    processed = get_processed_ids([v["video_id"] for v in videos])
+    videos = [v for v in videos if v["video_id"] not in processed]
+    written = {a["video_id"]: a for s in shards for a in s["articles"] if a["video_id"] not in processed}
 
+    # A cross-posted video may have been written up by two shards - keep one
+    with span("stage.dedupe", videos=len(written)):
+        unique = dedupe_videos([v for v in videos if v["video_id"] in written]) if written else []
+    for video in unique:
+        # Keep the credits for cross-posts the shard itself found
+        video["channels"] = list(dict.fromkeys(written[video["video_id"]].get("channels", []) + video["channels"]))
+    articles = [credit_channels(dict(written[v["video_id"]]), v) for v in unique]
+
+    if articles:
+        success = _send_and_mark(articles, videos)
+    else:
+        print("\nNo new articles from any shard.")
+        success = True
+
+    if success:
+        remove_shards(shards)
+
+    print("\n" + "=" * 60)
+    print("  DONE!")
+    print("=" * 60)
+
+    return articles
+
+
+def _write_articles_in_steps(budget, shard=None):
+    """
+    Steps 1-3, each finishing for every video before the next starts.
+    Returns (articles, videos_with_transcripts).
+    """
     # Step 1: Fetch latest videos from your channels
     print("\n📺 STEP 1: Fetching latest videos...\n")
-    videos = fetch_videos()
+    with span("stage.discover"), profile_stage("discover"):
+        videos = fetch_videos(None if shard is None else shard_channels(shard))
+
+    # Pick up videos an earlier run discovered but never finished
+    seen = {v["video_id"] for v in videos}
+    resumed = [
+        v for v in unfinished_videos()
+        if v["video_id"] not in seen and (shard is None or owns_video(shard, v))
+    ]
+    if resumed:
+        print(f"\n  ↻ Resuming {len(resumed)} unfinished video(s) from an earlier run")
+        videos += resumed
 
     if not videos:
         print("No videos found. Check your channel list.")
-        return
+        return [], []
 
     # Step 1b: Filter out already-processed videos
     print("\n🔍 Checking for new videos...\n")
@@ -35,41 +277,171 @@ def run():
     if not new_videos:
         print("No new videos to process. All videos have been sent before.")
         print("=" * 60)
-        return
+        return [], []
 
     print(f"\n  → {len(new_videos)} new video(s) to process\n")
 
-    # Step 2: Get transcripts for those videos
+    records = {v["video_id"]: load_record(v["video_id"]) for v in new_videos}
+    save_discovered(new_videos)
+
+    # Step 2: Get transcripts for those videos (reusing any saved ones)
     print("\n📝 STEP 2: Extracting transcripts...\n")
-    videos_with_transcripts = get_transcripts_for_videos(new_videos)
+    saved = {
+        video_id: record["video"] for video_id, record in records.items()
+        if reached(record, "transcribed")
+    }
+    if saved:
+        print(f"  ↻ Reusing {len(saved)} saved transcript(s)")
+
+    def transcribed(video):
+        budget.record("transcribe", video)
+        save_stage(video, "transcribed")
+
+    to_fetch = [v for v in new_videos if v["video_id"] not in saved]
+    with span("stage.transcribe", saved=len(saved)), profile_stage("transcribe"):
+        fetched = get_transcripts_for_videos(
+            to_fetch,
+            on_transcript=transcribed,
+            should_continue=lambda video: budget.allows("transcribe", video),
+        )
+
+    fetched = {v["video_id"]: v for v in fetched}
+    record_failures([v for v in to_fetch if v["video_id"] not in fetched and v["video_id"] not in budget.deferred])
+    videos_with_transcripts = [
+        saved.get(v["video_id"]) or fetched[v["video_id"]]
+        for v in new_videos
+        if v["video_id"] in saved or v["video_id"] in fetched
+    ]
 
     if not videos_with_transcripts:
         print("No transcripts available for any videos.")
-        return
+        return [], []
+
+    # Step 2b: Collapse cross-posted interviews into a single article
+    with span("stage.dedupe", videos=len(videos_with_transcripts)), profile_stage("dedupe"):
+        unique_videos = dedupe_videos(videos_with_transcripts)
+
+    if not unique_videos:
+        print("All transcripts were already covered in earlier newsletters.")
+        mark_videos_processed(videos_with_transcripts)
+        save_stages(videos_with_transcripts, "sent")
+        return [], []
 
-    # Step 3: Generate articles using Claude AI
+    # Step 3: Generate articles using Claude AI (reusing any saved ones)
     print("\n✍️ STEP 3: Writing articles with Claude AI...\n")
-    articles = write_articles_for_videos(videos_with_transcripts)
+    saved = {
+        v["video_id"]: records[v["video_id"]]["article"] for v in unique_videos
+        if reached(records[v["video_id"]], "written")
+    }
+    if saved:
+        print(f"  ↻ Reusing {len(saved)} saved article(s)")
+
+    # Cheapest first, so the most articles fit in the time budget
+    def article_written(video, article):
+        budget.record("write", video)
+        save_stage(video, "written", article)
+
+    to_write = budget.schedule("write", [v for v in unique_videos if v["video_id"] not in saved])
+    with span("stage.write", saved=len(saved)), profile_stage("write"):
+        written = write_articles_for_videos(
+            to_write,
+            on_article=article_written,
+            should_continue=lambda video: budget.allows("write", video),
+        )
+
+    written = {a["video_id"]: a for a in written}
+    record_failures([v for v in to_write if v["video_id"] not in written and v["video_id"] not in budget.deferred])
+    articles = [
+        saved.get(v["video_id"]) or written[v["video_id"]]
+        for v in unique_videos
+        if v["video_id"] in saved or v["video_id"] in written
+    ]
 
     if not articles:
         print("No articles generated.")
-        return
 
-    # Step 4: Send the newsletter via email
-    print("\n📧 STEP 4: Sending newsletter...\n")
-    success = send_newsletter(articles)
+    # Deferred videos (and their cross-posts) stay unprocessed for the next run
+    deferred = budget.deferred_ids(unique_videos)
+    return articles, [v for v in videos_with_transcripts if v["video_id"] not in deferred]
 
-    # Step 5: Mark videos as processed (only if email sent successfully)
-    if success:
-        mark_videos_processed(videos_with_transcripts)
-        print(f"\n  ✓ Marked {len(videos_with_transcripts)} video(s) as processed")
 
-    print("\n" + "=" * 60)
-    print("  DONE!")
-    print("=" * 60)
+# Stages that can be re-run on their own, and what each one does
+STAGE_FUNCTIONS = {
+    "transcribe": get_transcripts_for_videos,
+    "write": write_articles_for_videos,
+    "render": build_newsletter_edition,
+}
 
-    return articles
+
+def _stage_inputs(stage, records):
+    """
+    The saved artifacts a stage takes as input.
+    """
+    if stage == "transcribe":
+        return [dict(r["video"]) for r in records]
+    if stage == "write":
+        return [r["video"] for r in records if reached(r, "transcribed")]
+    return [r["article"] for r in records if reached(r, "written")]
+
+
+def run_stage(stage, profile=PROFILE):
+    """
+    Re-run one stage on its saved inputs, for profiling.
+    Nothing is saved, marked or sent.
+    """
+    inputs = _stage_inputs(stage, all_records())
+
+    if not inputs:
+        print(f"No saved inputs for the '{stage}' stage. Run the full pipeline first.")
+        return
+
+    print(f"Re-running '{stage}' on {len(inputs)} saved item(s)...\n")
+    if profile:
+        start_profiling(f"stage_{stage}")
+    start = time.perf_counter()
+    with profile_stage(stage):
+        STAGE_FUNCTIONS[stage](inputs)
+    print(f"\n  ⏱ '{stage}' took {time.perf_counter() - start:.2f}s")
+    stop_profiling()
 
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="YouTube Newsletter Generator")
+    parser.add_argument(
+        "--stage", choices=list(STAGE_FUNCTIONS),
+        help="re-run a single stage from saved artifacts (nothing is sent)",
+    )
+    parser.add_argument(
+        "--stream", action="store_true",
+        help="stream videos through the stages instead of finishing each stage first",
+    )
+    parser.add_argument(
+        "--budget", type=float, metavar="MINUTES", default=RUN_BUDGET_MINUTES,
+        help="finish within this many minutes, leaving videos that don't fit for the next run",
+    )
+    parser.add_argument(
+        "--explain", action="store_true",
+        help="estimate quota, API calls, tokens and time for the next run without running it",
+    )
+    parser.add_argument(
+        "--profile", action="store_true", default=PROFILE,
+        help="save CPU and memory profiles of each stage to logs/profiles/",
+    )
+    parser.add_argument(
+        "--shard", type=parse_shard, metavar="I/N",
+        help="only cover shard I of N of the channels and save the results for --merge",
+    )
+    parser.add_argument(
+        "--merge", action="store_true",
+        help="combine the saved shard results, dedupe and send one newsletter",
+    )
+    args = parser.parse_args()
+
+    if args.explain:
+        explain(budget_minutes=args.budget)
+    elif args.stage:
+        run_stage(args.stage, profile=args.profile)
+    elif args.merge:
+        run_merge()
+    else:
+        run(stream=args.stream, budget_minutes=args.budget, profile=args.profile, shard=args.shard)
@@ -0,0 +1,198 @@
+"""
+Newsletter Template: The HTML email layout, compiled once and streamed out.
+The layout is split into literal chunks and placeholders the first time it's used
+(with the CSS inlined at that point), then each render just writes the chunks
+and values straight to an output stream - no string concatenation per article.
+"""
+
+import re
+from functools import lru_cache
+
+# Where to find the ebook (shown at the top of the email)
+EPUB_ATTACHED_NOTE = "📚 EPUB ebook attached - open on your phone's ebook reader!"
+EPUB_SEPARATE_NOTE = "📚 EPUB ebook sent in a separate email - open it on your phone's ebook reader!"
+
+# Styles for the email (inlined into the <head> when the template is compiled)
+NEWSLETTER_CSS = """
+            body {
+                font-family: Georgia, serif;
+                font-size: 18px;
+                max-width: 700px;
+                margin: 0 auto;
+                padding: 20px;
+                background-color: #f9f9f9;
+                color: #333;
+            }
+            .header {
+                text-align: center;
+                padding: 30px 0;
+                border-bottom: 3px solid #333;
+                margin-bottom: 30px;
+            }
+            .header h1 {
+                margin: 0;
+                font-size: 32px;
+                letter-spacing: 2px;
+            }
+            .header p {
+                color: #666;
+                font-size: 18px;
+                margin: 10px 0 0 0;
+            }
+            .article {
+                background: white;
+                padding: 30px;
+                margin-bottom: 30px;
+                border-radius: 5px;
+                box-shadow: 0 2px 5px rgba(0,0,0,0.1);
+            }
+            .article-intro {
+                background: #f8f8f8;
+                padding: 15px 20px;
+                border-left: 4px solid #666;
+                margin-bottom: 25px;
+                font-size: 16px;
+                color: #555;
+                line-height: 1.6;
+            }
+            .article-content {
+                font-size: 18px;
+                line-height: 1.9;
+            }
+            .article-content h1 {
+                color: #222;
+                font-size: 26px;
+                margin-top: 25px;
+            }
+            .article-content h2 {
+                color: #222;
+                font-size: 22px;
+                margin-top: 25px;
+            }
+            .article-content h3 {
+                color: #222;
+                font-size: 20px;
+                margin-top: 25px;
+            }
+            .article-content p {
+                font-size: 18px;
+                margin-bottom: 1em;
+            }
+            .watch-link {
+                display: inline-block;
+                margin-top: 20px;
+                padding: 12px 24px;
+                background: #ff0000;
+                color: white !important;
+                text-decoration: none;
+                border-radius: 5px;
+                font-size: 16px;
+            }
+            .footer {
+                text-align: center;
+                color: #999;
+                font-size: 14px;
+                padding: 20px;
+            }
+            .epub-note {
+                text-align: center;
+                background: #e8f4e8;
+                padding: 15px;
+                border-radius: 5px;
+                margin-bottom: 30px;
+                font-size: 16px;
+            }
+"""
+
+HEADER_TEMPLATE = """
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <style>
+${css}
+        </style>
+    </head>
+    <body>
+        <div class="header">
+            <h1>YOUR YOUTUBE DIGEST</h1>
+            <p>${date}</p>
+        </div>
+        <div class="epub-note">
+            ${epub_note}
+        </div>
+    """
+
+ARTICLE_TEMPLATE = """
+        <div class="article">
+            <div class="article-intro">
+                <em>This article is based on the video "<strong>${title}</strong>" from the YouTube channel <strong>${channel}</strong>.</em>
+            </div>
+            <div class="article-content">
+                ${content}
+            </div>
+            <a href="${url}" class="watch-link">Watch the original video</a>
+        </div>
+        """
+
+FOOTER_TEMPLATE = """
+        <div class="footer">
+            Generated by YouTube Newsletter Bot
+        </div>
+    </body>
+    </html>
+    """
+
+_PLACEHOLDER = re.compile(r"\$\{(\w+)\}")
+
+
+def _compile(source, **constants):
+    """
+    Split a template into a list of (literal, placeholder) pairs.
+    Constants are substituted now, so they cost nothing at render time.
+    """
+    source = _PLACEHOLDER.sub(
+        lambda m: constants.get(m.group(1), m.group(0)), source
+    )
+    pieces = _PLACEHOLDER.split(source)
+    # split() alternates literal, name, literal, name, ..., literal
+    parts = list(zip(pieces[0::2], pieces[1::2] + [None]))
+    return parts
+
+
+@lru_cache(maxsize=None)
+def compile_newsletter_template():
+    """
+    Compile the newsletter layout (cached for the life of the process).
+    """
+    return {
+        "header": _compile(HEADER_TEMPLATE, css=NEWSLETTER_CSS.strip("\n")),
+        "article": _compile(ARTICLE_TEMPLATE),
+        "footer": _compile(FOOTER_TEMPLATE),
+    }
+
+
+def _write(out, parts, values):
+    for literal, name in parts:
+        out.write(literal)
+        if name is not None:
+            out.write(values[name])
+
+
+def write_newsletter_html(out, date, articles, fragments, epub_note=EPUB_ATTACHED_NOTE):
+    """
+    Stream the newsletter HTML to a writable text stream.
+    `fragments` are the rendered articles from render_cache, in the same order.
+    """
+    template = compile_newsletter_template()
+
+    _write(out, template["header"], {"date": date, "epub_note": epub_note})
+
+    for article, fragment in zip(articles, fragments):
+        _write(out, template["article"], {
+            "title": article["title"],
+            "channel": article["channel"],
+            "content": fragment["html"],
+            "url": article["url"],
+        })
+
+    _write(out, template["footer"], {})
@@ -0,0 +1,213 @@
+"""
+Outbox: A durable queue of rendered emails waiting to be delivered.
+Messages are written to disk before we try to send them, so a flaky SMTP
+connection never throws away the (expensive) articles - the next run, or the
+next drain, just retries delivery.
+"""
+
+import os
+import json
+import time
+import uuid
+import smtplib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from email.generator import BytesGenerator
+from run_lock import file_lock
+from tracing import run_in_context
+
+# Folder holding queued messages (.eml) and their delivery state (.json)
+OUTBOX_DIR = os.path.join(os.path.dirname(__file__), "outbox")
+
+# Messages that failed permanently (or too many times) are moved here
+FAILED_DIR = os.path.join(OUTBOX_DIR, "failed")
+
+# Held while draining, so two processes never send the same message
+DRAIN_LOCK_FILE = os.path.join(OUTBOX_DIR, ".drain.lock")
+
+# Give up on a message after this many delivery attempts
+MAX_ATTEMPTS = 8
+
+# Wait between drains grows with each failed attempt, up to a cap (seconds)
+BACKOFF_BASE = 60
+BACKOFF_MAX = 6 * 60 * 60
+
+
+def _write_atomically(path, write):
+    """
+    Write a file via a temp file + fsync + rename, so a crash never
+    leaves a half-written file behind.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _save_state(state):
+    path = os.path.join(OUTBOX_DIR, f"{state['id']}.json")
+    _write_atomically(path, lambda f: f.write(json.dumps(state, indent=2).encode("utf-8")))
+
+
+def enqueue_message(msg, from_addr, to_addrs):
+    """
+    Serialize a message into the outbox. Returns its outbox ID.
+    Once this returns, the message survives crashes and will be delivered
+    by drain_outbox() - now or on a later run.
+    """
+    os.makedirs(OUTBOX_DIR, exist_ok=True)
+
+    if isinstance(to_addrs, str):
+        to_addrs = [to_addrs]
+
+    message_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+    # Message first, state file second: a state file always has a complete message
+    _write_atomically(
+        os.path.join(OUTBOX_DIR, f"{message_id}.eml"),
+        lambda f: BytesGenerator(f, mangle_from_=False, policy=msg.policy.clone(linesep="\r\n")).flatten(msg),
+    )
+    _save_state({
+        "id": message_id,
+        "from": from_addr,
+        "to": to_addrs,
+        "subject": msg["Subject"],
+        "queued_at": datetime.now().isoformat(),
+        "attempts": 0,
+        "next_attempt_at": 0,
+        "last_error": None,
+    })
+
+    return message_id
+
+
+def pending_messages(due_only=False):
+    """
+    List the delivery state of every queued message, oldest first.
+    Messages delivered (and removed) by a concurrent drain while we look are skipped,
+    and so are state files whose message is already gone.
+    """
+    if not os.path.isdir(OUTBOX_DIR):
+        return []
+
+    messages = []
+    for name in sorted(os.listdir(OUTBOX_DIR)):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(OUTBOX_DIR, name), "r") as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            continue
+        if not os.path.exists(os.path.join(OUTBOX_DIR, f"{state['id']}.eml")):
+            continue
+        if due_only and state["next_attempt_at"] > time.time():
+            continue
+        messages.append(state)
+
+    return messages
+
+
+def _is_permanent(error):
+    """
+    5xx replies mean the server will never accept this message - don't retry.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(500 <= code < 600 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 500 <= error.smtp_code < 600
+    return False
+
+
+def _move_to_failed(state):
+    os.makedirs(FAILED_DIR, exist_ok=True)
+    for ext in ("eml", "json"):
+        name = f"{state['id']}.{ext}"
+        try:
+            os.replace(os.path.join(OUTBOX_DIR, name), os.path.join(FAILED_DIR, name))
+        except FileNotFoundError:
+            pass
+
+
+def _remove_orphans():
+    """
+    Remove state files left without their message by a crash mid-delivery.
+    Call with the drain lock held.
+    """
+    for name in os.listdir(OUTBOX_DIR):
+        if name.endswith(".json") and not os.path.exists(os.path.join(OUTBOX_DIR, name[:-len(".json")] + ".eml")):
+            os.remove(os.path.join(OUTBOX_DIR, name))
+
+
+def _deliver(pool, state):
+    """
+    Try once to deliver a queued message. If that fails, it waits in the
+    outbox until next_attempt_at (backing off with each attempt).
+    Returns the send stats, or None if it's still undelivered.
+    """
+    eml_path = os.path.join(OUTBOX_DIR, f"{state['id']}.eml")
+
+    state["attempts"] += 1
+    try:
+        with open(eml_path, "rb") as f:
+            stats = pool.send(f, state["from"], state["to"])
+    except Exception as e:
+        state["last_error"] = str(e)
+        print(f"  ✗ Delivery attempt {state['attempts']} failed for {', '.join(state['to'])}: {e}")
+        if _is_permanent(e):
+            state["permanent"] = True
+    else:
+        # State file first: a crash in between leaves a message without
+        # state, which pending_messages() never lists
+        os.remove(os.path.join(OUTBOX_DIR, f"{state['id']}.json"))
+        os.remove(eml_path)
+        return stats
+
+    if state.get("permanent") or state["attempts"] >= MAX_ATTEMPTS:
+        _save_state(state)
+        _move_to_failed(state)
+        print(f"  ✗ Gave up on {state['id']} (moved to outbox/failed)")
+    else:
+        backoff = min(BACKOFF_BASE * 2 ** state["attempts"], BACKOFF_MAX)
+        state["next_attempt_at"] = time.time() + backoff
+        _save_state(state)
+
+    return None
+
+
+def drain_outbox(pool, due_only=False):
+    """
+    Deliver everything in the outbox over a connection pool.
+    Messages that still fail stay queued for the next drain.
+    Returns a dict with sent/failed/remaining counts.
+    """
+    try:
+        with file_lock(DRAIN_LOCK_FILE, blocking=False):
+            return _drain(pool, due_only)
+    except BlockingIOError:
+        print("  Another process is already delivering the outbox")
+        return {"sent": 0, "failed": 0, "remaining": len(pending_messages()), "bytes_sent": 0, "seconds": 0.0}
+
+
+def _drain(pool, due_only):
+    if os.path.isdir(OUTBOX_DIR):
+        _remove_orphans()
+    messages = pending_messages(due_only=due_only)
+    if not messages:
+        return {"sent": 0, "failed": 0, "remaining": 0, "bytes_sent": 0, "seconds": 0.0}
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=pool.size) as executor:
+        deliver = run_in_context(lambda state: _deliver(pool, state))
+        results = list(executor.map(deliver, messages))
+
+    delivered = [r for r in results if r is not None]
+    return {
+        "sent": len(delivered),
+        "failed": len(results) - len(delivered),
+        "remaining": len(pending_messages()),
+        "bytes_sent": sum(r["bytes_sent"] for r in delivered),
+        "seconds": time.perf_counter() - start,
+    }
@@ -1,28 +1,32 @@
 """
 Podcast to Article: 从小宇宙播客生成杂志风格文章
-用法: python podcast_to_article.py <小宇宙单集URL或EpisodeID>
+用法: python podcast_to_article.py <小宇宙单集URL或EpisodeID> [--profile]
 
 示例:
   python podcast_to_article.py https://www.xiaoyuzhoufm.com/episode/6123983acc5f215c6e0b7e6d
   python podcast_to_article.py 6123983acc5f215c6e0b7e6d
+
+加 --profile（或设置 PROFILE=1）会把每一步的 CPU / 内存分析报告保存到 logs/profiles/
 """
 
 import os
 import re
 import sys
 import json
-import requests
-from google import genai
-from google.genai import types
-from dotenv import load_dotenv
+import functools
+from env import load_env
+
+load_env()
 
-load_dotenv()
+import cassette
 
 
+@functools.lru_cache(maxsize=None)
 def get_gemini_client():
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         raise RuntimeError("请设置 GEMINI_API_KEY 环境变量")
+    from google import genai  # 导入较慢，用到时再加载
     return genai.Client(api_key=api_key)
 
 
@@ -42,7 +46,7 @@ def fetch_episode_info(episode_id):
     url = f"https://www.xiaoyuzhoufm.com/episode/{episode_id}"
     print(f"  正在获取: {url}")
 
-    resp = requests.get(url, headers={
+    resp = cassette.http_request("GET", url, headers={
         "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
                       "AppleWebKit/537.36 (KHTML, like Gecko) "
                       "Chrome/120.0.0.0 Safari/537.36"
@@ -90,7 +94,7 @@ def download_audio(audio_url, episode_id):
         return filepath
 
     print(f"  正在下载音频...")
-    resp = requests.get(audio_url, stream=True, timeout=300)
+    resp = cassette.http_request("GET", audio_url, stream=True, timeout=300)
     resp.raise_for_status()
 
     total = int(resp.headers.get("content-length", 0))
@@ -110,18 +114,28 @@ def download_audio(audio_url, episode_id):
 
 def transcribe_and_write(audio_path, episode_info):
     """用 Gemini 2.5 Flash 一步完成：转录音频 + 改写为文章"""
-    client = get_gemini_client()
-
+    # 客户端在真正调用时才创建（回放录制的 cassette 时不需要）
     print(f"  正在上传音频到 Gemini...")
-    audio_file = client.files.upload(file=audio_path)
+    audio_file = cassette.exchange(
+        "gemini.files.upload",
+        {"file": os.path.basename(audio_path), "bytes": os.path.getsize(audio_path)},
+        lambda: get_gemini_client().files.upload(file=audio_path),
+        encode=cassette.encode_gemini_file,
+        decode=cassette.decode_gemini_file,
+    )
     print(f"  上传完成: {audio_file.uri}")
 
     # 等待文件处理完毕
     import time
     while audio_file.state.name == "PROCESSING":
         print(f"  等待处理中...")
-        time.sleep(5)
-        audio_file = client.files.get(name=audio_file.name)
+        time.sleep(0 if cassette.replaying() else 5)
+        audio_file = cassette.exchange(
+            "gemini.files.get", {"name": audio_file.name},
+            lambda: get_gemini_client().files.get(name=audio_file.name),
+            encode=cassette.encode_gemini_file,
+            decode=cassette.decode_gemini_file,
+        )
 
     if audio_file.state.name == "FAILED":
         raise RuntimeError(f"音频处理失败: {audio_file.state}")
@@ -155,15 +169,25 @@ def transcribe_and_write(audio_path, episode_info):
 
     print(f"  正在让 Gemini 转录并改写（这可能需要几分钟）...")
 
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=[
-            types.Part.from_uri(
-                file_uri=audio_file.uri,
-                mime_type=audio_file.mime_type,
-            ),
-            prompt,
-        ],
+    def generate():
+        from google.genai import types
+        return get_gemini_client().models.generate_content(
+            model="gemini-2.5-flash",
+            contents=[
+                types.Part.from_uri(
+                    file_uri=audio_file.uri,
+                    mime_type=audio_file.mime_type,
+                ),
+                prompt,
+            ],
+        )
+
+    response = cassette.exchange(
+        "gemini.generate_content",
+        {"model": "gemini-2.5-flash", "file": audio_file.uri, "prompt": cassette.prompt_digest(prompt)},
+        generate,
+        encode=cassette.encode_text_response,
+        decode=cassette.decode_text_response,
     )
 
     return response.text
@@ -177,9 +201,27 @@ def extract_article(text):
     return text
 
 
-def run(episode_input):
+def run(episode_input, profile=None):
     """完整管线：解析 → 抓取 → 下载 → 转录改写 → 发邮件（含 EPUB）"""
+    from run_lock import run_lock, RunLockHeld
+    from profiling import PROFILE, start_profiling, stop_profiling
+
+    # 同一时间只允许一个管线运行（定时任务、仪表盘都可能触发）
+    try:
+        with run_lock("podcast"):
+            if PROFILE if profile is None else profile:
+                start_profiling("podcast")
+            try:
+                _run(episode_input)
+            finally:
+                stop_profiling()
+    except RunLockHeld as e:
+        print(f"⏳ 已有任务在运行，请稍后再试: {e}")
+
+
+def _run(episode_input):
     from send_email import send_newsletter
+    from profiling import profile_stage
 
     print("=" * 60)
     print("播客 → 文章 (Gemini 2.5 Flash)")
@@ -192,7 +234,8 @@ def run(episode_input):
 
     # Step 2: 获取单集信息
     print("\n[2/5] 获取单集信息...")
-    episode_info = fetch_episode_info(episode_id)
+    with profile_stage("fetch_info"):
+        episode_info = fetch_episode_info(episode_id)
 
     if not episode_info["audio_url"]:
         print("  ✗ 未找到音频链接")
@@ -200,12 +243,14 @@ def run(episode_input):
 
     # Step 3: 下载音频
     print("\n[3/5] 下载音频...")
-    audio_path = download_audio(episode_info["audio_url"], episode_id)
+    with profile_stage("download"):
+        audio_path = download_audio(episode_info["audio_url"], episode_id)
 
     # Step 4: Gemini 转录 + 改写
     print("\n[4/5] Gemini AI 转录 + 改写...")
-    result_text = transcribe_and_write(audio_path, episode_info)
-    article = extract_article(result_text)
+    with profile_stage("transcribe_write"):
+        result_text = transcribe_and_write(audio_path, episode_info)
+        article = extract_article(result_text)
 
     # Step 5: 发送邮件 + EPUB
     print("\n[5/5] 发送邮件...")
@@ -216,7 +261,8 @@ def run(episode_input):
         "url": episode_url,
         "article": article,
     }]
-    send_newsletter(articles)
+    with profile_stage("send"):
+        send_newsletter(articles)
 
     # 清理音频文件
     if os.path.exists(audio_path):
@@ -229,10 +275,11 @@ def run(episode_input):
 
 
 def main():
-    if len(sys.argv) < 2:
+    args = [a for a in sys.argv[1:] if a != "--profile"]
+    if not args:
         print(__doc__)
         sys.exit(1)
-    run(sys.argv[1])
+    run(args[0], profile=True if "--profile" in sys.argv else None)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,129 @@
+"""
+Profiling: Optional CPU and memory profiles for each pipeline stage.
+When a run gets slow, this shows whether the time goes to the network,
+markdown rendering, EPUB writing or tracker churn. Turn it on with --profile
+(or PROFILE=1); each stage then gets:
+
+- <stage>.prof   cProfile data (open with `python -m pstats` or snakeviz)
+- <stage>.txt    top functions by cumulative time, peak memory and the
+                 lines that allocated the most memory during the stage
+
+in logs/profiles/<run name>_<timestamp>/, next to the run log, plus a
+summary.json for comparing runs over time.
+
+CPU profiles only see the thread that runs the stage, so profile the
+step-by-step mode rather than --stream.
+"""
+
+import os
+import io
+import json
+import time
+import pstats
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+PROFILE = os.getenv("PROFILE", "0") == "1"
+PROFILE_DIR = os.path.join(os.path.dirname(__file__), "logs", "profiles")
+
+# How many functions / allocation sites to list in each report
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 15
+
+# Folder for the current run's reports (None = profiling is off)
+_session_dir = None
+_summary = {}
+
+# Did start_profiling turn tracemalloc on? (If something else did, e.g.
+# PYTHONTRACEMALLOC, it's left running.)
+_started_tracemalloc = False
+
+
+def start_profiling(run_name):
+    """
+    Turn on profiling for this run. Returns the folder reports go to.
+    """
+    global _session_dir, _summary, _started_tracemalloc
+    _session_dir = os.path.join(PROFILE_DIR, f"{run_name}_{datetime.now():%Y%m%d_%H%M%S}")
+    _summary = {}
+    os.makedirs(_session_dir, exist_ok=True)
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(10)
+        _started_tracemalloc = True
+    return _session_dir
+
+
+def stop_profiling():
+    """
+    Turn profiling off and print where the reports are.
+    """
+    global _session_dir, _started_tracemalloc
+    if _session_dir is None:
+        return
+    if _started_tracemalloc:
+        tracemalloc.stop()
+        _started_tracemalloc = False
+    print(f"\n🔬 Profiles saved to {_session_dir}")
+    _session_dir = None
+
+
+def _write_report(stage, profiler, before, after, peak, wall, cpu):
+    profiler.dump_stats(os.path.join(_session_dir, f"{stage}.prof"))
+
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+
+    # Leave out tracemalloc's own bookkeeping
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    growth = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "lineno")
+    growth = [stat for stat in growth if stat.size_diff > 0][:TOP_ALLOCATIONS]
+    top_allocations = [
+        {"where": str(stat.traceback[0]), "kb": stat.size_diff / 1024, "count": stat.count_diff}
+        for stat in growth
+    ]
+
+    with open(os.path.join(_session_dir, f"{stage}.txt"), "w") as f:
+        f.write(f"Stage: {stage}\n")
+        f.write(f"Wall time: {wall:.2f}s   CPU time: {cpu:.2f}s   "
+                f"Peak traced memory: {peak / 1024 / 1024:.1f} MB\n\n")
+        f.write("Top allocations during the stage:\n")
+        for row in top_allocations:
+            f.write(f"  {row['kb']:>10.1f} KB  {row['count']:>7} blocks  {row['where']}\n")
+        f.write("\n")
+        f.write(stream.getvalue())
+
+    _summary[stage] = {
+        "wall_seconds": wall,
+        "cpu_seconds": cpu,
+        "peak_mb": peak / 1024 / 1024,
+        "top_allocations": top_allocations,
+    }
+    with open(os.path.join(_session_dir, "summary.json"), "w") as f:
+        json.dump(_summary, f, indent=2)
+
+
+@contextmanager
+def profile_stage(stage):
+    """
+    Profile a block as one stage. Does nothing unless profiling was started.
+    Stages shouldn't be nested (only one CPU profiler can run at a time).
+    """
+    if _session_dir is None:
+        yield
+        return
+
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    profiler = cProfile.Profile()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        _, peak = tracemalloc.get_traced_memory()
+        _write_report(stage, profiler, before, tracemalloc.take_snapshot(), peak, wall, cpu)
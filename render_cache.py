@@ -0,0 +1,133 @@
+"""
+Render Cache: Convert each article from markdown exactly once.
+The HTML email, the EPUB and the plain-text body all share the same rendered
+fragment. Fragments are keyed by a hash of the article content and saved to disk,
+so re-sending a newsletter that failed to go out doesn't render anything again.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Folder to store rendered fragments between runs
+RENDER_CACHE_DIR = os.path.join(os.path.dirname(__file__), ".cache", "render")
+
+# Bump this when the fragment format changes, so old fragments are ignored
+RENDER_VERSION = 1
+
+# Fragments kept in memory (most recently used), so a long-running process
+# like the daemon doesn't keep every fragment it ever rendered
+MEMORY_CACHE_SIZE = 256
+
+# Fragments on disk that haven't been used for this long are removed
+FRAGMENT_RETENTION_DAYS = 30
+
+# Fragments already rendered (or loaded) in this process, least recently used first
+_memory_cache = OrderedDict()
+_memory_lock = threading.Lock()
+
+
+def fragment_key(article):
+    """
+    Content hash identifying an article's rendered fragment.
+    """
+    payload = json.dumps(
+        [RENDER_VERSION, article["title"], article["channel"], article["url"], article["article"]],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _render(article):
+    """
+    Render an article into the pieces every output format needs.
+    """
+    import markdown  # deferred: runs with nothing new never render anything
+
+    return {
+        "html": markdown.markdown(article["article"]),
+        "text": (
+            f"--- {article['channel']} ---\n"
+            f"{article['article']}\n"
+            f"Watch: {article['url']}\n\n"
+        ),
+    }
+
+
+def save_fragment(key, fragment):
+    """
+    Save a rendered fragment to the disk cache (e.g. one rendered by a queue worker).
+    """
+    path = os.path.join(RENDER_CACHE_DIR, f"{key}.json")
+    os.makedirs(RENDER_CACHE_DIR, exist_ok=True)
+    # Per-process temp file: queue workers may render the same article at once
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({k: v for k, v in fragment.items() if k != "key"}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _remember(key, fragment):
+    with _memory_lock:
+        _memory_cache[key] = fragment
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > MEMORY_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+
+
+def render_article(article):
+    """
+    Get the rendered fragment for an article, from memory, disk or a fresh render.
+    """
+    key = fragment_key(article)
+
+    with _memory_lock:
+        if key in _memory_cache:
+            _memory_cache.move_to_end(key)
+            return _memory_cache[key]
+
+    path = os.path.join(RENDER_CACHE_DIR, f"{key}.json")
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            fragment = json.load(f)
+        # Mark it as used, so pruning keeps it
+        os.utime(path)
+    else:
+        fragment = _render(article)
+        save_fragment(key, fragment)
+
+    fragment["key"] = key
+    _remember(key, fragment)
+    return fragment
+
+
+def render_articles(articles):
+    """
+    Get rendered fragments for a list of articles, in the same order.
+    """
+    return [render_article(article) for article in articles]
+
+
+def prune_fragments(days=FRAGMENT_RETENTION_DAYS):
+    """
+    Remove fragments on disk that haven't been used for `days` (including any
+    left over from an older RENDER_VERSION, which are never used again).
+    Returns how many were removed.
+    """
+    if not os.path.isdir(RENDER_CACHE_DIR):
+        return 0
+
+    cutoff = time.time() - days * 24 * 60 * 60
+    removed = 0
+    for name in os.listdir(RENDER_CACHE_DIR):
+        path = os.path.join(RENDER_CACHE_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
@@ -0,0 +1,166 @@
+"""
+Run Budget: Fit a run into a fixed amount of wall-clock time.
+Scheduled runs get killed at the CI job timeout, and a killed run sends nothing.
+With a budget, the pipeline estimates how long each video will take (from its
+transcript length and how long past videos took), does the cheapest videos
+first so the most articles make it in, and leaves the rest for the next run.
+Some time is always kept back for sending.
+
+    python main.py --budget 25      # or RUN_BUDGET_MINUTES=25
+"""
+
+import os
+import json
+import time
+import threading
+
+# Default budget in minutes (unset = no limit)
+RUN_BUDGET_MINUTES = os.getenv("RUN_BUDGET_MINUTES")
+
+# Time kept back at the end of the budget for building and sending the email
+SEND_RESERVE_SECONDS = int(os.getenv("SEND_RESERVE_SECONDS", "120"))
+
+# Measured latencies from past runs
+LATENCY_STATS_FILE = os.path.join(os.path.dirname(__file__), ".cache", "latency_stats.json")
+
+# How much each new measurement moves the running averages
+SMOOTHING = 0.3
+
+# Starting guesses until we've measured anything
+DEFAULT_STATS = {
+    "transcribe": {"seconds": 6.0},
+    "write": {"seconds_per_kword": 4.0, "min_seconds": 15.0},
+}
+
+
+def load_latency_stats():
+    """
+    Load past per-stage latencies (or the starting guesses).
+    """
+    stats = json.loads(json.dumps(DEFAULT_STATS))
+    if os.path.exists(LATENCY_STATS_FILE):
+        with open(LATENCY_STATS_FILE, "r") as f:
+            for stage, values in json.load(f).items():
+                stats.setdefault(stage, {}).update(values)
+    return stats
+
+
+def save_latency_stats(stats):
+    os.makedirs(os.path.dirname(LATENCY_STATS_FILE), exist_ok=True)
+    tmp_path = f"{LATENCY_STATS_FILE}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(stats, f, indent=2)
+    os.replace(tmp_path, LATENCY_STATS_FILE)
+
+
+def _kwords(video):
+    return len((video.get("transcript") or "").split()) / 1000
+
+
+class RunBudget:
+    """
+    Tracks the time left in a run and decides which videos still fit.
+    A budget of None never runs out (but still measures latencies).
+    """
+
+    def __init__(self, seconds=None, reserve=SEND_RESERVE_SECONDS):
+        self.seconds = seconds
+        self.reserve = reserve
+        self.started = time.monotonic()
+        self.stats = load_latency_stats()
+        self.deferred = {}
+        self._item_starts = {}
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        """
+        Seconds left for work, after keeping back the send reserve.
+        """
+        if self.seconds is None:
+            return float("inf")
+        return self.seconds - self.reserve - (time.monotonic() - self.started)
+
+    def estimate(self, stage, video):
+        """
+        Expected seconds for one video at one stage.
+        """
+        if stage == "write":
+            return self.write_seconds(_kwords(video) * 1000)
+        return self.stats[stage]["seconds"]
+
+    def write_seconds(self, words):
+        """
+        Expected seconds to write an article from a transcript of this many words.
+        """
+        stats = self.stats["write"]
+        return max(stats["seconds_per_kword"] * words / 1000, stats["min_seconds"])
+
+    def schedule(self, stage, videos):
+        """
+        Order videos cheapest first and keep as many as fit in the time left.
+        Returns the videos to do now; the rest are deferred.
+        """
+        available = left = self.remaining()
+        chosen = []
+        for video in sorted(videos, key=lambda v: self.estimate(stage, v)):
+            cost = self.estimate(stage, video)
+            if cost <= left:
+                chosen.append(video)
+                left -= cost
+            else:
+                self._defer(stage, video)
+
+        if len(chosen) < len(videos):
+            print(f"  ⏸ Time budget: {len(chosen)} of {len(videos)} video(s) fit "
+                  f"({available:.0f}s left) - the rest wait for the next run")
+        return chosen
+
+    def allows(self, stage, video):
+        """
+        Check just before starting a video whether it still fits.
+        Also starts timing it for record().
+        """
+        if self.estimate(stage, video) > self.remaining():
+            self._defer(stage, video)
+            print(f"  ⏸ Out of time - leaving for the next run: {video['title'][:50]}")
+            return False
+
+        with self._lock:
+            self._item_starts[(stage, video["video_id"])] = time.monotonic()
+        return True
+
+    def record(self, stage, video):
+        """
+        Note how long a video took at a stage (started by allows()).
+        """
+        with self._lock:
+            started = self._item_starts.pop((stage, video["video_id"]), None)
+            if started is None:
+                return
+            seconds = time.monotonic() - started
+
+            stats = self.stats[stage]
+            if stage == "write":
+                if _kwords(video) > 0:
+                    rate = seconds / _kwords(video)
+                    stats["seconds_per_kword"] += SMOOTHING * (rate - stats["seconds_per_kword"])
+            else:
+                stats["seconds"] += SMOOTHING * (seconds - stats["seconds"])
+
+    def _defer(self, stage, video):
+        with self._lock:
+            self.deferred[video["video_id"]] = stage
+
+    def deferred_ids(self, videos):
+        """
+        IDs of deferred videos, plus the cross-posts that depend on them.
+        """
+        ids = set()
+        for video in videos:
+            if video["video_id"] in self.deferred:
+                ids.add(video["video_id"])
+                ids.update(video.get("duplicate_ids", []))
+        return ids
+
+    def save(self):
+        save_latency_stats(self.stats)
@@ -0,0 +1,112 @@
+"""
+Run Lock: Makes sure only one pipeline run happens at a time.
+The scheduled job, the dashboard's Generate button and the Podcast page can all
+start a run. Without a lock, two runs could process the same videos (paying for
+the same AI calls twice) and overwrite each other's tracker updates.
+
+Locks are OS file locks (flock), so they are released automatically if a run
+crashes or is killed - a lock file left behind by a dead run is never a problem.
+"""
+
+import os
+import json
+import fcntl
+import socket
+from contextlib import contextmanager
+from datetime import datetime
+
+# Held for the whole duration of a pipeline run
+LOCK_FILE = os.path.join(os.path.dirname(__file__), ".pipeline.lock")
+
+
+class RunLockHeld(RuntimeError):
+    """
+    Raised when another run already holds the lock.
+    """
+
+    def __init__(self, holder):
+        self.holder = holder or {}
+        super().__init__(
+            f"Another run is already in progress "
+            f"({self.holder.get('name', 'unknown')}, pid {self.holder.get('pid', '?')}, "
+            f"started {self.holder.get('started_at', 'at an unknown time')})"
+        )
+
+
+def _read_holder(f):
+    f.seek(0)
+    try:
+        return json.loads(f.read() or "null")
+    except ValueError:
+        return None
+
+
+@contextmanager
+def file_lock(path, shared=False, blocking=True):
+    """
+    Hold an OS lock on a file for the duration of the block.
+    Use shared=True for readers, and blocking=False to fail fast
+    (raises BlockingIOError) instead of waiting.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a+") as f:
+        flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+        fcntl.flock(f.fileno(), flags)
+        try:
+            yield f
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def run_lock(name="newsletter"):
+    """
+    Hold the exclusive pipeline run lock, or raise RunLockHeld right away
+    if another run has it.
+    """
+    f = open(LOCK_FILE, "a+")
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        # Queue workers share the lock without naming themselves (see worker_lock)
+        holder = _read_holder(f) or {"name": "queue workers"}
+        f.close()
+        raise RunLockHeld(holder)
+
+    # We got the lock, so whoever is still named in the file is gone
+    previous = _read_holder(f)
+    if previous:
+        print(f"  ⚠ Previous run ({previous.get('name')}, pid {previous.get('pid')}, "
+              f"started {previous.get('started_at')}) didn't finish cleanly - continuing")
+
+    f.seek(0)
+    f.truncate()
+    json.dump({
+        "name": name,
+        "pid": os.getpid(),
+        "host": socket.gethostname(),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+    }, f)
+    f.flush()
+
+    try:
+        yield
+    finally:
+        f.seek(0)
+        f.truncate()
+        f.flush()
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        f.close()
+
+
+@contextmanager
+def worker_lock():
+    """
+    Hold the pipeline run lock in shared mode: any number of queue workers can
+    work together, but never during a run. Raises BlockingIOError right away
+    if a run has the lock.
+    """
+    with file_lock(LOCK_FILE, shared=True, blocking=False):
+        yield
@@ -0,0 +1,228 @@
+"""
+Run Planner: Estimate what a run will cost before doing it.
+Prints how many YouTube quota units, Supadata calls, Gemini tokens and seconds
+the next run should take, stage by stage - without calling any API. Estimates
+come from the channel cache, the tracker, the saved stage records (as the run
+would resume them, including work queue results it would collect) and the
+latencies measured in past runs. All of these are only read.
+
+    python main.py --explain
+
+Handy before a big backfill or after adding a batch of channels.
+"""
+
+from datetime import datetime, timedelta
+
+from get_videos import CHANNELS, load_channel_cache
+from video_tracker import load_processed_videos
+from stage_store import all_records, reached, abandoned
+from work_queue import finished_stages
+from outbox import pending_messages
+from run_budget import RunBudget, RUN_BUDGET_MINUTES
+
+# YouTube Data API cost per call (channels.list, playlistItems.list)
+QUOTA_PER_CALL = 1
+
+# How far back to look when guessing how often a channel posts
+LOOKBACK_DAYS = 28
+
+# Rough token counts for Gemini
+TOKENS_PER_WORD = 1.3
+PROMPT_TOKENS = 450
+
+# Guesses for channels we have no history for
+DEFAULT_TRANSCRIPT_WORDS = 8000
+DEFAULT_ARTICLE_WORDS = 1500
+
+# API round trips per channel lookup, plus a couple of Shorts checks
+DISCOVERY_SECONDS_PER_CALL = 0.5
+SHORTS_CHECK_SECONDS = 0.6
+
+
+def _words(text):
+    return len((text or "").split())
+
+
+def _average(values, default):
+    return sum(values) / len(values) if values else default
+
+
+def channel_history(channel_cache=None, records=None, processed=None):
+    """
+    Per-channel statistics from past runs: how often the channel has new
+    videos, and how long its transcripts and articles usually are.
+    """
+    channel_cache = load_channel_cache() if channel_cache is None else channel_cache
+    records = all_records() if records is None else records
+    processed = load_processed_videos()["videos"] if processed is None else processed
+
+    cutoff = (datetime.now() - timedelta(days=LOOKBACK_DAYS)).isoformat()
+    history = {}
+
+    for handle in CHANNELS:
+        name = channel_cache.get(handle, {}).get("channel_name")
+
+        # Cross-posted videos are credited as "A, B" - count them for each channel
+        sent = [
+            info for info in processed.values()
+            if name and name in (info.get("channel") or "").split(", ")
+        ]
+        recent = [info for info in sent if (info.get("processed_at") or "") >= cutoff]
+
+        mine = [
+            r for r in records
+            if r["video"].get("channel_handle") == handle
+            or (name and name in r["video"].get("channels", [r["video"].get("channel")]))
+        ]
+        transcript_words = [_words(r["video"].get("transcript")) for r in mine if reached(r, "transcribed")]
+        article_words = [_words(r["article"]["article"]) for r in mine if reached(r, "written")]
+
+        history[handle] = {
+            "cached": handle in channel_cache,
+            # At most one new video per channel per run (we only take the latest)
+            "new_per_run": min(1.0, len(recent) / (LOOKBACK_DAYS / 7)) if sent else 1.0,
+            "transcript_words": _average(transcript_words, DEFAULT_TRANSCRIPT_WORDS),
+            "article_words": _average(article_words, DEFAULT_ARTICLE_WORDS),
+        }
+
+    return history
+
+
+def resumable_records(records=None, processed=None):
+    """
+    The stage records the next run would actually pick up: unsent, not given
+    up on and not already in the tracker, advanced by any queue results it
+    would collect first.
+    """
+    records = all_records() if records is None else records
+    processed = load_processed_videos()["videos"] if processed is None else processed
+    collected = finished_stages()
+
+    resumable = []
+    for record in records:
+        video_id = record["video"]["video_id"]
+        if record["stage"] == "sent" or abandoned(record) or video_id in processed:
+            continue
+        stage = collected.get(video_id)
+        if stage and not reached(record, stage):
+            record = {**record, "stage": stage}
+        resumable.append(record)
+    return resumable
+
+
+def plan_run(budget=None):
+    """
+    Estimate the next run, stage by stage. Nothing is fetched or sent.
+    """
+    budget = budget or RunBudget()
+    records = all_records()
+    processed = load_processed_videos()["videos"]
+    history = channel_history(records=records, processed=processed)
+    unfinished = resumable_records(records, processed)
+
+    # A channel's latest upload is usually the video being resumed, not another new one
+    resumed_handles = {r["video"].get("channel_handle") for r in unfinished}
+    for handle in resumed_handles & history.keys():
+        history[handle] = {**history[handle], "new_per_run": 0.0}
+
+    expected_new = sum(h["new_per_run"] for h in history.values())
+    uncached = sum(1 for h in history.values() if not h["cached"])
+    needs_transcript = [r for r in unfinished if not reached(r, "transcribed")]
+    needs_article = [r for r in unfinished if reached(r, "transcribed") and not reached(r, "written")]
+    ready = [r for r in unfinished if reached(r, "written")]
+
+    # Expected new videos, weighted by how often each channel posts
+    new_transcript_words = sum(h["new_per_run"] * h["transcript_words"] for h in history.values())
+    new_article_words = sum(h["new_per_run"] * h["article_words"] for h in history.values())
+    saved_transcript_words = sum(_words(r["video"].get("transcript")) for r in needs_article)
+    transcribes = expected_new + len(needs_transcript)
+    writes = transcribes + len(needs_article)
+    articles = writes + len(ready)
+
+    discover_calls = len(CHANNELS) + uncached
+    write_seconds = (
+        sum(h["new_per_run"] * budget.write_seconds(h["transcript_words"]) for h in history.values())
+        + sum(budget.write_seconds(DEFAULT_TRANSCRIPT_WORDS) for _ in needs_transcript)
+        + sum(budget.write_seconds(_words(r["video"].get("transcript"))) for r in needs_article)
+    )
+
+    stages = [
+        {
+            "stage": "discover",
+            "items": len(CHANNELS),
+            "quota_units": discover_calls * QUOTA_PER_CALL,
+            "seconds": discover_calls * DISCOVERY_SECONDS_PER_CALL + len(CHANNELS) * SHORTS_CHECK_SECONDS,
+        },
+        {
+            "stage": "transcribe",
+            "items": transcribes,
+            "supadata_calls": transcribes,
+            "seconds": transcribes * budget.stats["transcribe"]["seconds"],
+        },
+        {
+            "stage": "write",
+            "items": writes,
+            "input_tokens": (
+                writes * PROMPT_TOKENS
+                + (new_transcript_words + len(needs_transcript) * DEFAULT_TRANSCRIPT_WORDS
+                   + saved_transcript_words) * TOKENS_PER_WORD
+            ),
+            "output_tokens": (
+                new_article_words + (writes - expected_new) * DEFAULT_ARTICLE_WORDS
+            ) * TOKENS_PER_WORD,
+            "seconds": write_seconds,
+        },
+        {
+            "stage": "send",
+            "items": articles,
+            "emails_queued": len(pending_messages()),
+            "seconds": budget.reserve,
+        },
+    ]
+
+    return {
+        "channels": len(CHANNELS),
+        "expected_new_videos": expected_new,
+        "resumed_videos": len(unfinished),
+        "stages": stages,
+        "seconds": sum(s["seconds"] for s in stages),
+        "budget_seconds": budget.seconds,
+    }
+
+
+def explain(budget_minutes=RUN_BUDGET_MINUTES):
+    """
+    Print the plan for the next run.
+    """
+    budget = RunBudget(float(budget_minutes) * 60 if budget_minutes else None)
+    plan = plan_run(budget)
+
+    print("=" * 60)
+    print("  RUN PLAN (nothing will be fetched or sent)")
+    print("=" * 60)
+    print(f"  Channels: {plan['channels']}  |  expected new videos: "
+          f"{plan['expected_new_videos']:.1f}  |  resumed: {plan['resumed_videos']}\n")
+
+    for stage in plan["stages"]:
+        costs = []
+        if "quota_units" in stage:
+            costs.append(f"{stage['quota_units']} YouTube quota units")
+        if "supadata_calls" in stage:
+            costs.append(f"{stage['supadata_calls']:.0f} Supadata calls")
+        if "input_tokens" in stage:
+            costs.append(f"~{stage['input_tokens']:,.0f} in / ~{stage['output_tokens']:,.0f} out tokens")
+        if stage.get("emails_queued"):
+            costs.append(f"{stage['emails_queued']} email(s) already queued")
+        print(f"  {stage['stage']:<11} {stage['items']:>6.1f} items  ~{stage['seconds']:>6.0f}s  "
+              f"{', '.join(costs)}")
+
+    print(f"\n  Estimated total: ~{plan['seconds'] / 60:.1f} min")
+    if plan["budget_seconds"]:
+        if plan["seconds"] > plan["budget_seconds"]:
+            print(f"  ⚠ Over the {plan['budget_seconds'] / 60:.0f} min budget - "
+                  f"some videos will be left for the next run")
+        else:
+            print(f"  ✓ Fits in the {plan['budget_seconds'] / 60:.0f} min budget")
+    print("=" * 60)
+
+    return plan
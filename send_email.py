@@ -3,31 +3,65 @@ Part 4: Send Newsletter via Email
 Sends the generated articles as a nicely formatted email newsletter with EPUB attachment.
 """
 
+import io
 import os
+import json
+import uuid
 import smtplib
-import markdown
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
 from datetime import datetime
-from dotenv import load_dotenv
-from ebooklib import epub
+from env import load_env
+from render_cache import render_article, render_articles
+from newsletter_template import write_newsletter_html, EPUB_ATTACHED_NOTE, EPUB_SEPARATE_NOTE
+from size_governor import plan_digest, minify_html
+from smtp_stream import SMTPConnectionPool
+from outbox import enqueue_message, drain_outbox, pending_messages
+from archive_store import add_newsletter
 
 # Load your credentials
-load_dotenv()
+load_env()
 GMAIL_ADDRESS = os.getenv("GMAIL_ADDRESS")
 GMAIL_APP_PASSWORD = os.getenv("GMAIL_APP_PASSWORD")
 
+# Mail server (defaults to Gmail; point at a local SMTP server for testing)
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "465"))
+SMTP_USE_SSL = os.getenv("SMTP_USE_SSL", "true").lower() != "false"
+
+# Distribution list (optional) and how many connections to send it over
+RECIPIENTS_FILE = os.path.join(os.path.dirname(__file__), "recipients.json")
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "3"))
+
+
+def connect_smtp():
+    """
+    Open an SMTP connection and log in (login is skipped if no password is set,
+    e.g. for a local test server).
+    """
+    if SMTP_USE_SSL:
+        server = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT)
+    else:
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT)
+
+    if GMAIL_APP_PASSWORD:
+        server.login(GMAIL_ADDRESS, GMAIL_APP_PASSWORD)
+
+    return server
+
 
 def create_epub(articles):
     """
     Create an EPUB ebook from the articles for reading on mobile devices.
-    Returns the path to the generated EPUB file.
+    The book is built entirely in memory - nothing is written to disk.
+    Returns (filename, epub_bytes).
     """
     today = datetime.now().strftime("%B %d, %Y")
     filename = f"youtube_digest_{datetime.now().strftime('%Y%m%d')}.epub"
-    filepath = os.path.join(os.path.dirname(__file__), filename)
+
+    from ebooklib import epub  # slow to import, so only when a book is built
 
     # Create the ebook
     book = epub.EpubBook()
@@ -82,10 +116,9 @@ def create_epub(articles):
 
     chapters = []
 
-    # Create a chapter for each article
-    for i, article in enumerate(articles):
-        # Convert markdown to HTML
-        article_html = markdown.markdown(article['article'])
+    # Create a chapter for each article (markdown is rendered once, in render_cache)
+    for i, (article, fragment) in enumerate(zip(articles, render_articles(articles))):
+        article_html = fragment['html']
 
         chapter_content = f"""
         <html>
@@ -123,189 +156,158 @@ def create_epub(articles):
     # Set the reading order
     book.spine = ["nav"] + chapters
 
-    # Write the EPUB file
-    epub.write_epub(filepath, book)
+    # Write the EPUB into an in-memory buffer
+    buffer = io.BytesIO()
+    epub.write_epub(buffer, book)
 
     print(f"  ✓ Created EPUB: {filename}")
-    return filepath
+    return filename, buffer.getvalue()
 
 
-def create_newsletter_html(articles):
+def create_newsletter_html(articles, epub_note=EPUB_ATTACHED_NOTE):
     """
     Create a beautifully formatted HTML newsletter from the articles.
     Uses larger fonts for better readability.
     """
     today = datetime.now().strftime("%B %d, %Y")
 
-    html = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <style>
-            body {{
-                font-family: Georgia, serif;
-                font-size: 18px;
-                max-width: 700px;
-                margin: 0 auto;
-                padding: 20px;
-                background-color: #f9f9f9;
-                color: #333;
-            }}
-            .header {{
-                text-align: center;
-                padding: 30px 0;
-                border-bottom: 3px solid #333;
-                margin-bottom: 30px;
-            }}
-            .header h1 {{
-                margin: 0;
-                font-size: 32px;
-                letter-spacing: 2px;
-            }}
-            .header p {{
-                color: #666;
-                font-size: 18px;
-                margin: 10px 0 0 0;
-            }}
-            .article {{
-                background: white;
-                padding: 30px;
-                margin-bottom: 30px;
-                border-radius: 5px;
-                box-shadow: 0 2px 5px rgba(0,0,0,0.1);
-            }}
-            .article-intro {{
-                background: #f8f8f8;
-                padding: 15px 20px;
-                border-left: 4px solid #666;
-                margin-bottom: 25px;
-                font-size: 16px;
-                color: #555;
-                line-height: 1.6;
-            }}
-            .article-content {{
-                font-size: 18px;
-                line-height: 1.9;
-            }}
-            .article-content h1 {{
-                color: #222;
-                font-size: 26px;
-                margin-top: 25px;
-            }}
-            .article-content h2 {{
-                color: #222;
-                font-size: 22px;
-                margin-top: 25px;
-            }}
-            .article-content h3 {{
-                color: #222;
-                font-size: 20px;
-                margin-top: 25px;
-            }}
-            .article-content p {{
-                font-size: 18px;
-                margin-bottom: 1em;
-            }}
-            .watch-link {{
-                display: inline-block;
-                margin-top: 20px;
-                padding: 12px 24px;
-                background: #ff0000;
-                color: white !important;
-                text-decoration: none;
-                border-radius: 5px;
-                font-size: 16px;
-            }}
-            .footer {{
-                text-align: center;
-                color: #999;
-                font-size: 14px;
-                padding: 20px;
-            }}
-            .epub-note {{
-                text-align: center;
-                background: #e8f4e8;
-                padding: 15px;
-                border-radius: 5px;
-                margin-bottom: 30px;
-                font-size: 16px;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="header">
-            <h1>YOUR YOUTUBE DIGEST</h1>
-            <p>{today}</p>
-        </div>
-        <div class="epub-note">
-            📚 EPUB ebook attached - open on your phone's ebook reader!
-        </div>
+    html = io.StringIO()
+    write_newsletter_html(html, today, articles, render_articles(articles), epub_note)
+
+    return html.getvalue()
+
+
+def save_newsletter_archive(html_content, epub_bytes, articles):
+    """
+    Save a copy of the newsletter for viewing in the archive.
     """
+    add_newsletter(html_content, epub_bytes, articles)
+    print(f"  ✓ Saved newsletter to archive")
 
-    for article in articles:
-        # Convert markdown article to HTML
-        article_html = markdown.markdown(article['article'])
 
-        html += f"""
-        <div class="article">
-            <div class="article-intro">
-                <em>This article is based on the video "<strong>{article['title']}</strong>" from the YouTube channel <strong>{article['channel']}</strong>.</em>
-            </div>
-            <div class="article-content">
-                {article_html}
-            </div>
-            <a href="{article['url']}" class="watch-link">Watch the original video</a>
-        </div>
-        """
+def build_newsletter_parts(articles, epub_separate=False, label=""):
+    """
+    Build the parts of the email that are the same for every recipient:
+    the text/HTML body and the EPUB attachment.
+    """
+    epub_note = EPUB_SEPARATE_NOTE if epub_separate else EPUB_ATTACHED_NOTE
 
-    html += """
-        <div class="footer">
-            Generated by YouTube Newsletter Bot
-        </div>
-    </body>
-    </html>
+    # Create EPUB ebook
+    print("  Creating EPUB ebook...")
+    epub_filename, epub_bytes = create_epub(articles)
+
+    # Create the body part (alternative for text/html)
+    # A fixed boundary lets the same body be shared by several messages
+    body = MIMEMultipart("alternative", boundary=f"=============={uuid.uuid4().hex}==")
+
+    # Create HTML content (minified - every byte counts against the size limit)
+    html_content = minify_html(create_newsletter_html(articles, epub_note))
+
+    # Create plain text version (simple fallback)
+    text_content = "Your YouTube Newsletter\n\n"
+    text_content += f"{epub_note}\n\n"
+    text_content += "".join(fragment["text"] for fragment in render_articles(articles))
+
+    # Attach both text versions to body
+    body.attach(MIMEText(text_content, "plain"))
+    body.attach(MIMEText(html_content, "html"))
+
+    # Attach EPUB (straight from memory)
+    print("  Attaching EPUB file...")
+    attachment = MIMEBase("application", "epub+zip")
+    attachment.set_payload(epub_bytes)
+    encoders.encode_base64(attachment)
+    attachment.add_header(
+        "Content-Disposition",
+        f"attachment; filename={epub_filename}"
+    )
+
+    return {
+        "body": body,
+        "attachment": attachment,
+        "html": html_content,
+        "epub_bytes": epub_bytes,
+        "articles": articles,
+        "epub_separate": epub_separate,
+        "label": label,
+    }
+
+
+def build_newsletter_edition(articles):
+    """
+    Build every email needed for a set of articles. Usually that's one email,
+    but the size governor may split the digest into numbered parts or move
+    the EPUB into its own email to stay under MAX_MESSAGE_BYTES.
+    Returns a list of shared parts, one per newsletter email.
     """
+    plan = plan_digest(articles, render_articles(articles))
 
-    return html
+    if len(plan) > 1:
+        print(f"  ⚠ Digest too large for one email - splitting into {len(plan)} parts")
+    elif plan[0]["epub"] == "separate":
+        print("  ⚠ Digest too large with the EPUB attached - sending the EPUB separately")
 
+    edition = []
+    for i, part in enumerate(plan):
+        label = f" (Part {i + 1} of {len(plan)})" if len(plan) > 1 else ""
+        edition.append(build_newsletter_parts(
+            part["articles"],
+            epub_separate=part["epub"] == "separate",
+            label=label,
+        ))
+    return edition
 
-def save_newsletter_archive(html_content, epub_path, articles):
+
+def build_newsletter_message(parts, recipient_email):
     """
-    Save a copy of the newsletter for viewing in the archive.
+    Wrap the shared parts into an email addressed to one recipient.
     """
-    newsletters_dir = os.path.join(os.path.dirname(__file__), "newsletters")
-    os.makedirs(newsletters_dir, exist_ok=True)
-
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    date_display = datetime.now().strftime("%B %d, %Y")
-
-    # Save HTML
-    html_path = os.path.join(newsletters_dir, f"newsletter_{timestamp}.html")
-    with open(html_path, "w") as f:
-        f.write(html_content)
-
-    # Copy EPUB
-    import shutil
-    epub_archive_path = os.path.join(newsletters_dir, f"newsletter_{timestamp}.epub")
-    shutil.copy(epub_path, epub_archive_path)
-
-    # Save metadata
-    metadata = {
-        "date": date_display,
-        "timestamp": timestamp,
-        "article_count": len(articles),
-        "channels": [a["channel"] for a in articles],
-        "titles": [a["title"] for a in articles],
-        "html_file": f"newsletter_{timestamp}.html",
-        "epub_file": f"newsletter_{timestamp}.epub"
-    }
+    # Create the email (mixed type for attachments)
+    msg = MIMEMultipart("mixed")
+    msg["Subject"] = f"Your YouTube Digest - {datetime.now().strftime('%B %d, %Y')}{parts['label']}"
+    msg["From"] = GMAIL_ADDRESS
+    msg["To"] = recipient_email
 
-    metadata_path = os.path.join(newsletters_dir, f"newsletter_{timestamp}.json")
-    import json
-    with open(metadata_path, "w") as f:
-        json.dump(metadata, f, indent=2)
+    msg.attach(parts["body"])
+    if not parts["epub_separate"]:
+        msg.attach(parts["attachment"])
 
-    print(f"  ✓ Saved newsletter to archive")
+    return msg
+
+
+def build_epub_message(parts, recipient_email):
+    """
+    An email carrying just the EPUB, for digests too big to attach it to.
+    """
+    msg = MIMEMultipart("mixed")
+    msg["Subject"] = f"Your YouTube Digest - {datetime.now().strftime('%B %d, %Y')}{parts['label']} (EPUB)"
+    msg["From"] = GMAIL_ADDRESS
+    msg["To"] = recipient_email
+
+    msg.attach(MIMEText("The ebook edition of your YouTube Digest is attached.\n", "plain"))
+    msg.attach(parts["attachment"])
+
+    return msg
+
+
+def build_newsletter_messages(edition, recipient_email):
+    """
+    All the emails one recipient gets for an edition, in sending order.
+    """
+    messages = []
+    for parts in edition:
+        messages.append(build_newsletter_message(parts, recipient_email))
+        if parts["epub_separate"]:
+            messages.append(build_epub_message(parts, recipient_email))
+    return messages
+
+
+def archive_edition(edition):
+    """
+    Save each email of an edition to the archive.
+    """
+    for parts in edition:
+        save_newsletter_archive(parts["html"], parts["epub_bytes"], parts["articles"])
 
 
 def send_newsletter(articles, recipient_email=None):
@@ -323,69 +325,155 @@ def send_newsletter(articles, recipient_email=None):
 
     print(f"\nPreparing newsletter for {recipient_email}...")
 
-    # Create EPUB ebook
-    print("  Creating EPUB ebook...")
-    epub_path = create_epub(articles)
-
-    # Create the email (mixed type for attachments)
-    msg = MIMEMultipart("mixed")
-    msg["Subject"] = f"Your YouTube Digest - {datetime.now().strftime('%B %d, %Y')}"
-    msg["From"] = GMAIL_ADDRESS
-    msg["To"] = recipient_email
+    edition = build_newsletter_edition(articles)
+    messages = build_newsletter_messages(edition, recipient_email)
 
-    # Create the body part (alternative for text/html)
-    body = MIMEMultipart("alternative")
+    # Queue the email first - once it's safely on disk the articles can't be lost,
+    # even if Gmail is having a bad day
+    try:
+        for msg in messages:
+            enqueue_message(msg, GMAIL_ADDRESS, recipient_email)
+    except OSError as e:
+        print(f"✗ Failed to queue email: {e}")
+        return False
+    print(f"  ✓ Queued {len(messages)} email(s) in outbox")
 
-    # Create HTML content
-    html_content = create_newsletter_html(articles)
+    # Save to archive
+    archive_edition(edition)
 
-    # Create plain text version (simple fallback)
-    text_content = "Your YouTube Newsletter\n\n"
-    text_content += "📚 EPUB ebook attached - open on your phone's ebook reader!\n\n"
-    for article in articles:
-        text_content += f"--- {article['channel']} ---\n"
-        text_content += f"{article['article']}\n"
-        text_content += f"Watch: {article['url']}\n\n"
+    # Deliver it (plus anything still waiting from earlier runs)
+    print("  Sending email...")
+    stats = deliver_outbox()
+    if stats["remaining"]:
+        print("⚠ Email not delivered yet - it stays in the outbox and will be retried on the next run")
+    else:
+        print("✓ Newsletter sent successfully with EPUB attachment!")
 
-    # Attach both text versions to body
-    body.attach(MIMEText(text_content, "plain"))
-    body.attach(MIMEText(html_content, "html"))
+    return True
 
-    # Add body to message
-    msg.attach(body)
 
-    # Attach EPUB file
-    print("  Attaching EPUB file...")
-    with open(epub_path, "rb") as attachment:
-        part = MIMEBase("application", "epub+zip")
-        part.set_payload(attachment.read())
-        encoders.encode_base64(part)
-        part.add_header(
-            "Content-Disposition",
-            f"attachment; filename={os.path.basename(epub_path)}"
-        )
-        msg.attach(part)
+def deliver_outbox(pool_size=SMTP_POOL_SIZE, due_only=True):
+    """
+    Send everything waiting in the outbox over a small connection pool.
+    Messages still backing off from a failed attempt wait unless due_only=False.
+    """
+    pending = pending_messages(due_only=due_only)
+    if not pending:
+        return {"sent": 0, "failed": 0, "remaining": 0, "bytes_sent": 0, "seconds": 0.0}
 
+    pool = SMTPConnectionPool(connect_smtp, size=min(pool_size, len(pending)))
     try:
-        # Connect to Gmail and send
-        print("  Sending email...")
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-            server.login(GMAIL_ADDRESS, GMAIL_APP_PASSWORD)
-            server.sendmail(GMAIL_ADDRESS, recipient_email, msg.as_string())
+        stats = drain_outbox(pool, due_only=due_only)
+    finally:
+        pool.close()
 
-        print("✓ Newsletter sent successfully with EPUB attachment!")
+    print(f"  Delivered {stats['sent']} of {len(pending)} queued email(s) "
+          f"({stats['bytes_sent'] / 1024:.0f} KB in {stats['seconds']:.1f}s)")
+    return stats
 
-        # Save to archive before cleaning up
-        save_newsletter_archive(html_content, epub_path, articles)
 
-        # Clean up EPUB file
-        os.remove(epub_path)
+def load_recipients():
+    """
+    Load the distribution list from recipients.json, or None if there isn't one.
 
-        return True
+    Format - a list of recipients, each optionally limited to some channels:
+        [
+          {"email": "me@example.com"},
+          {"email": "team@example.com", "channels": ["Latent Space", "No Priors"]}
+        ]
+    """
+    if not os.path.exists(RECIPIENTS_FILE):
+        return None
+    with open(RECIPIENTS_FILE, "r") as f:
+        return json.load(f)
 
-    except Exception as e:
-        print(f"✗ Failed to send email: {e}")
-        return False
+
+def articles_for_recipient(articles, recipient):
+    """
+    Pick the articles a recipient asked for (all of them if no channel filter).
+    """
+    wanted = {c.lower() for c in recipient.get("channels") or []}
+    if not wanted:
+        return articles
+
+    return [
+        a for a in articles
+        if any(c.lower() in wanted for c in a.get("channels", [a["channel"]]))
+    ]
+
+
+def send_newsletter_to_recipients(articles, recipients, pool_size=SMTP_POOL_SIZE):
+    """
+    Send the newsletter to a whole distribution list.
+
+    Recipients with the same channel filter share one rendered body and EPUB,
+    and messages go out over a small pool of reused, logged-in connections.
+    Every email is queued in the outbox before delivery is attempted.
+    Returns a dict with queued (emails put in the outbox), sent/failed (delivery
+    attempts this drain), skipped (recipients with nothing to get) and throughput.
+    """
+    if not articles:
+        print("No articles to send!")
+        return {"queued": 0, "sent": 0, "failed": 0, "skipped": len(recipients)}
+
+    print(f"\nPreparing newsletter for {len(recipients)} recipients...")
+
+    # Build each distinct article selection once
+    editions = {}
+    jobs = []
+    skipped = 0
+    for recipient in recipients:
+        selected = articles_for_recipient(articles, recipient)
+        if not selected:
+            print(f"  ⏭ Nothing for {recipient['email']} this time")
+            skipped += 1
+            continue
+
+        key = tuple(render_article(a)["key"] for a in selected)
+        if key not in editions:
+            editions[key] = build_newsletter_edition(selected)
+        jobs.append((recipient["email"], key))
+
+    # Queue every email first, so delivery problems never cost us the articles
+    queued = queued_recipients = 0
+    queued_editions = set()
+    for email_address, key in jobs:
+        try:
+            for msg in build_newsletter_messages(editions[key], email_address):
+                enqueue_message(msg, GMAIL_ADDRESS, email_address)
+                queued += 1
+        except OSError as e:
+            print(f"  ✗ Failed to queue email for {email_address}: {e}")
+            continue
+        queued_recipients += 1
+        queued_editions.add(key)
+    print(f"  ✓ Queued {queued} email(s) for {queued_recipients} recipient(s) in outbox")
+
+    print(f"  Sending over {pool_size} connection(s)...")
+    delivery = deliver_outbox(pool_size=pool_size)
+    stats = {
+        "queued": queued,
+        "sent": delivery["sent"],
+        "failed": delivery["failed"],
+        "remaining": delivery["remaining"],
+        "skipped": skipped,
+        "bytes_sent": delivery["bytes_sent"],
+        "seconds": delivery["seconds"],
+        "per_second": delivery["sent"] / delivery["seconds"] if delivery["seconds"] else 0.0,
+    }
+
+    print(f"  Sent {stats['sent']}, failed {stats['failed']}, skipped {stats['skipped']} "
+          f"in {stats['seconds']:.1f}s ({stats['per_second']:.1f} emails/s, "
+          f"{stats['bytes_sent'] / 1024 / 1024:.1f} MB)")
+
+    if queued_editions:
+        if not stats["remaining"]:
+            print("✓ Newsletter sent successfully with EPUB attachment!")
+        # Archive what went out once: the queued edition with the most articles
+        # (the full one, if anyone gets every article), reusing its EPUB
+        archive_edition(editions[max(queued_editions, key=len)])
+
+    return stats
 
 
 # Test it standalone
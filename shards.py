@@ -0,0 +1,130 @@
+"""
+Shards: Split the channel list across parallel runs, then merge once.
+With many channels, one run can't get through them all within a CI job's
+time limit. Each shard run takes a fixed slice of CHANNELS (by a stable hash
+of the handle, so a channel always lands in the same shard), writes its
+articles and tracker changes to shards/, and sends nothing:
+
+    python main.py --shard 0/4      # ... up to --shard 3/4, in parallel
+    python main.py --merge          # combine, dedupe, render and send once
+
+The merge step dedupes across shards (a cross-posted interview may have been
+found by two of them), sends a single newsletter and marks everything as
+processed.
+"""
+
+import os
+import glob
+import json
+import zlib
+from datetime import datetime
+
+from get_videos import CHANNELS, load_channel_cache
+
+# Partial results, one file per shard
+SHARDS_DIR = os.path.join(os.path.dirname(__file__), "shards")
+
+# Bump this when the shard file format changes
+SHARD_VERSION = 1
+
+
+def parse_shard(text):
+    """
+    "2/4" -> (2, 4). Shards are numbered from 0.
+    """
+    index, _, count = text.partition("/")
+    index, count = int(index), int(count)
+    if not 0 <= index < count:
+        raise ValueError(f"Shard {text!r} should look like i/n with 0 <= i < n")
+    return index, count
+
+
+def shard_of(channel_handle, count):
+    """
+    Which of `count` shards a channel belongs to. Stable across runs and machines
+    (unlike Python's hash(), which changes per process).
+    """
+    return zlib.crc32(channel_handle.lower().encode("utf-8")) % count
+
+
+def shard_channels(shard, channels=None):
+    """
+    The channels one shard is responsible for, in channel-list order.
+    """
+    index, count = shard
+    return [h for h in (CHANNELS if channels is None else channels) if shard_of(h, count) == index]
+
+
+def owns_video(shard, video):
+    """
+    Does this shard handle the video? (Used for videos resumed from an
+    earlier run; ones saved before channel handles were recorded go to shard 0.)
+    """
+    index, count = shard
+    handle = video.get("channel_handle")
+    return (shard_of(handle, count) if handle else 0) == index
+
+
+def _shard_file(shard):
+    index, count = shard
+    return os.path.join(SHARDS_DIR, f"shard-{index}-of-{count}.json")
+
+
+def save_shard(shard, articles, videos, tracker_delta):
+    """
+    Write one shard's partial results: its articles, the videos to mark as
+    processed once they're sent, videos it already marked (e.g. ones covered
+    in an earlier newsletter), and the channel lookups it made.
+    """
+    channel_cache = load_channel_cache()
+    result = {
+        "version": SHARD_VERSION,
+        "shard": list(shard),
+        "created_at": datetime.now().isoformat(),
+        "articles": articles,
+        "videos": [{k: v for k, v in video.items() if k != "minhash"} for video in videos],
+        "tracker_delta": tracker_delta,
+        "channel_cache": {h: channel_cache[h] for h in shard_channels(shard) if h in channel_cache},
+    }
+
+    os.makedirs(SHARDS_DIR, exist_ok=True)
+    path = _shard_file(shard)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(result, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_shards():
+    """
+    Every shard result in shards/, in shard order. Warns about missing shards.
+    """
+    shards = []
+    for path in sorted(glob.glob(os.path.join(SHARDS_DIR, "shard-*-of-*.json"))):
+        with open(path, "r") as f:
+            result = json.load(f)
+        if result.get("version") != SHARD_VERSION:
+            print(f"  ⚠ Ignoring {os.path.basename(path)} (written by a different version)")
+            continue
+        result["path"] = path
+        shards.append(result)
+
+    shards.sort(key=lambda s: s["shard"])
+    counts = {s["shard"][1] for s in shards}
+    if len(counts) > 1:
+        print(f"  ⚠ Shard results from different splits: {sorted(counts)}")
+    for count in counts:
+        missing = set(range(count)) - {s["shard"][0] for s in shards if s["shard"][1] == count}
+        if missing:
+            print(f"  ⚠ Missing shard(s) {', '.join(f'{i}/{count}' for i in sorted(missing))} - "
+                  f"their channels wait for the next run")
+    return shards
+
+
+def remove_shards(shards):
+    """
+    Delete merged shard files, so a second merge can't send them again.
+    """
+    for result in shards:
+        os.remove(result["path"])
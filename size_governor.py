@@ -0,0 +1,114 @@
+"""
+Size Governor: Keep each email under the mail provider's size limit.
+Estimates how big the finished message will be before anything is sent, and if
+it's over budget, moves the EPUB into its own email or splits the digest into
+numbered parts. Also squeezes unneeded whitespace out of the HTML.
+"""
+
+import os
+import re
+import zlib
+
+# Largest message we're willing to send (Gmail rejects anything over 25 MB,
+# including encoding overhead, so leave some headroom)
+MAX_MESSAGE_BYTES = int(os.getenv("MAX_MESSAGE_BYTES", str(20 * 1024 * 1024)))
+
+# Headers, MIME boundaries and the fixed newsletter layout (CSS etc.)
+MESSAGE_OVERHEAD_BYTES = 16 * 1024
+
+# Container files, navigation and CSS inside every EPUB
+EPUB_OVERHEAD_BYTES = 8 * 1024
+
+# <pre>/<textarea> contents are whitespace-sensitive - leave them alone
+_PRESERVE = re.compile(r"(<(pre|textarea)\b.*?</\2>)", re.DOTALL | re.IGNORECASE)
+_COMMENT = re.compile(r"<!--(?!\[if).*?-->", re.DOTALL)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def minify_html(html):
+    """
+    Best-effort HTML minification: drop comments and collapse whitespace,
+    except inside <pre> and <textarea>.
+    """
+    pieces = _PRESERVE.split(html)
+    out = []
+    # split() with 2 groups yields: text, preserved block, tag name, text, ...
+    for i in range(0, len(pieces), 3):
+        text = _COMMENT.sub("", pieces[i])
+        text = _WHITESPACE.sub(" ", text)
+        out.append(text)
+        if i + 1 < len(pieces):
+            out.append(pieces[i + 1])
+    return "".join(out).strip()
+
+
+def _encoded(size):
+    """
+    Size after base64 encoding with 76-character lines (CRLF-terminated).
+    """
+    encoded = (size + 2) // 3 * 4
+    return encoded + (encoded // 76 + 1) * 2
+
+
+def estimate_article_bytes(fragment):
+    """
+    Estimate how many bytes an article adds to the email body and to the EPUB.
+    """
+    html = fragment["html"].encode("utf-8")
+    text = fragment["text"].encode("utf-8")
+    return {
+        "body": _encoded(len(html) + len(text)),
+        # Chapters are deflated inside the EPUB
+        "epub": _encoded(len(zlib.compress(html, 6))),
+    }
+
+
+def estimate_message_bytes(sizes, with_epub=True):
+    """
+    Estimate the full size of an email carrying the given articles.
+    """
+    total = MESSAGE_OVERHEAD_BYTES + sum(s["body"] for s in sizes)
+    if with_epub:
+        total += EPUB_OVERHEAD_BYTES + sum(s["epub"] for s in sizes)
+    return total
+
+
+def plan_digest(articles, fragments, budget=None):
+    """
+    Decide how to package a digest so every email fits in the byte budget.
+
+    Returns a list of parts, each {"articles": [...], "epub": "attached" | "separate"}.
+    One part with the EPUB attached is the normal case.
+    """
+    budget = budget or MAX_MESSAGE_BYTES
+    sizes = [estimate_article_bytes(f) for f in fragments]
+
+    # Everything fits in one email
+    if estimate_message_bytes(sizes) <= budget:
+        return [{"articles": list(articles), "epub": "attached"}]
+
+    # The articles fit, and so does the EPUB on its own - send it separately
+    epub_only = EPUB_OVERHEAD_BYTES + MESSAGE_OVERHEAD_BYTES + sum(s["epub"] for s in sizes)
+    if estimate_message_bytes(sizes, with_epub=False) <= budget and epub_only <= budget:
+        return [{"articles": list(articles), "epub": "separate"}]
+
+    # Split into numbered parts, packing articles in order
+    parts = []
+    current, current_sizes = [], []
+    for article, size in zip(articles, sizes):
+        if current and estimate_message_bytes(current_sizes + [size]) > budget:
+            parts.append((current, current_sizes))
+            current, current_sizes = [], []
+        current.append(article)
+        current_sizes.append(size)
+    if current:
+        parts.append((current, current_sizes))
+
+    # A single huge article may still need its EPUB in a separate email
+    return [
+        {
+            "articles": part_articles,
+            "epub": "attached" if estimate_message_bytes(part_sizes) <= budget else "separate",
+        }
+        for part_articles, part_sizes in parts
+    ]
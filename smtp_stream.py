@@ -0,0 +1,224 @@
+"""
+SMTP Streaming: Send an email without building it as one big string first.
+smtplib's sendmail() needs the whole message in memory (text, HTML and the
+base64 EPUB), copied a few times over. Here the MIME tree is serialized piece
+by piece straight onto the SMTP connection, and we report how much went over the
+wire and how long it took.
+"""
+
+import re
+import time
+import queue
+import smtplib
+import threading
+from email.message import Message
+from email.generator import BytesGenerator
+from tracing import span
+
+# How much serialized message to buffer before writing to the socket
+CHUNK_SIZE = 64 * 1024
+
+# Any line ending (bare \n or \r) → CRLF, as SMTP requires
+_LINE_ENDINGS = re.compile(rb"\r\n|\n|\r(?!\n)")
+
+# Lines starting with "." must be doubled so they don't end the DATA section
+_LEADING_DOT = re.compile(rb"(?m)^\.")
+
+
+class _DataWriter:
+    """
+    File-like object the MIME generator writes into. Normalizes line endings,
+    dot-stuffs lines, and sends complete lines to the server in chunks.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.pending = b""
+        self.buffer = []
+        self.buffered = 0
+        self.bytes_sent = 0
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("ascii", "surrogateescape")
+
+        data = self.pending + data
+
+        # Hold back a trailing partial line (and a lone \r that may be half of \r\n)
+        cut = max(data.rfind(b"\n"), data.rfind(b"\r", 0, len(data) - 1)) + 1
+        self.pending = data[cut:]
+        if cut:
+            self._queue(data[:cut])
+
+    def _queue(self, lines):
+        lines = _LEADING_DOT.sub(b"..", _LINE_ENDINGS.sub(b"\r\n", lines))
+        self.buffer.append(lines)
+        self.buffered += len(lines)
+        if self.buffered >= CHUNK_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if self.buffer:
+            chunk = b"".join(self.buffer)
+            self.server.send(chunk)
+            self.bytes_sent += len(chunk)
+            self.buffer = []
+            self.buffered = 0
+
+    def close(self):
+        """
+        Send whatever is left, then the end-of-data marker.
+        """
+        if self.pending:
+            self._queue(self.pending + b"\r\n")
+            self.pending = b""
+        self.buffer.append(b".\r\n")
+        self._flush()
+
+
+def send_message_streaming(server, msg, from_addr, to_addrs):
+    """
+    Send a MIME message over an open, logged-in SMTP connection,
+    serializing it incrementally onto the socket.
+    `msg` can also be a binary file holding an already-serialized message
+    (e.g. from the outbox), which is streamed from disk in chunks.
+
+    Returns a dict with bytes_sent, seconds and any refused recipients.
+    Raises the usual smtplib exceptions if the server rejects the message.
+    """
+    if isinstance(to_addrs, str):
+        to_addrs = [to_addrs]
+
+    start = time.perf_counter()
+    server.ehlo_or_helo_if_needed()
+
+    code, response = server.mail(from_addr)
+    if code != 250:
+        server.rset()
+        raise smtplib.SMTPSenderRefused(code, response, from_addr)
+
+    refused = {}
+    for addr in to_addrs:
+        code, response = server.rcpt(addr)
+        if code not in (250, 251):
+            refused[addr] = (code, response)
+    if len(refused) == len(to_addrs):
+        server.rset()
+        raise smtplib.SMTPRecipientsRefused(refused)
+
+    code, response = server.docmd("data")
+    if code != 354:
+        server.rset()
+        raise smtplib.SMTPDataError(code, response)
+
+    writer = _DataWriter(server)
+    if isinstance(msg, Message):
+        generator = BytesGenerator(writer, mangle_from_=False, policy=msg.policy.clone(linesep="\r\n"))
+        generator.flatten(msg)
+    else:
+        for chunk in iter(lambda: msg.read(CHUNK_SIZE), b""):
+            writer.write(chunk)
+    writer.close()
+
+    code, response = server.getreply()
+    if code != 250:
+        raise smtplib.SMTPDataError(code, response)
+
+    return {
+        "bytes_sent": writer.bytes_sent,
+        "seconds": time.perf_counter() - start,
+        "refused": refused,
+    }
+
+
+class SMTPConnectionPool:
+    """
+    A small pool of open, logged-in SMTP connections shared by sender threads.
+    Connections are opened on first use and reused; a connection that errors
+    is thrown away and replaced on the next send.
+    """
+
+    def __init__(self, connect, size=3):
+        self.connect = connect
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.opened = 0
+
+    def _acquire(self):
+        while True:
+            try:
+                return self.idle.get_nowait()
+            except queue.Empty:
+                pass
+
+            with self.lock:
+                if self.opened < self.size:
+                    self.opened += 1
+                    break
+
+            # Pool is full - wait for a connection to come back
+            try:
+                return self.idle.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+        try:
+            return self.connect()
+        except Exception:
+            with self.lock:
+                self.opened -= 1
+            raise
+
+    def _discard(self, server):
+        with self.lock:
+            self.opened -= 1
+        try:
+            server.close()
+        except Exception:
+            pass
+
+    def send(self, msg, from_addr, to_addrs):
+        """
+        Send one message over a pooled connection.
+        Retries once on a fresh connection if the server dropped an idle one.
+        """
+        for attempt in range(2):
+            if not isinstance(msg, Message):
+                msg.seek(0)
+            server = self._acquire()
+            try:
+                with span("smtp.send", recipients=len(to_addrs), attempt=attempt) as s:
+                    stats = send_message_streaming(server, msg, from_addr, to_addrs)
+                    s["attrs"]["bytes_sent"] = stats["bytes_sent"]
+            except smtplib.SMTPServerDisconnected:
+                self._discard(server)
+                if attempt:
+                    raise
+                continue
+            except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+                # The server refused this message, but the connection is still usable
+                self.idle.put(server)
+                raise
+            except Exception:
+                self._discard(server)
+                raise
+
+            self.idle.put(server)
+            return stats
+
+    def close(self):
+        """
+        Log out of every idle connection.
+        """
+        while True:
+            try:
+                server = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                server.quit()
+            except smtplib.SMTPException:
+                server.close()
+            with self.lock:
+                self.opened -= 1
@@ -0,0 +1,158 @@
+"""
+Stage Store: Remembers how far each video got through the pipeline.
+Every video's progress (discovered → transcribed → written → sent) is saved
+along with its transcript and article, so if a run crashes halfway, the next
+run picks each video up where it left off instead of starting over.
+"""
+
+import os
+import json
+import time
+from datetime import datetime
+
+# One JSON file per video
+STAGES_DIR = os.path.join(os.path.dirname(__file__), ".cache", "stages")
+
+# Pipeline stages, in order
+STAGES = ["discovered", "transcribed", "written", "sent"]
+
+# Records of sent videos are kept this long (for re-running stages), then removed.
+# Unsent records are removed this long after the video was first seen.
+RETENTION_DAYS = 30
+
+# Failed attempts at a stage (e.g. no transcript yet) before a video is
+# given up on and no longer resumed. Videos deferred by the run budget
+# never ran, so they don't count.
+MAX_ATTEMPTS = 3
+
+
+def _record_path(video_id):
+    return os.path.join(STAGES_DIR, f"{video_id}.json")
+
+
+def load_record(video_id):
+    """
+    Get the saved progress for a video, or None if we've never seen it.
+    """
+    path = _record_path(video_id)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def reached(record, stage):
+    """
+    Has this record made it to (at least) the given stage?
+    """
+    return record is not None and STAGES.index(record["stage"]) >= STAGES.index(stage)
+
+
+def _write_record(video_id, record):
+    os.makedirs(STAGES_DIR, exist_ok=True)
+    path = _record_path(video_id)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(record, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def save_stage(video, stage, article=None):
+    """
+    Record that a video has completed a stage, with whatever it produced.
+    """
+    now = datetime.now().isoformat()
+    record = load_record(video["video_id"]) or {"first_seen": now}
+    record["video"] = {k: v for k, v in video.items() if k != "minhash"}
+    record["stage"] = stage
+    record["updated_at"] = now
+    if article is not None:
+        record["article"] = article
+
+    _write_record(video["video_id"], record)
+
+
+def save_discovered(videos):
+    """
+    Save the videos we haven't seen before as "discovered".
+    """
+    now = datetime.now().isoformat()
+    for video in videos:
+        if load_record(video["video_id"]) is None:
+            _write_record(video["video_id"], {
+                "video": {k: v for k, v in video.items() if k != "minhash"},
+                "stage": "discovered",
+                "first_seen": now,
+                "updated_at": now,
+            })
+
+
+def record_failures(videos):
+    """
+    Note that a stage ran for these videos and failed.
+    """
+    save_discovered(videos)
+    for video in videos:
+        record = load_record(video["video_id"])
+        record["attempts"] = record.get("attempts", 0) + 1
+        _write_record(video["video_id"], record)
+
+
+def save_stages(videos, stage):
+    """
+    Record that several videos completed the same stage.
+    """
+    for video in videos:
+        save_stage(video, stage)
+
+
+def all_records():
+    """
+    Every saved record, oldest first.
+    """
+    if not os.path.isdir(STAGES_DIR):
+        return []
+
+    records = []
+    for name in os.listdir(STAGES_DIR):
+        if name.endswith(".json"):
+            with open(os.path.join(STAGES_DIR, name), "r") as f:
+                records.append(json.load(f))
+    return sorted(records, key=lambda r: r["updated_at"])
+
+
+def _age_days(record):
+    first_seen = datetime.fromisoformat(record.get("first_seen") or record["updated_at"])
+    return (datetime.now() - first_seen).total_seconds() / (24 * 60 * 60)
+
+
+def abandoned(record):
+    """
+    Has this video failed MAX_ATTEMPTS times, or been waiting RETENTION_DAYS, without being sent?
+    """
+    return record["stage"] != "sent" and (
+        record.get("attempts", 0) >= MAX_ATTEMPTS or _age_days(record) > RETENTION_DAYS
+    )
+
+
+def unfinished_videos():
+    """
+    Videos that were discovered in an earlier run but never sent (and not given up on).
+    """
+    return [r["video"] for r in all_records() if r["stage"] != "sent" and not abandoned(r)]
+
+
+def prune_records(days=RETENTION_DAYS):
+    """
+    Remove records of videos that were sent more than `days` ago, and of
+    unsent ones first seen more than `days` ago.
+    """
+    cutoff = time.time() - days * 24 * 60 * 60
+    for record in all_records():
+        path = _record_path(record["video"]["video_id"])
+        if record["stage"] == "sent":
+            expired = os.path.getmtime(path) < cutoff
+        else:
+            expired = _age_days(record) > days
+        if expired:
+            os.remove(path)
@@ -0,0 +1,266 @@
+"""
+Streaming Pipeline: Videos flow through the stages one at a time.
+Instead of waiting for every channel to be fetched before the first transcript
+starts (and every transcript before the first article), each stage runs in its
+own worker threads and hands videos to the next stage through a small queue.
+A slow channel or a long transcript only holds up that one video, and the
+newsletter is assembled as soon as the last article lands.
+
+Queues are bounded, so a fast stage waits for a slow one instead of piling up
+work in memory.
+
+    python main.py --stream
+"""
+
+import os
+import time
+import queue
+import threading
+
+from get_videos import CHANNELS, get_youtube_client, fetch_channel_video
+from get_transcripts import get_transcript
+from write_articles import write_article, article_for_video
+from render_cache import render_article
+from video_tracker import get_processed_ids, mark_videos_processed
+from dedupe_videos import new_dedupe_state, check_video, credit_channels
+from stage_store import (
+    load_record, reached, save_stage, save_stages, save_discovered, record_failures, unfinished_videos,
+)
+from shards import shard_channels, owns_video
+from run_budget import RunBudget
+from tracing import span, run_in_context
+
+# Worker threads per stage (discovery and dedupe always run one at a time)
+TRANSCRIPT_WORKERS = int(os.getenv("STREAM_TRANSCRIPT_WORKERS", "2"))
+ARTICLE_WORKERS = int(os.getenv("STREAM_ARTICLE_WORKERS", "3"))
+RENDER_WORKERS = 1
+
+# Videos waiting between two stages before the earlier stage has to pause
+QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "4"))
+
+# Pause after each Supadata request, per worker, to be nice to the API
+TRANSCRIPT_DELAY = 1
+
+# Marks the end of a queue
+_DONE = object()
+
+
+def _start_stage(name, work, inbox, outbox, workers, stats):
+    """
+    Start `workers` threads that run work(item) on everything from inbox and
+    pass each result that isn't None on to outbox. Once every worker has
+    finished, _DONE is put on outbox so the next stage knows to stop.
+    """
+    stats[name] = {"in": 0, "out": 0, "busy_seconds": 0.0}
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                # Leave it for the other workers of this stage
+                inbox.put(_DONE)
+                return
+
+            start = time.perf_counter()
+            try:
+                with span(f"stage.{name}"):
+                    result = work(item)
+            except Exception as e:
+                video = item[0] if isinstance(item, tuple) else item
+                print(f"  ✗ {name} failed for {video['title'][:50]}: {e}")
+                result = None
+
+            with lock:
+                stats[name]["in"] += 1
+                stats[name]["busy_seconds"] += time.perf_counter() - start
+                if result is not None:
+                    stats[name]["out"] += 1
+
+            if result is not None:
+                outbox.put(result)
+
+    threads = [
+        threading.Thread(target=run_in_context(worker), name=f"{name}-{i}", daemon=True)
+        for i in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    def close():
+        for thread in threads:
+            thread.join()
+        outbox.put(_DONE)
+
+    threading.Thread(target=close, name=f"{name}-close", daemon=True).start()
+
+
+def _discover(out, order, records, channels, resumed):
+    """
+    Feed new videos into the pipeline, channel by channel as they're found.
+    Unfinished videos from an earlier run go first.
+    """
+    def admit(video):
+        if video["video_id"] in order:
+            return
+        if get_processed_ids([video["video_id"]]):
+            print(f"  ⏭ Skipping (already processed): {video['title'][:50]}...")
+            return
+
+        order[video["video_id"]] = len(order)
+        record = load_record(video["video_id"])
+        save_discovered([video])
+        records[video["video_id"]] = record
+        out.put(video)
+
+    try:
+        if resumed:
+            print(f"  ↻ Resuming {len(resumed)} unfinished video(s) from an earlier run")
+        for video in resumed:
+            admit(video)
+
+        youtube = get_youtube_client()
+        for channel_handle in channels:
+            try:
+                video = fetch_channel_video(youtube, channel_handle)
+            except Exception as e:
+                print(f"  ✗ Couldn't fetch {channel_handle}: {e}\n")
+                continue
+            if video:
+                admit(video)
+    finally:
+        # Always close the queue, so the rest of the pipeline can finish
+        out.put(_DONE)
+
+
+def stream_articles(budget=None, shard=None):
+    """
+    Run discovery → transcripts → dedupe → articles → render as a streaming pipeline.
+    Returns (articles, videos_with_transcripts), in channel-list order.
+    With a shard (index, count), only that shard's channels are covered (see shards.py).
+
+    Unlike the step-by-step run, dedupe can't wait to see every transcript, so
+    the first copy of a cross-posted video to arrive is the one written up.
+    With a RunBudget, videos that no longer fit are left for the next run.
+    """
+    budget = budget or RunBudget()
+    start = time.perf_counter()
+    stats = {}
+    order = {}
+    records = {}
+    transcribed = []
+    dedupe = new_dedupe_state()
+
+    channels = CHANNELS if shard is None else shard_channels(shard)
+    resumed = [v for v in unfinished_videos() if shard is None or owns_video(shard, v)]
+
+    discovered_q = queue.Queue(QUEUE_SIZE)
+    transcribed_q = queue.Queue(QUEUE_SIZE)
+    unique_q = queue.Queue(QUEUE_SIZE)
+    written_q = queue.Queue(QUEUE_SIZE)
+    rendered_q = queue.Queue()
+
+    def transcribe(video):
+        record = records[video["video_id"]]
+        if reached(record, "transcribed"):
+            print(f"  ↻ Reusing saved transcript: {video['title'][:50]}...")
+            return record["video"]
+
+        if not budget.allows("transcribe", video):
+            return None
+
+        print(f"Getting transcript: {video['title'][:50]}...")
+        transcript = get_transcript(video["video_id"])
+        time.sleep(TRANSCRIPT_DELAY)
+        if not transcript:
+            print(f"  ✗ No transcript available: {video['title'][:50]}\n")
+            record_failures([video])
+            return None
+
+        video["transcript"] = transcript
+        print(f"  ✓ Got {len(transcript.split())} words: {video['title'][:50]}\n")
+        budget.record("transcribe", video)
+        save_stage(video, "transcribed")
+        return video
+
+    def check_duplicate(video):
+        transcribed.append(video)
+        return video if check_video(dedupe, video) else None
+
+    def write(video):
+        record = records[video["video_id"]]
+        if reached(record, "written"):
+            print(f"  ↻ Reusing saved article: {video['title'][:50]}...")
+            return video, record["article"]
+
+        if not budget.allows("write", video):
+            return None
+
+        print(f"Writing article: {video['title'][:50]}...")
+        text = write_article(video)
+        if not text:
+            print(f"  ✗ Failed to generate article: {video['title'][:50]}\n")
+            record_failures([video])
+            return None
+
+        article = article_for_video(video, text)
+        print(f"  ✓ Article generated: {video['title'][:50]}\n")
+        budget.record("write", video)
+        save_stage(video, "written", article)
+        return video, article
+
+    def render(item):
+        # Warm the render cache so assembling the newsletter is just stitching
+        render_article(item[1])
+        return item
+
+    print("Streaming videos through the pipeline...\n")
+    print("=" * 60)
+
+    discovery = threading.Thread(
+        target=run_in_context(_discover), args=(discovered_q, order, records, channels, resumed),
+        name="discover", daemon=True,
+    )
+    discovery.start()
+    _start_stage("transcribe", transcribe, discovered_q, transcribed_q, TRANSCRIPT_WORKERS, stats)
+    _start_stage("dedupe", check_duplicate, transcribed_q, unique_q, 1, stats)
+    _start_stage("write", write, unique_q, written_q, ARTICLE_WORKERS, stats)
+    _start_stage("render", render, written_q, rendered_q, RENDER_WORKERS, stats)
+
+    written = []
+    while True:
+        item = rendered_q.get()
+        if item is _DONE:
+            break
+        written.append(item)
+
+    # Duplicates found after an article was written still get credited
+    articles = []
+    for video, article in sorted(written, key=lambda item: order[item[0]["video_id"]]):
+        articles.append(credit_channels(article, video))
+
+    # Deferred videos (and their cross-posts) stay unprocessed for the next run
+    deferred = budget.deferred_ids(transcribed)
+    transcribed = sorted(
+        (v for v in transcribed if v["video_id"] not in deferred),
+        key=lambda v: order[v["video_id"]],
+    )
+
+    print("=" * 60)
+    print(f"Found {len(order)} new video(s), {len(transcribed)} transcript(s), "
+          f"{len(articles)} article(s) in {time.perf_counter() - start:.1f}s")
+    for name, stage in stats.items():
+        print(f"  {name:<11} {stage['in']:>3} in, {stage['out']:>3} out, "
+              f"{stage['busy_seconds']:.1f}s busy")
+
+    if not order:
+        print("No new videos to process. All videos have been sent before.")
+    elif not transcribed:
+        print("No transcripts available for any videos.")
+    elif not dedupe["representatives"]:
+        print("All transcripts were already covered in earlier newsletters.")
+        mark_videos_processed(transcribed)
+        save_stages(transcribed, "sent")
+        return [], []
+
+    return articles, transcribed
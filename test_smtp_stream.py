@@ -0,0 +1,172 @@
+"""
+Tests for smtp_stream: sends real messages to a socket-level stand-in SMTP
+server and checks the exact bytes it receives in the DATA section.
+
+    python -m pytest test_smtp_stream.py
+"""
+
+import io
+import socket
+import smtplib
+import threading
+import unittest
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from email.mime.application import MIMEApplication
+
+import smtp_stream
+from smtp_stream import send_message_streaming
+
+
+class FakeSMTPServer:
+    """
+    A tiny SMTP server on localhost that accepts one connection and records
+    the raw bytes of every DATA section (still dot-stuffed, as sent).
+    """
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(1)
+        self.port = self.sock.getsockname()[1]
+        self.messages = []
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        conn, _ = self.sock.accept()
+        with conn, conn.makefile("rb") as reader:
+            conn.sendall(b"220 localhost ESMTP test\r\n")
+            while True:
+                line = reader.readline()
+                if not line:
+                    return
+                command = line[:4].upper()
+                if command in (b"EHLO", b"HELO"):
+                    conn.sendall(b"250 localhost\r\n")
+                elif command in (b"MAIL", b"RCPT", b"RSET", b"NOOP"):
+                    conn.sendall(b"250 OK\r\n")
+                elif command == b"DATA":
+                    conn.sendall(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                    data = b""
+                    while not data.endswith(b"\r\n.\r\n"):
+                        chunk = reader.readline()
+                        if not chunk:
+                            return
+                        data += chunk
+                    self.messages.append(data)
+                    conn.sendall(b"250 OK: queued\r\n")
+                elif command == b"QUIT":
+                    conn.sendall(b"221 Bye\r\n")
+                    return
+                else:
+                    conn.sendall(b"502 Not implemented\r\n")
+
+    def close(self):
+        self.sock.close()
+        self.thread.join(timeout=5)
+
+
+class TrickleReader(io.RawIOBase):
+    """
+    A binary file that returns at most `step` bytes per read, so lines (and
+    \r\n pairs) straddle reads.
+    """
+
+    def __init__(self, data, step=7):
+        self.data = data
+        self.step = step
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        size = self.step if size is None or size < 0 else min(size, self.step)
+        chunk = self.data[self.position:self.position + size]
+        self.position += len(chunk)
+        return chunk
+
+
+def unstuff(data):
+    """
+    What the server recovers from a DATA section: dot-stuffing undone and
+    the end-of-data marker dropped.
+    """
+    assert data.endswith(b"\r\n.\r\n")
+    lines = data[:-len(b".\r\n")].split(b"\r\n")
+    return b"\r\n".join(line[1:] if line.startswith(b".") else line for line in lines)
+
+
+class SendMessageStreamingTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeSMTPServer()
+        self.client = smtplib.SMTP("127.0.0.1", self.server.port, timeout=5)
+        self.sends = []
+        send = self.client.send
+        self.client.send = lambda data: (self.sends.append(data), send(data))[1]
+
+    def tearDown(self):
+        self.client.quit()
+        self.server.close()
+
+    def _send(self, msg):
+        self.sends.clear()
+        stats = send_message_streaming(self.client, msg, "from@example.com", ["to@example.com"])
+        data_chunks = self.sends[self.sends.index("data\r\n") + 1:]
+        return stats, data_chunks, self.server.messages[-1]
+
+    def test_dot_stuffing(self):
+        msg = MIMEText(".leading dot\nmiddle\n..two dots\n.\nend", "plain", "us-ascii")
+        stats, _, received = self._send(msg)
+
+        for line in received.split(b"\r\n")[:-2]:
+            self.assertNotEqual(line, b".", "a lone dot would end the DATA section early")
+        self.assertIn(b"\r\n..leading dot\r\n", received)
+        self.assertIn(b"\r\n...two dots\r\n", received)
+        self.assertIn(b"\r\n..\r\nend", received)
+        self.assertIn(b"\r\n.leading dot\r\n", unstuff(received))
+        self.assertEqual(stats["bytes_sent"], len(received))
+
+    def test_line_endings_are_crlf(self):
+        raw = b"Subject: test\nFrom: a@example.com\r\n\nbare lf\nbare cr\rcrlf\r\nlast line"
+        stats, _, received = self._send(io.BytesIO(raw))
+
+        self.assertNotIn(b"\n", received.replace(b"\r\n", b""))
+        self.assertNotIn(b"\r", received.replace(b"\r\n", b""))
+        self.assertEqual(
+            unstuff(received),
+            b"Subject: test\r\nFrom: a@example.com\r\n\r\nbare lf\r\nbare cr\r\ncrlf\r\nlast line\r\n",
+        )
+
+    def test_mime_message_round_trips(self):
+        msg = MIMEMultipart("mixed")
+        msg["Subject"] = "Digest"
+        msg.attach(MIMEText("Hello\n.\nWorld\n", "plain"))
+        msg.attach(MIMEText("<p>Hello</p>\n.<p>dot</p>", "html"))
+        msg.attach(MIMEApplication(bytes(range(256)) * 300, Name="book.epub"))
+
+        _, _, received = self._send(msg)
+
+        self.assertEqual(unstuff(received), msg.as_bytes(policy=msg.policy.clone(linesep="\r\n")))
+
+    def test_chunking_splits_on_line_boundaries(self):
+        original = smtp_stream.CHUNK_SIZE
+        smtp_stream.CHUNK_SIZE = 100
+        try:
+            raw = b"".join(b".line %d of the message\r\n" % i for i in range(200))
+            stats, chunks, received = self._send(TrickleReader(raw))
+        finally:
+            smtp_stream.CHUNK_SIZE = original
+
+        self.assertGreater(len(chunks), 10, "the message should go out in several chunks")
+        for chunk in chunks:
+            self.assertTrue(chunk.endswith(b"\r\n"), "every chunk ends on a complete line")
+            self.assertLess(len(chunk), 100 + 64, "chunks stay close to CHUNK_SIZE")
+        self.assertEqual(b"".join(chunks), received)
+        self.assertEqual(unstuff(received), raw)
+        self.assertEqual(stats["bytes_sent"], len(received))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+"""
+Tracing: Timed spans around each pipeline stage and each external call.
+A span records what ran (e.g. "gemini.generate_content"), how long it took,
+whether it failed, and a few attributes (video ID, status code, bytes...).
+Spans nest: a Supadata call made during the transcribe stage points to that
+stage's span as its parent, and every span from one run shares a trace ID.
+
+Finished spans are appended to logs/traces.jsonl (one JSON object per line,
+rotated to traces.jsonl.1, .2, ... once it passes TRACE_MAX_BYTES), and each
+run ends with a p50/p95/max latency table per call type.
+
+    with span("supadata.transcript", video_id=video_id) as s:
+        response = requests.get(...)
+        s["attrs"]["status_code"] = response.status_code
+"""
+
+import os
+import json
+import math
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+
+# Where finished spans are written (set TRACING=0 to keep them in memory only)
+TRACE_FILE = os.getenv(
+    "TRACE_FILE", os.path.join(os.path.dirname(__file__), "logs", "traces.jsonl")
+)
+TRACING = os.getenv("TRACING", "1") != "0"
+
+# Rotate the trace file once it grows past this size, keeping this many old ones
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(5 * 1024 * 1024)))
+TRACE_BACKUPS = 3
+
+# The span currently running in this thread / task
+_current = contextvars.ContextVar("current_span", default=None)
+
+# Spans finished in this process
+_finished = []
+_lock = threading.Lock()
+_trace_file = None
+
+
+def _rotate():
+    """
+    traces.jsonl → traces.jsonl.1 → .2 ..., dropping the oldest.
+    """
+    for i in range(TRACE_BACKUPS - 1, 0, -1):
+        if os.path.exists(f"{TRACE_FILE}.{i}"):
+            os.replace(f"{TRACE_FILE}.{i}", f"{TRACE_FILE}.{i + 1}")
+    if TRACE_BACKUPS:
+        os.replace(TRACE_FILE, f"{TRACE_FILE}.1")
+    else:
+        os.remove(TRACE_FILE)
+
+
+def _export(record):
+    global _trace_file
+    if not TRACING:
+        return
+    if _trace_file is None:
+        os.makedirs(os.path.dirname(TRACE_FILE), exist_ok=True)
+        _trace_file = open(TRACE_FILE, "a")
+    if _trace_file.tell() >= TRACE_MAX_BYTES:
+        _trace_file.close()
+        _rotate()
+        _trace_file = open(TRACE_FILE, "a")
+    _trace_file.write(json.dumps(record, default=str) + "\n")
+    _trace_file.flush()
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Time a block of work. Yields the span dict; add attributes with
+    s["attrs"][key] = value. Exceptions are recorded and re-raised.
+    """
+    parent = _current.get()
+    record = {
+        "name": name,
+        "trace_id": parent["trace_id"] if parent else uuid.uuid4().hex,
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_id": parent["span_id"] if parent else None,
+        "start": datetime.now().isoformat(),
+        "attrs": attrs,
+        "status": "ok",
+    }
+    token = _current.set(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["status"] = "error"
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record["seconds"] = time.perf_counter() - started
+        _current.reset(token)
+        with _lock:
+            _finished.append(record)
+            _export(record)
+
+
+def current_trace_id():
+    """
+    Trace ID of the span running right now (None outside any span).
+    """
+    record = _current.get()
+    return record["trace_id"] if record else None
+
+
+def run_in_context(fn):
+    """
+    Wrap fn so it runs inside the caller's current span when called from
+    another thread (threads don't inherit the current span on their own).
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+
+def finished_spans(trace_id=None):
+    """
+    Spans finished in this process, optionally just those from one trace.
+    """
+    with _lock:
+        return [s for s in _finished if trace_id is None or s["trace_id"] == trace_id]
+
+
+def forget_trace(trace_id):
+    """
+    Drop a finished trace's spans from memory (they're already in the trace
+    file). Long-running processes call this once they're done with a run.
+    """
+    with _lock:
+        _finished[:] = [s for s in _finished if s["trace_id"] != trace_id]
+
+
+def _percentile(values, pct):
+    # Nearest-rank percentile of an already sorted list
+    return values[max(0, math.ceil(pct / 100 * len(values)) - 1)]
+
+
+def latency_summary(spans):
+    """
+    Count, errors and p50/p95/max seconds per span name.
+    """
+    by_name = {}
+    for s in spans:
+        by_name.setdefault(s["name"], []).append(s)
+
+    summary = {}
+    for name, group in sorted(by_name.items()):
+        seconds = sorted(s["seconds"] for s in group)
+        summary[name] = {
+            "count": len(group),
+            "errors": sum(1 for s in group if s["status"] == "error"),
+            "p50": _percentile(seconds, 50),
+            "p95": _percentile(seconds, 95),
+            "max": seconds[-1],
+        }
+    return summary
+
+
+def print_latency_summary(trace_id=None):
+    """
+    Print the latency table for a run.
+    """
+    summary = latency_summary(finished_spans(trace_id))
+    if not summary:
+        return
+
+    print("\n⏱ Latency by call (seconds)")
+    print(f"  {'call':<28} {'count':>5} {'err':>4} {'p50':>7} {'p95':>7} {'max':>7}")
+    for name, row in summary.items():
+        print(f"  {name:<28} {row['count']:>5} {row['errors']:>4} "
+              f"{row['p50']:>7.2f} {row['p95']:>7.2f} {row['max']:>7.2f}")
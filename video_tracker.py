@@ -1,53 +1,292 @@
 """
 Video Tracker: Keeps track of which videos have already been processed.
 This prevents sending duplicate articles for the same video.
+
+Processed videos live in a small SQLite database (WAL mode, indexed by video ID),
+so checking or marking a whole batch of videos is a single query/transaction
+instead of re-reading and rewriting one big JSON file per video.
+
+Set TRACKER_BACKEND=journal to keep plain files instead (handy as a CI artifact):
+processed_videos.json is a snapshot, new marks are appended to a journal file,
+and the journal is folded back into the snapshot in the background once it grows.
 """
 
 import os
 import json
+import sqlite3
+import threading
+from contextlib import closing
 from datetime import datetime
+from run_lock import file_lock
+
+# Database of processed video IDs
+TRACKER_DB = os.path.join(os.path.dirname(__file__), "processed_videos.db")
 
-# File to store processed video IDs
+# Old JSON tracker - imported into the database once, then left alone
+# (in journal mode, this is the snapshot file)
 TRACKER_FILE = os.path.join(os.path.dirname(__file__), "processed_videos.json")
 
+# "sqlite" (default) or "journal" (plain snapshot + append-only journal files)
+TRACKER_BACKEND = os.getenv("TRACKER_BACKEND", "sqlite")
+
+# Journal mode: marks since the last snapshot, one JSON object per line
+JOURNAL_FILE = os.path.join(os.path.dirname(__file__), "processed_videos.journal.jsonl")
+
+# Journal being folded into the snapshot right now
+COMPACTING_FILE = f"{JOURNAL_FILE}.compacting"
+
+# Guards the journal files against other processes (the dashboard, a second run)
+JOURNAL_LOCK_FILE = f"{JOURNAL_FILE}.lock"
+
+# Compact the journal once it grows past this size
+JOURNAL_COMPACT_BYTES = int(os.getenv("JOURNAL_COMPACT_BYTES", str(256 * 1024)))
+
+# SQLite limits how many ? placeholders one query can have
+_BATCH_SIZE = 500
+
+
+def _connect():
+    """
+    Open the tracker database, creating it (and importing the old JSON file) if needed.
+    """
+    conn = sqlite3.connect(TRACKER_DB, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    with conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS videos (
+                video_id TEXT PRIMARY KEY,
+                title TEXT,
+                channel TEXT,
+                processed_at TEXT
+            )
+        """)
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    imported = conn.execute("SELECT value FROM meta WHERE key = 'json_imported'").fetchone()
+    if not imported:
+        import_json_tracker(conn)
+
+    return conn
+
+
+def import_json_tracker(conn, path=None):
+    """
+    One-time import of the old processed_videos.json into the database.
+    """
+    path = path or TRACKER_FILE
+    count = 0
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            data = json.load(f)
+        rows = [
+            (video_id, info.get("title"), info.get("channel"), info.get("processed_at"))
+            for video_id, info in data.get("videos", {}).items()
+        ]
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO videos VALUES (?, ?, ?, ?)", rows)
+        count = len(rows)
+
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO meta VALUES ('json_imported', ?)",
+            (datetime.now().isoformat(),)
+        )
+
+    if count:
+        print(f"  ✓ Imported {count} processed videos from {os.path.basename(path)}")
+
+
+# ----------------------------------------
+# Journal backend
+# ----------------------------------------
+
+_journal_lock = threading.Lock()
+_compaction_thread = None
+
+
+def _read_journal(path, videos):
+    """
+    Replay a journal file into the videos dict. A torn last line
+    (from a crash mid-append) is ignored.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            videos[entry.pop("video_id")] = entry
+
+
+def _read_snapshot():
+    if not os.path.exists(TRACKER_FILE):
+        return {}
+    with open(TRACKER_FILE, "r") as f:
+        return json.load(f).get("videos", {})
+
+
+def _journal_load():
+    """
+    Snapshot + any journal being compacted + the live journal.
+    """
+    with _journal_lock, file_lock(JOURNAL_LOCK_FILE, shared=True):
+        videos = _read_snapshot()
+        _read_journal(COMPACTING_FILE, videos)
+        _read_journal(JOURNAL_FILE, videos)
+    return {"videos": videos}
+
+
+def _journal_append(rows):
+    """
+    Append marks to the journal and fsync, so they survive a crash.
+    """
+    lines = "".join(
+        json.dumps({"video_id": video_id, "title": title, "channel": channel, "processed_at": processed_at}) + "\n"
+        for video_id, title, channel, processed_at in rows
+    )
+
+    with _journal_lock, file_lock(JOURNAL_LOCK_FILE):
+        with open(JOURNAL_FILE, "a+b") as f:
+            # Start on a fresh line if a crash left a torn line behind
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    lines = "\n" + lines
+            f.write(lines.encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        journal_size = os.path.getsize(JOURNAL_FILE)
+
+    if journal_size > JOURNAL_COMPACT_BYTES:
+        _start_compaction()
+
+
+def _write_snapshot(data):
+    """
+    Replace the snapshot atomically - a crash leaves either the old or the new
+    file, never a half-written one.
+    """
+    tmp_path = f"{TRACKER_FILE}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, TRACKER_FILE)
+
+
+def compact_journal():
+    """
+    Fold the journal into the snapshot.
+
+    The journal is first renamed aside, then merged into a new snapshot that
+    atomically replaces the old one. Every step is safe to crash in: loading
+    always replays whatever journal files still exist on top of the snapshot.
+    """
+    with _journal_lock, file_lock(JOURNAL_LOCK_FILE):
+        if not os.path.exists(COMPACTING_FILE):
+            if not os.path.exists(JOURNAL_FILE):
+                return
+            os.replace(JOURNAL_FILE, COMPACTING_FILE)
+
+        videos = _read_snapshot()
+        _read_journal(COMPACTING_FILE, videos)
+        _write_snapshot({"videos": videos})
+        os.remove(COMPACTING_FILE)
+
+
+def _start_compaction():
+    global _compaction_thread
+    with _journal_lock:
+        if _compaction_thread and _compaction_thread.is_alive():
+            return
+        # Not a daemon thread, so the process waits for it before exiting
+        _compaction_thread = threading.Thread(target=compact_journal, name="tracker-compaction")
+        _compaction_thread.start()
+
+
+def wait_for_compaction():
+    """
+    Block until any background compaction has finished.
+    """
+    if _compaction_thread:
+        _compaction_thread.join()
+
+
+# ----------------------------------------
+# Public API (works with either backend)
+# ----------------------------------------
 
 def load_processed_videos():
     """
-    Load the list of already-processed video IDs from file.
+    Load all processed videos, in the same shape as the old JSON file.
     """
-    if os.path.exists(TRACKER_FILE):
-        with open(TRACKER_FILE, "r") as f:
-            return json.load(f)
-    return {"videos": {}}
+    if TRACKER_BACKEND == "journal":
+        return _journal_load()
+
+    with closing(_connect()) as conn:
+        rows = conn.execute("SELECT video_id, title, channel, processed_at FROM videos").fetchall()
+
+    return {
+        "videos": {
+            video_id: {"title": title, "channel": channel, "processed_at": processed_at}
+            for video_id, title, channel, processed_at in rows
+        }
+    }
 
 
 def save_processed_videos(data):
     """
-    Save the processed videos list to file.
+    Save processed videos (in the old JSON shape) to the database.
     """
-    with open(TRACKER_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+    rows = [
+        (video_id, info["title"], info["channel"], info["processed_at"])
+        for video_id, info in data["videos"].items()
+    ]
+    if TRACKER_BACKEND == "journal":
+        _journal_append(rows)
+        return
+
+    with closing(_connect()) as conn, conn:
+        conn.executemany("INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?)", rows)
+
+
+def get_processed_ids(video_ids):
+    """
+    Check a batch of video IDs at once. Returns the set that were already processed.
+    """
+    video_ids = list(video_ids)
+    if TRACKER_BACKEND == "journal":
+        return set(video_ids) & _journal_load()["videos"].keys()
+
+    processed = set()
+
+    with closing(_connect()) as conn:
+        for i in range(0, len(video_ids), _BATCH_SIZE):
+            batch = video_ids[i:i + _BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT video_id FROM videos WHERE video_id IN ({placeholders})", batch
+            )
+            processed.update(row[0] for row in rows)
+
+    return processed
 
 
 def is_video_processed(video_id):
     """
     Check if a video has already been processed.
     """
-    data = load_processed_videos()
-    return video_id in data["videos"]
+    return video_id in get_processed_ids([video_id])
 
 
 def mark_video_processed(video_id, title, channel):
     """
     Mark a video as processed so we don't send it again.
     """
-    data = load_processed_videos()
-    data["videos"][video_id] = {
-        "title": title,
-        "channel": channel,
-        "processed_at": datetime.now().isoformat()
-    }
-    save_processed_videos(data)
+    mark_videos_processed([{"video_id": video_id, "title": title, "channel": channel}])
 
 
 def filter_new_videos(videos):
@@ -55,10 +294,11 @@ def filter_new_videos(videos):
     Filter out videos that have already been processed.
     Returns only new videos.
     """
+    processed = get_processed_ids(v["video_id"] for v in videos)
     new_videos = []
 
     for video in videos:
-        if is_video_processed(video["video_id"]):
+        if video["video_id"] in processed:
             print(f"  ⏭ Skipping (already processed): {video['title'][:50]}...")
         else:
             new_videos.append(video)
@@ -69,17 +309,27 @@ def filter_new_videos(videos):
 def mark_videos_processed(videos):
     """
     Mark multiple videos as processed after successfully sending newsletter.
+    All videos are written in a single transaction (or a single journal append).
     """
-    for video in videos:
-        mark_video_processed(video["video_id"], video["title"], video["channel"])
+    now = datetime.now().isoformat()
+    rows = [(v["video_id"], v["title"], v["channel"], now) for v in videos]
+    if TRACKER_BACKEND == "journal":
+        _journal_append(rows)
+        return
+
+    with closing(_connect()) as conn, conn:
+        conn.executemany("INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?)", rows)
 
 
 def get_processed_count():
     """
     Get the total number of videos we've processed.
     """
-    data = load_processed_videos()
-    return len(data["videos"])
+    if TRACKER_BACKEND == "journal":
+        return len(_journal_load()["videos"])
+
+    with closing(_connect()) as conn:
+        return conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
 
 
 # Utility to view/manage processed videos
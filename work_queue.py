@@ -0,0 +1,478 @@
+"""
+Work Queue: Spread the per-video work over several worker processes.
+Transcribing, writing and rendering each video become jobs in a small SQLite
+queue. Any number of worker processes on this machine lease jobs, run them and
+hand the result on to the next stage:
+
+    transcribe:<video_id> → write:<video_id> → render:<video_id>
+
+- Leases: a worker owns a job only until its lease expires (it keeps renewing
+  it while working). If the worker dies, the job goes back to the queue.
+- Retries: a failed job is retried with exponential backoff, up to
+  MAX_ATTEMPTS times, then left as "failed" (see `retry`).
+- Idempotency keys: each job has a unique key, so enqueuing the same video
+  twice - or a worker finishing a job someone else already took over - never
+  produces a second job.
+- Runs: workers share the pipeline lock, so they pause while main.py runs
+  (it works on the same videos), and main.py won't start while a job is running.
+
+Usage:
+    python work_queue.py enqueue            # discover new videos, queue them
+    python work_queue.py work [--kinds write] [--wait]   # run a worker (start several)
+    python work_queue.py status
+    python work_queue.py retry              # give failed jobs another go
+    python main.py                          # collects the results, dedupes and sends
+
+Set WORK_QUEUE_DB to move the queue file. It must stay on a local disk: the
+queue uses SQLite's WAL mode, which doesn't work over a network filesystem, so
+all workers have to run on the same host.
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import argparse
+import threading
+from contextlib import closing
+from datetime import datetime, timedelta
+
+from env import load_env
+
+# Before the imports below, which read their settings from the environment
+load_env()
+
+from stage_store import load_record, reached, save_stage
+from run_lock import worker_lock
+from tracing import span, forget_trace
+
+# The queue database
+QUEUE_DB = os.getenv(
+    "WORK_QUEUE_DB", os.path.join(os.path.dirname(__file__), ".cache", "work_queue.db")
+)
+
+# How long a worker owns a job before someone else may take it over
+# (renewed every LEASE_SECONDS / 3 while the job runs)
+LEASE_SECONDS = int(os.getenv("WORK_QUEUE_LEASE_SECONDS", "300"))
+
+# Attempts per job, and the wait before the first retry (doubled each time)
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF_SECONDS = 30
+
+# How often an idle worker checks for new jobs
+POLL_SECONDS = 5
+
+JOB_KINDS = ["transcribe", "write", "render"]
+
+# Collected jobs are kept this long (so re-enqueuing a video is still a no-op), then deleted
+COLLECTED_RETENTION_DAYS = 30
+
+
+def _connect():
+    """
+    Open the queue database, creating it if needed.
+    """
+    os.makedirs(os.path.dirname(QUEUE_DB), exist_ok=True)
+    conn = sqlite3.connect(QUEUE_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    with conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                key TEXT UNIQUE NOT NULL,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                lease_owner TEXT,
+                lease_token TEXT,
+                lease_expires REAL,
+                result TEXT,
+                error TEXT,
+                created_at TEXT,
+                updated_at TEXT
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (state, kind, available_at)")
+    return conn
+
+
+def _job(row):
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def _insert(conn, kind, key, payload):
+    now = datetime.now().isoformat()
+    cursor = conn.execute(
+        "INSERT OR IGNORE INTO jobs (key, kind, payload, available_at, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (key, kind, json.dumps(payload, ensure_ascii=False), time.time(), now, now),
+    )
+    return cursor.rowcount == 1
+
+
+def enqueue_job(kind, key, payload):
+    """
+    Add a job unless one with the same key already exists.
+    Returns True if it was added.
+    """
+    with closing(_connect()) as conn, conn:
+        return _insert(conn, kind, key, payload)
+
+
+def lease_job(worker_id, kinds=JOB_KINDS):
+    """
+    Take the next ready job of one of the given kinds, or None if there isn't one.
+    Jobs whose lease ran out are taken over (or failed, if out of attempts).
+    """
+    now = time.time()
+    token = uuid.uuid4().hex
+    placeholders = ",".join("?" * len(kinds))
+
+    with closing(_connect()) as conn:
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET state = 'failed', error = 'lease expired', lease_token = NULL "
+                "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, MAX_ATTEMPTS),
+            )
+            # One statement, so two workers can never take the same job
+            conn.execute(f"""
+                UPDATE jobs
+                SET state = 'leased', lease_owner = ?, lease_token = ?, lease_expires = ?,
+                    attempts = attempts + 1, updated_at = ?
+                WHERE id = (
+                    SELECT id FROM jobs
+                    WHERE kind IN ({placeholders})
+                      AND ((state = 'queued' AND available_at <= ?)
+                           OR (state = 'leased' AND lease_expires < ?))
+                    ORDER BY available_at, id
+                    LIMIT 1
+                )
+            """, (worker_id, token, now + LEASE_SECONDS, datetime.now().isoformat(), *kinds, now, now))
+        row = conn.execute("SELECT * FROM jobs WHERE lease_token = ?", (token,)).fetchone()
+
+    return _job(row) if row else None
+
+
+def renew_lease(job):
+    """
+    Extend a job's lease. Returns False if the job was taken over meanwhile.
+    """
+    with closing(_connect()) as conn, conn:
+        cursor = conn.execute(
+            "UPDATE jobs SET lease_expires = ? WHERE id = ? AND lease_token = ? AND state = 'leased'",
+            (time.time() + LEASE_SECONDS, job["id"], job["lease_token"]),
+        )
+        return cursor.rowcount == 1
+
+
+def complete_job(job, result, next_jobs=()):
+    """
+    Mark a job done and queue its follow-up jobs, in one transaction.
+    Returns False (and changes nothing) if the job was taken over meanwhile.
+    """
+    with closing(_connect()) as conn, conn:
+        cursor = conn.execute(
+            "UPDATE jobs SET state = 'done', result = ?, error = NULL, lease_token = NULL, updated_at = ? "
+            "WHERE id = ? AND lease_token = ? AND state = 'leased'",
+            (json.dumps(result, ensure_ascii=False), datetime.now().isoformat(),
+             job["id"], job["lease_token"]),
+        )
+        if cursor.rowcount != 1:
+            return False
+        for kind, key, payload in next_jobs:
+            _insert(conn, kind, key, payload)
+        return True
+
+
+def fail_job(job, error):
+    """
+    Record a failed attempt: retry later with backoff, or give up after MAX_ATTEMPTS.
+    """
+    gave_up = job["attempts"] >= MAX_ATTEMPTS
+    retry_at = time.time() + RETRY_BACKOFF_SECONDS * 2 ** (job["attempts"] - 1)
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "UPDATE jobs SET state = ?, available_at = ?, error = ?, lease_token = NULL, updated_at = ? "
+            "WHERE id = ? AND lease_token = ? AND state = 'leased'",
+            ("failed" if gave_up else "queued", retry_at, error, datetime.now().isoformat(),
+             job["id"], job["lease_token"]),
+        )
+    return not gave_up
+
+
+def retry_failed():
+    """
+    Put every failed job back in the queue with fresh attempts.
+    """
+    with closing(_connect()) as conn, conn:
+        return conn.execute(
+            "UPDATE jobs SET state = 'queued', attempts = 0, available_at = ?, updated_at = ? "
+            "WHERE state = 'failed'",
+            (time.time(), datetime.now().isoformat()),
+        ).rowcount
+
+
+def job_counts():
+    """
+    {kind: {state: count}}
+    """
+    with closing(_connect()) as conn:
+        rows = conn.execute("SELECT kind, state, COUNT(*) FROM jobs GROUP BY kind, state").fetchall()
+    counts = {}
+    for kind, state, count in rows:
+        counts.setdefault(kind, {})[state] = count
+    return counts
+
+
+def finished_stages():
+    """
+    {video_id: stage} for transcribe/write jobs that are done but not collected
+    yet - what the next collect_results() will add to the stage store.
+    Opens the queue read-only (e.g. for main.py --explain).
+    """
+    if not os.path.exists(QUEUE_DB):
+        return {}
+    with closing(sqlite3.connect(f"file:{QUEUE_DB}?mode=ro", uri=True, timeout=30)) as conn:
+        rows = conn.execute(
+            "SELECT kind, payload FROM jobs WHERE state = 'done' AND kind IN ('transcribe', 'write')"
+        ).fetchall()
+
+    stages = {}
+    for kind, payload in rows:
+        video_id = json.loads(payload)["video_id"]
+        if kind == "write" or video_id not in stages:
+            stages[video_id] = "transcribed" if kind == "transcribe" else "written"
+    return stages
+
+
+def _unfinished_jobs():
+    with closing(_connect()) as conn:
+        return conn.execute("SELECT COUNT(*) FROM jobs WHERE state IN ('queued', 'leased')").fetchone()[0]
+
+
+# ----------------------------------------
+# Jobs
+# ----------------------------------------
+
+def _transcribe(video):
+    from get_transcripts import get_transcript, REQUEST_DELAY
+
+    transcript = get_transcript(video["video_id"])
+    # Be as nice to the API as the single-process run is
+    time.sleep(REQUEST_DELAY)
+    if not transcript:
+        raise RuntimeError("no transcript")
+
+    video = {**video, "transcript": transcript}
+    return video, [("write", f"write:{video['video_id']}", video)]
+
+
+def _write(video):
+    from write_articles import write_article, article_for_video
+
+    text = write_article(video)
+    if not text:
+        raise RuntimeError("article generation failed")
+
+    article = article_for_video(video, text)
+    return article, [("render", f"render:{video['video_id']}", article)]
+
+
+def _render(article):
+    from render_cache import render_article
+
+    return render_article(article), []
+
+
+JOB_HANDLERS = {
+    "transcribe": _transcribe,
+    "write": _write,
+    "render": _render,
+}
+
+
+def _keep_lease(job, stop):
+    while not stop.wait(LEASE_SECONDS / 3):
+        if not renew_lease(job):
+            return
+
+
+def run_job(job):
+    """
+    Run one leased job and record the outcome. Returns True if it succeeded.
+    """
+    stop = threading.Event()
+    threading.Thread(target=_keep_lease, args=(job, stop), daemon=True).start()
+    try:
+        with span(f"job.{job['kind']}", key=job["key"], attempt=job["attempts"]) as s:
+            result, next_jobs = JOB_HANDLERS[job["kind"]](job["payload"])
+    except Exception as e:
+        retrying = fail_job(job, f"{type(e).__name__}: {e}")
+        print(f"  ✗ {job['key']} (attempt {job['attempts']}/{MAX_ATTEMPTS}): {e}"
+              f"{' - will retry' if retrying else ' - giving up'}")
+        return False
+    finally:
+        stop.set()
+        forget_trace(s["trace_id"])
+
+    if complete_job(job, result, next_jobs):
+        print(f"  ✓ {job['key']}")
+    else:
+        print(f"  ⚠ {job['key']} was taken over by another worker; result dropped")
+    return True
+
+
+def work(worker_id=None, kinds=JOB_KINDS, wait=False):
+    """
+    Run jobs until the queue is empty (or forever, with wait=True).
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    print(f"👷 Worker {worker_id} ({', '.join(kinds)})\n")
+    done = failed = 0
+
+    paused = False
+    while True:
+        # A pipeline run works on the same videos itself, so wait for it to finish
+        try:
+            with worker_lock():
+                paused = False
+                job = lease_job(worker_id, kinds)
+                succeeded = run_job(job) if job else None
+        except BlockingIOError:
+            if not paused:
+                print("  ⏸ A pipeline run is in progress - waiting for it to finish")
+                paused = True
+            time.sleep(POLL_SECONDS)
+            continue
+
+        if job is None:
+            # Other workers may still produce jobs for us
+            if not wait and _unfinished_jobs() == 0:
+                break
+            time.sleep(POLL_SECONDS)
+            continue
+        if succeeded:
+            done += 1
+        else:
+            failed += 1
+
+    print(f"\n✓ Queue empty: {done} job(s) done, {failed} failed attempt(s)")
+    return done
+
+
+# ----------------------------------------
+# Filling and emptying the queue
+# ----------------------------------------
+
+def enqueue_new_videos():
+    """
+    Discover new videos and queue a job for the first stage each one still needs.
+    """
+    from get_videos import main as fetch_videos
+    from video_tracker import filter_new_videos
+
+    new_videos = filter_new_videos(fetch_videos())
+    added = 0
+    for video in new_videos:
+        record = load_record(video["video_id"])
+        if record is None:
+            save_stage(video, "discovered")
+        if reached(record, "written"):
+            continue
+        if reached(record, "transcribed"):
+            added += enqueue_job("write", f"write:{video['video_id']}", record["video"])
+        else:
+            added += enqueue_job("transcribe", f"transcribe:{video['video_id']}", video)
+
+    print(f"\n✓ Queued {added} new job(s) for {len(new_videos)} new video(s)")
+    return added
+
+
+def collect_results():
+    """
+    Move finished transcripts, articles and renders from the queue into the
+    stage store and render cache, where the next main.py run picks them up.
+    Each job is collected once: it's marked "collected" in the same transaction,
+    and collected jobs are deleted after COLLECTED_RETENTION_DAYS.
+    """
+    if not os.path.exists(QUEUE_DB):
+        return 0
+
+    from render_cache import fragment_key, save_fragment
+    from video_tracker import get_processed_ids
+
+    collected = 0
+    with closing(_connect()) as conn, conn:
+        # Take the write lock first, so two collectors never pick up the same jobs
+        conn.execute("BEGIN IMMEDIATE")
+        jobs = [_job(row) for row in conn.execute(
+            "SELECT * FROM jobs WHERE state = 'done' ORDER BY id"
+        ).fetchall()]
+        processed = get_processed_ids(job["payload"]["video_id"] for job in jobs)
+
+        for job in jobs:
+            if job["payload"]["video_id"] in processed:
+                continue
+            if job["kind"] == "render":
+                save_fragment(fragment_key(job["payload"]), job["result"])
+                continue
+            video = job["result"] if job["kind"] == "transcribe" else job["payload"]
+            stage = "transcribed" if job["kind"] == "transcribe" else "written"
+            # Never move a video backwards
+            if not reached(load_record(video["video_id"]), stage):
+                save_stage(video, stage, job["result"] if stage == "written" else None)
+                collected += 1
+
+        # Keep the keys (so the same job isn't queued again) but not the results
+        now = datetime.now()
+        conn.executemany(
+            "UPDATE jobs SET state = 'collected', result = NULL, updated_at = ? WHERE id = ?",
+            [(now.isoformat(), job["id"]) for job in jobs],
+        )
+        conn.execute(
+            "DELETE FROM jobs WHERE state = 'collected' AND updated_at < ?",
+            ((now - timedelta(days=COLLECTED_RETENTION_DAYS)).isoformat(),),
+        )
+
+    return collected
+
+
+def print_status():
+    counts = job_counts()
+    states = ["queued", "leased", "done", "failed", "collected"]
+    print(f"{'kind':<12}" + "".join(f"{s:>10}" for s in states))
+    for kind in JOB_KINDS:
+        row = counts.get(kind, {})
+        print(f"{kind:<12}" + "".join(f"{row.get(s, 0):>10}" for s in states))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Work queue for transcribe/write/render jobs")
+    parser.add_argument("command", choices=["enqueue", "work", "status", "retry", "collect"])
+    parser.add_argument("--kinds", nargs="+", choices=JOB_KINDS, default=JOB_KINDS,
+                        help="job kinds this worker takes")
+    parser.add_argument("--id", help="worker name (default: host:pid)")
+    parser.add_argument("--wait", action="store_true",
+                        help="keep polling for new jobs instead of exiting when the queue is empty")
+    args = parser.parse_args()
+
+    if args.command == "enqueue":
+        enqueue_new_videos()
+    elif args.command == "work":
+        work(args.id, args.kinds, args.wait)
+    elif args.command == "retry":
+        print(f"↻ {retry_failed()} failed job(s) queued again")
+    elif args.command == "collect":
+        print(f"✓ Collected {collect_results()} result(s)")
+    else:
+        print_status()
@@ -4,21 +4,24 @@ Takes raw video transcripts and turns them into polished, readable articles.
 """
 
 import os
-from google import genai
-from dotenv import load_dotenv
+from env import load_env
+from tracing import span
+from dedupe_videos import credit_channels
+import cassette
 
 # Load your API key
-load_dotenv()
+load_env()
 
-# Lazy client — only created when actually needed
+# Lazy client — only created when actually needed, then reused
 _client = None
 
-def _get_client():
+def get_gemini_client():
     global _client
     if _client is None:
         api_key = os.getenv("GEMINI_API_KEY")
         if not api_key:
             raise RuntimeError("GEMINI_API_KEY environment variable is not set")
+        from google import genai  # slow to import, so only when needed
         _client = genai.Client(api_key=api_key)
     return _client
 
@@ -53,10 +56,19 @@ Remix this YouTube transcript into a magazine article. Guidelines:
 Format the article in clean markdown."""
 
     try:
-        response = _get_client().models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
-        )
+        with span("gemini.generate_content", model="gemini-2.5-flash",
+                  video_id=video.get("video_id"), prompt_chars=len(prompt)) as s:
+            response = cassette.exchange(
+                "gemini.generate_content",
+                {"model": "gemini-2.5-flash", "prompt": cassette.prompt_digest(prompt)},
+                lambda: get_gemini_client().models.generate_content(
+                    model="gemini-2.5-flash",
+                    contents=prompt,
+                ),
+                encode=cassette.encode_text_response,
+                decode=cassette.decode_text_response,
+            )
+            s["attrs"]["response_chars"] = len(response.text or "")
 
         return response.text
 
@@ -65,9 +77,23 @@ Format the article in clean markdown."""
         return None
 
 
-def write_articles_for_videos(videos):
+def article_for_video(video, article):
+    """
+    Package a written article with the details of the video it came from.
+    """
+    return credit_channels({
+        "video_id": video["video_id"],
+        "title": video["title"],
+        "url": video["url"],
+        "article": article
+    }, video)
+
+
+def write_articles_for_videos(videos, on_article=None, should_continue=None):
     """
     Generate articles for all videos with transcripts.
+    If given, on_article(video, article) is called as soon as each article is written,
+    and videos for which should_continue(video) returns False are skipped.
     """
     print("\nGenerating articles with Gemini AI...\n")
     print("=" * 60)
@@ -75,18 +101,18 @@ def write_articles_for_videos(videos):
     articles = []
 
     for video in videos:
+        if should_continue and not should_continue(video):
+            continue
+
         print(f"Writing article: {video['title'][:50]}...")
 
         article = write_article(video)
 
         if article:
-            articles.append({
-                "title": video["title"],
-                "channel": video["channel"],
-                "url": video["url"],
-                "article": article
-            })
+            articles.append(article_for_video(video, article))
             print(f"  ✓ Article generated!\n")
+            if on_article:
+                on_article(video, articles[-1])
         else:
             print(f"  ✗ Failed to generate article\n")
 